@@ -1,11 +1,16 @@
-import requests
 import json
 import pandas as pd
-import time
 import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import http_cache
+import http_client
+import instrument
+from endpoints import PRIDE_API_BASE
 
 # Configuration
-PRIDE_API_BASE = "https://www.ebi.ac.uk/pride/ws/archive/v2"
 OUTPUT_FILE = "pride_scout_results.csv"
 
 # Keywords - Search one by one to ensure hits
@@ -15,83 +20,112 @@ REQUIRED_SOFTWARE = ["MaxQuant", "maxquant"]
 BLOOD_KEYWORDS = ["plasma", "serum", "blood", "circulating"]
 CELL_KEYWORDS = ["cell line", "cell culture", "supernatant", "in vitro", "conditioned media"]
 
-def search_pride_projects(keyword, page_size=100):
-    """Search PRIDE projects with a single keyword."""
-    url = f"{PRIDE_API_BASE}/search/projects"
-    params = {
-        "keyword": keyword,
-        "pageSize": page_size,
-        "page": 0
-    }
+# Async scout settings
+MAX_CONCURRENCY = 8        # Requests in flight at once (the rate comes from rate_limit.py)
+PAGE_WINDOW = 4            # Search pages fetched ahead per keyword
+REQUEST_TIMEOUT = 60
+
+class RequestLimiter:
+    """
+    Concurrency cap shared by every scout request; pacing is rate_limit's
+    PRIDE bucket. Requests share one HTTP/2 connection when httpx is
+    installed, else run as blocking calls on the pooled session in threads.
+    """
+    def __init__(self, concurrency=MAX_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.client = http_client.async_client()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def get(self, url, params=None):
+        """Send a request once a slot is free (it waits for a token there)."""
+        # Cache hits cost neither a slot nor a token
+        cached = http_cache.lookup(url, params)
+        if cached is not None:
+            return cached
+        async with self.semaphore:
+            if self.client is not None:
+                return await http_cache.aget(self.client, url, params=params, timeout=REQUEST_TIMEOUT)
+            loop = asyncio.get_running_loop()
+            # Carry the task's context (instrument's accession tag) into the pool thread
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(
+                self.executor, partial(context.run, http_cache.get, url, params=params, timeout=REQUEST_TIMEOUT)
+            )
+
+    async def close(self):
+        self.executor.shutdown()
+        if self.client is not None:
+            await self.client.aclose()
+
+def classify_project_files(files):
+    """Decide whether a PRIDE file listing contains processed result tables."""
+    has_results = False
+    file_names = []
     
-    all_projects = []
-    while True:
-        print(f"Fetching page {params['page']} for keyword '{keyword}'...")
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+    for f in files:
+        fname = f.get("fileName", "")
+        file_names.append(fname)
+        lower_name = fname.lower()
+        
+        # Skip raw files
+        if lower_name.endswith(".raw"):
+            continue
             
-            # The API returns a direct list of projects
-            projects = data
+        # Strict check for MaxQuant first
+        if "proteingroups.txt" in lower_name:
+            has_results = True
+        # Broader check for other result tables
+        elif lower_name.endswith(".xlsx") or lower_name.endswith(".xls") or lower_name.endswith(".csv") or lower_name.endswith(".tsv"):
+             # Avoid metadata/methods files if possible
+             if "metadata" not in lower_name and "method" not in lower_name:
+                 has_results = True
+        elif lower_name.endswith(".txt") and ("result" in lower_name or "quant" in lower_name or "protein" in lower_name):
+             has_results = True
             
+    return has_results, file_names
+
+async def fetch_search_page(keyword, page, page_size, limiter):
+    """Fetch one search page. Returns a list of projects, or None on error."""
+    url = f"{PRIDE_API_BASE}/search/projects"
+    params = {"keyword": keyword, "pageSize": page_size, "page": page}
+    print(f"Fetching page {page} for keyword '{keyword}'...")
+    try:
+        response = await limiter.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        print(f"Error fetching projects: {e}")
+        return None
+
+async def search_pride_projects_async(keyword, limiter, page_size=100):
+    """Search one keyword, fetching PAGE_WINDOW pages at a time until a short page."""
+    all_projects = []
+    page = 0
+    while True:
+        pages = await asyncio.gather(*[
+            fetch_search_page(keyword, p, page_size, limiter)
+            for p in range(page, page + PAGE_WINDOW)
+        ])
+        for projects in pages:
             if not projects:
-                break
-                
+                return all_projects
             all_projects.extend(projects)
-            
-            # Pagination check
             if len(projects) < page_size:
-                break
-                
-            params["page"] += 1
-            time.sleep(0.5) # Respect API rate limits
-            
-        except Exception as e:
-            print(f"Error fetching projects: {e}")
-            break
-            
-    return all_projects
+                return all_projects
+        page += PAGE_WINDOW
 
-def check_project_files(project_accession):
+async def check_project_files_async(project_accession, limiter):
     """Check if project has processed result files (proteinGroups, Excel, CSV)."""
     url = f"{PRIDE_API_BASE}/projects/{project_accession}/files"
-    
-    try:
-        response = requests.get(url)
-        # response.raise_for_status() # PRIDE sometimes returns 200 even if empty or 404 if no files
-        if response.status_code != 200:
-             return False, []
-             
-        files = response.json()
-        
-        has_results = False
-        file_names = []
-        
-        for f in files:
-            fname = f.get("fileName", "")
-            file_names.append(fname)
-            lower_name = fname.lower()
-            
-            # Skip raw files
-            if lower_name.endswith(".raw"):
-                continue
-                
-            # Strict check for MaxQuant first
-            if "proteingroups.txt" in lower_name:
-                has_results = True
-            # Broader check for other result tables
-            elif lower_name.endswith(".xlsx") or lower_name.endswith(".xls") or lower_name.endswith(".csv") or lower_name.endswith(".tsv"):
-                 # Avoid metadata/methods files if possible
-                 if "metadata" not in lower_name and "method" not in lower_name:
-                     has_results = True
-            elif lower_name.endswith(".txt") and ("result" in lower_name or "quant" in lower_name or "protein" in lower_name):
-                 has_results = True
-                
-        return has_results, file_names
-    except Exception as e:
-        print(f"Error checking files for {project_accession}: {e}")
-        return False, []
+    with instrument.accession_scope(project_accession):
+        try:
+            response = await limiter.get(url)
+            if response.status_code != 200:
+                return False, []
+            return classify_project_files(response.json())
+        except Exception as e:
+            print(f"Error checking files for {project_accession}: {e}")
+            return False, []
 
 def analyze_project(project):
     """Analyze a project to see if it meets our criteria."""
@@ -151,14 +185,17 @@ def analyze_project(project):
         "Description": project.get("projectDescription", "")[:200] + "..."
     }
 
-def main():
-    print("Starting PRIDE Scout (Broad Results Search)...")
+async def scout():
+    """Fan out keyword searches and file checks under one shared limiter."""
+    limiter = RequestLimiter()
     
-    all_projects_dict = {} 
+    # 1. Search for projects (all keywords in parallel)
+    keyword_results = await asyncio.gather(*[
+        search_pride_projects_async(term, limiter) for term in SEARCH_TERMS
+    ])
     
-    # 1. Search for projects
-    for term in SEARCH_TERMS:
-        projects = search_pride_projects(term)
+    all_projects_dict = {} 
+    for projects in keyword_results:
         for p in projects:
             all_projects_dict[p.get("accession")] = p
             
@@ -166,6 +203,7 @@ def main():
     print(f"Found {len(unique_projects)} unique candidate projects.")
     
     results = []
+    to_check = []
     
     # 2. Analyze each project
     print("Analyzing metadata...")
@@ -177,9 +215,7 @@ def main():
             
         # Filter: Keep Blood projects that use MaxQuant
         if analysis["Is_MaxQuant"] and analysis["Is_Blood"]:
-             print(f"Checking files for candidate: {analysis['Accession']} - {analysis['Status']}")
-             has_res, files = check_project_files(analysis["Accession"])
-             analysis["Has_Results"] = has_res
+             to_check.append(analysis)
              results.append(analysis)
         elif analysis["Is_MaxQuant"]:
             # Keep it but mark as not checked for files
@@ -188,6 +224,21 @@ def main():
 
         if i % 50 == 0:
             print(f"Processed {i}/{len(unique_projects)}...")
+    
+    print(f"Checking files for {len(to_check)} blood/MaxQuant candidates...")
+    checks = await asyncio.gather(*[
+        check_project_files_async(a["Accession"], limiter) for a in to_check
+    ])
+    for analysis, (has_res, files) in zip(to_check, checks):
+        analysis["Has_Results"] = has_res
+    
+    await limiter.close()
+    return results
+
+def main():
+    print("Starting PRIDE Scout (Broad Results Search)...")
+    
+    results = asyncio.run(scout())
 
     # 3. Save results
     if results:
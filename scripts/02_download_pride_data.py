@@ -1,11 +1,13 @@
-import requests
 import os
 import sys
 import pandas as pd
-import urllib.request
+import instrument
+import rate_limit
+from endpoints import PRIDE_API_BASE
+from downloader import download_many, normalize_url
+from manifest import needs_download, record_download
 
 # Configuration
-PRIDE_API_BASE = "https://www.ebi.ac.uk/pride/ws/archive/v2"
 DOWNLOAD_DIR = "raw_data/pride_downloads"
 INPUT_CSV = "candidate_papers_enriched.csv"
 
@@ -17,7 +19,9 @@ def get_project_files(accession):
     """Get list of files for a project."""
     url = f"{PRIDE_API_BASE}/projects/{accession}/files"
     try:
-        response = requests.get(url)
+        with instrument.span("http", method="GET", url=url) as event:
+            response = rate_limit.get(url)
+            event.update(status=response.status_code, bytes=len(response.content))
         if response.status_code != 200:
             return []
         return response.json()
@@ -25,23 +29,11 @@ def get_project_files(accession):
         print(f"Error getting files for {accession}: {e}")
         return []
 
-def download_file(url, local_path):
-    """Download a file with progress tracking using urllib."""
-    try:
-        # Convert FTP to HTTP if possible for better stability
-        if url.startswith("ftp://ftp.pride.ebi.ac.uk"):
-            url = url.replace("ftp://", "https://")
-
-        print(f"Downloading {url}...")
-        urllib.request.urlretrieve(url, local_path)
-        print(f"Downloaded: {local_path}")
-        return True
-    except Exception as e:
-        print(f"Error downloading {url}: {e}")
-        return False
-
 def process_project(accession):
-    """Find and download proteinGroups.txt and metadata for a project."""
+    """
+    Find proteinGroups.txt and metadata for a project.
+    Returns a list of (url, local_path) download jobs and {local_path: checksum}.
+    """
     print(f"\nProcessing {accession}...")
     project_dir = os.path.join(DOWNLOAD_DIR, accession)
     ensure_dir(project_dir)
@@ -73,8 +65,10 @@ def process_project(accession):
             
     if not target_files:
         print(f"No relevant files found for {accession}")
-        return
+        return [], {}
 
+    jobs = []
+    checksums = {}
     for tf in target_files:
         fname = tf.get("fileName")
         locations = tf.get("publicFileLocations", [])
@@ -95,12 +89,15 @@ def process_project(accession):
         
         if download_url:
             local_path = os.path.join(project_dir, fname)
-            if os.path.exists(local_path):
-                # Optional: Skip if exists
-                # print(f"File already exists: {local_path}")
-                pass
-            else:
-                download_file(download_url, local_path)
+            # PRIDE file metadata carries size and checksum, so verified
+            # files are skipped with a manifest lookup and no network I/O
+            expected_size = tf.get("fileSizeBytes")
+            expected_checksum = tf.get("checksum")
+            if needs_download(project_dir, fname, normalize_url(download_url), expected_size, expected_checksum):
+                jobs.append((download_url, local_path))
+                checksums[local_path] = expected_checksum
+
+    return jobs, checksums
 
 def main():
     ensure_dir(DOWNLOAD_DIR)
@@ -113,8 +110,19 @@ def main():
     accessions = df['Accession'].unique().tolist()
     print(f"Found {len(accessions)} projects to process.")
     
+    jobs = []
+    checksums = {}
     for acc in accessions:
-        process_project(acc)
+        with instrument.accession_scope(acc):
+            project_jobs, project_checksums = process_project(acc)
+        jobs.extend(project_jobs)
+        checksums.update(project_checksums)
+
+    def on_complete(url, local_path, headers):
+        return record_download(url, local_path, headers, checksums.get(local_path))
+
+    print(f"\nQueued {len(jobs)} files for download.")
+    download_many(jobs, on_complete=on_complete)
 
 if __name__ == "__main__":
     main()
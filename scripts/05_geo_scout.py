@@ -1,11 +1,12 @@
-import requests
 import pandas as pd
-import time
+import instrument
+import rate_limit
+from endpoints import EUTILS_BASE
 import xml.etree.ElementTree as ET
 
 # Configuration
-GEO_API_SEARCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-GEO_API_SUMMARY = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+GEO_API_SEARCH = f"{EUTILS_BASE}/esearch.fcgi"
+GEO_API_SUMMARY = f"{EUTILS_BASE}/esummary.fcgi"
 OUTPUT_FILE = "geo_mirna_candidates.csv"
 
 # Search Strategy
@@ -23,7 +24,9 @@ def search_geo(query, retmax=500):
     
     try:
         print(f"Searching GEO with query: {query}")
-        response = requests.get(GEO_API_SEARCH, params=params)
+        with instrument.span("http", method="GET", url=GEO_API_SEARCH) as event:
+            response = rate_limit.get(GEO_API_SEARCH, params=params)
+            event.update(status=response.status_code, bytes=len(response.content))
         response.raise_for_status()
         data = response.json()
         id_list = data.get("esearchresult", {}).get("idlist", [])
@@ -47,7 +50,9 @@ def get_geo_summaries(id_list):
     
     try:
         print(f"Fetching summaries for {len(id_list)} datasets...")
-        response = requests.get(GEO_API_SUMMARY, params=params)
+        with instrument.span("http", method="GET", url=GEO_API_SUMMARY) as event:
+            response = rate_limit.get(GEO_API_SUMMARY, params=params)
+            event.update(status=response.status_code, bytes=len(response.content))
         response.raise_for_status()
         data = response.json()
         return data.get("result", {})
@@ -105,8 +110,6 @@ def main():
                 info = analyze_geo_entry(gds_id, summaries[gds_id])
                 all_candidates.append(info)
         
-        time.sleep(1) # Rate limit
-        
     # 3. Filter and Save
     df = pd.DataFrame(all_candidates)
     
@@ -1,25 +1,34 @@
 import pandas as pd
-import requests
-import time
 import re
 import os
+import sys
+import http_cache
+import instrument
+from endpoints import EUTILS_BASE
+from disease_labels import infer_disease, get_matcher
 
 # Configuration
 INPUT_FILE = "geo_mirna_candidates.csv"
 OUTPUT_FILE = "geo_mirna_candidates_enriched.csv"
-GEO_ESEARCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-GEO_ESUMMARY = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+SAMPLE_OUTPUT_FILE = "geo_sample_metadata.csv"
+GEO_ESEARCH = f"{EUTILS_BASE}/esearch.fcgi"
+GEO_ESUMMARY = f"{EUTILS_BASE}/esummary.fcgi"
 
-def get_samples_for_series(gse_id):
-    """Find GSM (Sample) IDs for a GSE Series."""
+# Batched mode
+SERIES_PER_SEARCH = 50     # GSE accessions OR-ed into one esearch
+SUMMARIES_PER_POST = 500   # GSM docsums per esummary POST
+SEARCH_RETMAX = 10000      # GSM uids per esearch page
+
+def get_samples_for_series(gse_id, retmax=5):
+    """Find GSM (Sample) IDs for a GSE Series (legacy one-series-per-call mode)."""
     params = {
         "db": "gds",
         "term": f"{gse_id}[Accession] AND gse_gsm[Filter]",
-        "retmax": 5, # We only need a few to check metadata
+        "retmax": retmax, # We only need a few to check metadata
         "retmode": "json"
     }
     try:
-        r = requests.get(GEO_ESEARCH, params=params)
+        r = http_cache.get(GEO_ESEARCH, params=params)
         data = r.json()
         return data.get("esearchresult", {}).get("idlist", [])
     except:
@@ -36,7 +45,7 @@ def get_sample_metadata(gsm_db_ids):
         "retmode": "json"
     }
     try:
-        r = requests.get(GEO_ESUMMARY, params=params)
+        r = http_cache.get(GEO_ESUMMARY, params=params)
         data = r.json()
         result_dict = data.get("result", {})
         
@@ -56,35 +65,96 @@ def get_sample_metadata(gsm_db_ids):
     except:
         return ""
 
-def infer_disease_from_text(text):
-    text = str(text).lower()
-    if "healthy" in text or "control" in text or "normal" in text:
-        if "cancer" in text or "tumor" in text or "carcinoma" in text:
-            # Check for specific cancers
-            if "ovarian" in text: return "Ovarian Cancer"
-            if "lung" in text: return "Lung Cancer"
-            if "liver" in text or "hcc" in text: return "Liver Cancer"
-            if "gastric" in text: return "Gastric Cancer"
-            if "breast" in text: return "Breast Cancer"
-            if "pancreatic" in text: return "Pancreatic Cancer"
-            if "parkinson" in text: return "Parkinson's Disease"
-            return "Cancer (Unspecified)"
-    
-    if "parkinson" in text: return "Parkinson's Disease"
-    if "alzheimer" in text: return "Alzheimer's Disease"
-    if "sepsis" in text: return "Sepsis"
-    if "covid" in text or "sars" in text: return "COVID-19"
-    
-    return ""
+def search_samples_batch(gse_ids):
+    """
+    One esearch for many series; returns the GSM uids of all their samples.
+    Plain id lists (no History server WebEnv) keep every call deterministic,
+    so re-runs and EVDX_OFFLINE=1 are served from http_cache.
+    """
+    accessions = " OR ".join(f"{g}[Accession]" for g in gse_ids)
+    uids = []
+    while True:
+        params = {
+            "db": "gds",
+            "term": f"({accessions}) AND gse_gsm[Filter]",
+            "retstart": len(uids),
+            "retmax": SEARCH_RETMAX,
+            "retmode": "json"
+        }
+        r = http_cache.post(GEO_ESEARCH, data=params)
+        r.raise_for_status()
+        result = r.json().get("esearchresult", {})
+        page = result.get("idlist", [])
+        uids.extend(page)
+        if not page or len(uids) >= int(result.get("count", 0)):
+            return uids
 
-def main():
-    if not os.path.exists(INPUT_FILE):
-        print(f"{INPUT_FILE} not found.")
-        return
+def fetch_sample_summaries(uids):
+    """esummary POSTs of SUMMARIES_PER_POST sample uids each."""
+    docsums = []
+    for start in range(0, len(uids), SUMMARIES_PER_POST):
+        params = {
+            "db": "gds",
+            "id": ",".join(uids[start:start + SUMMARIES_PER_POST]),
+            "retmode": "json"
+        }
+        r = http_cache.post(GEO_ESUMMARY, data=params)
+        r.raise_for_status()
+        result = r.json().get("result", {})
+        for uid in result.get("uids", []):
+            docsums.append(result[uid])
+    return docsums
 
-    df = pd.read_csv(INPUT_FILE)
-    print(f"Enriching {len(df)} GEO datasets...")
-    
+def get_samples_batched(gse_ids):
+    """
+    Resolve every GSM docsum for a list of series.
+    Returns {GSE: [docsum, ...]} using the 'gse' field of each sample record.
+    """
+    samples = {g: [] for g in gse_ids}
+    for i in range(0, len(gse_ids), SERIES_PER_SEARCH):
+        chunk = gse_ids[i:i+SERIES_PER_SEARCH]
+        print(f"Resolving samples for series {i+1}-{i+len(chunk)} of {len(gse_ids)}...")
+        try:
+            uids = search_samples_batch(chunk)
+            if not uids:
+                continue
+            docsums = fetch_sample_summaries(uids)
+        except Exception as e:
+            print(f"  Error resolving batch: {e}")
+            continue
+        
+        wanted = set(chunk)
+        for doc in docsums:
+            # 'gse' holds the parent series numbers, e.g. "174705" or "174705;174706"
+            for num in str(doc.get("gse", "")).split(";"):
+                gse = f"GSE{num.strip()}"
+                if gse in wanted:
+                    samples[gse].append(doc)
+    return samples
+
+def summarize_samples(docsums):
+    """Series-level snippet from all sample titles/summaries (order-preserving, de-duplicated)."""
+    texts = []
+    for doc in docsums:
+        texts.append(doc.get("title", ""))
+        texts.append(doc.get("summary", ""))
+    return "; ".join(t for t in dict.fromkeys(texts) if t)
+
+def infer_sample_group(text):
+    """
+    Coarse Control/Disease split for one sample's title and summary, using
+    the same Healthy Control keywords as the normalizers (09/10).
+    """
+    if get_matcher("sample_conditions").label(text) == "Healthy Control":
+        return "Control"
+    return "Disease"
+
+def infer_disease_from_text(text):
+    """Standardized disease label from series/sample text (shared ontology matcher)."""
+    return infer_disease(text)
+
+def enrich_per_series(df):
+    """Legacy mode: two round trips and a 5-sample snippet per series."""
     enriched_labels = []
     metadata_snippets = []
     
@@ -92,11 +162,12 @@ def main():
         gse_id = row['GEO_ID']
         print(f"Checking {gse_id}...")
         
-        # 1. Get Samples
-        gsm_ids = get_samples_for_series(gse_id)
-        
-        # 2. Get Metadata
-        meta = get_sample_metadata(gsm_ids)
+        with instrument.accession_scope(gse_id):
+            # 1. Get Samples
+            gsm_ids = get_samples_for_series(gse_id)
+
+            # 2. Get Metadata
+            meta = get_sample_metadata(gsm_ids)
         metadata_snippets.append(meta)
         
         # 3. Infer
@@ -105,7 +176,48 @@ def main():
         disease = infer_disease_from_text(full_text)
         enriched_labels.append(disease)
         
-        time.sleep(0.5) # Rate limit
+    return enriched_labels, metadata_snippets, []
+
+def enrich_batched(df):
+    """Batched mode: every sample of every series in a handful of E-utilities calls."""
+    samples = get_samples_batched(df['GEO_ID'].unique().tolist())
+    
+    enriched_labels = []
+    metadata_snippets = []
+    sample_rows = []
+    
+    for index, row in df.iterrows():
+        gse_id = row['GEO_ID']
+        docsums = samples.get(gse_id, [])
+        meta = summarize_samples(docsums)
+        metadata_snippets.append(meta[:500]) # Truncate
+        enriched_labels.append(infer_disease_from_text(f"{row['Title']} {meta}"))
+        
+        for doc in docsums:
+            text = f"{doc.get('title', '')} {doc.get('summary', '')}"
+            sample_rows.append({
+                "GEO_ID": gse_id,
+                "GSM": doc.get("accession", ""),
+                "Sample_Title": doc.get("title", ""),
+                "Group": infer_sample_group(text),
+                "Inferred_Disease": infer_disease_from_text(text),
+                "Sample_Summary": doc.get("summary", "")
+            })
+            
+    return enriched_labels, metadata_snippets, sample_rows
+
+def main():
+    if not os.path.exists(INPUT_FILE):
+        print(f"{INPUT_FILE} not found.")
+        return
+
+    df = pd.read_csv(INPUT_FILE)
+    print(f"Enriching {len(df)} GEO datasets...")
+    
+    if "--per-series" in sys.argv:
+        enriched_labels, metadata_snippets, sample_rows = enrich_per_series(df)
+    else:
+        enriched_labels, metadata_snippets, sample_rows = enrich_batched(df)
         
     df['Inferred_Disease'] = enriched_labels
     df['Sample_Metadata_Snippet'] = metadata_snippets
@@ -117,6 +229,11 @@ def main():
     df.to_csv(OUTPUT_FILE, index=False)
     print(f"Saved enriched list to {OUTPUT_FILE}")
     print(df[['GEO_ID', 'Inferred_Disease']].head(15).to_markdown(index=False))
+    
+    if sample_rows:
+        sample_df = pd.DataFrame(sample_rows)
+        sample_df.to_csv(SAMPLE_OUTPUT_FILE, index=False)
+        print(f"Saved {len(sample_df)} sample-level records to {SAMPLE_OUTPUT_FILE}")
 
 if __name__ == "__main__":
     main()
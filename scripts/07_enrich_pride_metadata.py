@@ -1,19 +1,21 @@
 import pandas as pd
-import requests
-import time
 import re
 import os
+import http_cache
+import instrument
+from endpoints import PRIDE_API_BASE
+from disease_labels import infer_disease
 
 # Configuration
 INPUT_FILE = "candidate_papers_for_review.csv"
 OUTPUT_FILE = "candidate_papers_enriched.csv"
-PRIDE_API_PROJECT = "https://www.ebi.ac.uk/pride/ws/archive/v2/projects"
+PRIDE_API_PROJECT = f"{PRIDE_API_BASE}/projects"
 
 def get_pride_metadata(accession):
     """Fetch detailed project metadata from PRIDE."""
     url = f"{PRIDE_API_PROJECT}/{accession}"
     try:
-        r = requests.get(url)
+        r = http_cache.get(url)
         if r.status_code != 200:
             return {}
         return r.json()
@@ -40,22 +42,10 @@ def extract_disease_from_pride_json(data):
     desc = data.get("projectDescription", "")
     title = data.get("title", "")
     
-    full_text = f"{' '.join(keywords)} {title} {desc}".lower()
+    full_text = f"{' '.join(keywords)} {title} {desc}"
     
-    if "alzheimer" in full_text: return "Alzheimer's Disease"
-    if "ovarian" in full_text and "cancer" in full_text: return "Ovarian Cancer"
-    if "parkinson" in full_text: return "Parkinson's Disease"
-    if "lung" in full_text and "cancer" in full_text: return "Lung Cancer"
-    if "liver" in full_text and "cancer" in full_text: return "Liver Cancer"
-    if "hcc" in full_text: return "Liver Cancer"
-    if "pancreatic" in full_text: return "Pancreatic Cancer"
-    if "covid" in full_text or "sars-cov-2" in full_text: return "COVID-19"
-    if "als" in full_text or "amyotrophic" in full_text: return "ALS"
-    if "rheumatoid" in full_text: return "Rheumatoid Arthritis"
-    if "sepsis" in full_text: return "Sepsis"
-    if "breast" in full_text and "cancer" in full_text: return "Breast Cancer"
-    
-    return ""
+    # Specific labels only; a bare "cancer" mention is not enough here
+    return infer_disease(full_text, include_generic=False)
 
 def main():
     if not os.path.exists(INPUT_FILE):
@@ -72,7 +62,8 @@ def main():
         # Skip if we already have a good label (optional, but good to double check)
         
         print(f"Checking {acc}...")
-        meta = get_pride_metadata(acc)
+        with instrument.accession_scope(acc):
+            meta = get_pride_metadata(acc)
         disease = extract_disease_from_pride_json(meta)
         
         # Fallback to existing label if new one is empty
@@ -80,7 +71,6 @@ def main():
              disease = row['Proposed_Disease_Label']
              
         enriched_labels.append(disease)
-        time.sleep(0.2)
         
     df['Enriched_Disease'] = enriched_labels
     
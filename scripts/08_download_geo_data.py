@@ -1,15 +1,31 @@
 import pandas as pd
 import requests
 import os
-import time
 import re
-import urllib.request
+import zlib
+import argparse
+import instrument
+import rate_limit
+import http_client
+from endpoints import GEO_FILES_BASE
 from bs4 import BeautifulSoup
+from downloader import download_many
+from manifest import needs_download, record_download, head_remote
+from geo_archive import extract_remote_archive, archive_is_current
+from table_sniff import sniff_bytes, head_frame, mirna_profile, GZIP_MAGIC, MIN_MIRNA_FRACTION
 
 # Configuration
 INPUT_CSV = "geo_mirna_candidates_enriched.csv"
 DOWNLOAD_DIR = "raw_data/geo_downloads"
-GEO_FILE_URL_BASE = "https://ftp.ncbi.nlm.nih.gov/geo/series"
+GEO_FILE_URL_BASE = GEO_FILES_BASE
+
+# Pre-download probe
+PEEK_BYTES = 64 * 1024          # Range request for the header of text tables
+PEEK_TIMEOUT = 30
+SERIES_BUDGET_MB = 500          # Max bytes queued per series (known sizes only)
+TABLE_EXTENSIONS = ('.txt', '.tsv', '.csv')
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.zip')
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
@@ -26,10 +42,121 @@ def get_supp_files(gse_id):
     url = f"{GEO_FILE_URL_BASE}/{stub}/{gse_id}/suppl/"
     return url
 
-def download_supp_files(gse_id):
+def file_kind(fname):
+    lower = fname.lower()
+    if lower.endswith(ARCHIVE_EXTENSIONS):
+        return "archive"
+    if lower.endswith('.gz'):
+        lower = lower[:-3]
+    if lower.endswith(TABLE_EXTENSIONS):
+        return "table"
+    if lower.endswith(EXCEL_EXTENSIONS):
+        return "excel"
+    return "other"
+
+def peek_remote(url, size=None):
+    """
+    First PEEK_BYTES of a remote file via a Range request, gunzipped
+    incrementally when compressed. Returns (bytes, complete) or (None, False).
+    """
+    try:
+        with instrument.span("http", method="GET", url=url, peek=True) as event, \
+                rate_limit.get(url, headers={**http_client.IDENTITY, "Range": f"bytes=0-{PEEK_BYTES - 1}"}, stream=True, timeout=PEEK_TIMEOUT) as r:
+            event["status"] = r.status_code
+            if r.status_code not in (200, 206):
+                return None, False
+            raw = b""
+            # A server that ignores Range sends 200: stop reading after PEEK_BYTES
+            for chunk in r.iter_content(16 * 1024):
+                raw += chunk
+                if len(raw) >= PEEK_BYTES:
+                    break
+            event["bytes"] = len(raw)
+    except requests.RequestException as e:
+        print(f"  Peek failed for {url}: {e}")
+        return None, False
+    complete = size is not None and len(raw) >= size
+    if raw.startswith(GZIP_MAGIC):
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            data = inflater.decompress(raw)
+        except zlib.error:
+            return None, False
+        return data, inflater.eof
+    return raw, complete
+
+def probe_file(url, peek=True, remote=None):
+    """
+    Size (HEAD, unless `remote` already holds one) and, for text tables, a
+    header check on the first bytes.
+    Returns {"kind", "size", "ok", "mirna_frac", "reason"}.
+    """
+    fname = url.rsplit("/", 1)[-1]
+    kind = file_kind(fname)
+    if remote is None:
+        remote = head_remote(url)
+    result = {"kind": kind, "size": remote.get("size"), "ok": True, "mirna_frac": None, "reason": ""}
+    if kind == "other":
+        result.update(ok=False, reason="not a table")
+    elif kind == "table" and peek:
+        data, complete = peek_remote(url, result["size"])
+        if data is None:
+            return result # Could not peek: decide on size alone
+        try:
+            n_numeric, frac = mirna_profile(head_frame(sniff_bytes(data, complete)))
+        except Exception:
+            n_numeric, frac = 0, 0.0
+        result["mirna_frac"] = frac
+        if n_numeric == 0:
+            result.update(ok=False, reason="no numeric columns in header rows")
+        elif frac < MIN_MIRNA_FRACTION:
+            result.update(ok=False, reason=f"{frac:.0%} miRNA-like row IDs")
+    return result
+
+def select_by_probe(jobs, peek=True, budget_bytes=None, heads=None):
+    """
+    Keep the download jobs worth fetching for one series (heads: {url:
+    head_remote() result} already fetched for them). Tables that pass
+    the header check come first (most miRNA-like, then smallest), Excel
+    files next; they are added while the series stays within budget_bytes.
+    Archives are never downloaded whole: if nothing else qualified their
+    URLs are returned for member extraction (geo_archive).
+    Returns (jobs, archive_urls).
+    """
+    probed = []
+    for url, local_path in jobs:
+        result = probe_file(url, peek, (heads or {}).get(url))
+        fname = os.path.basename(local_path)
+        if not result["ok"]:
+            print(f"  Skipping {fname}: {result['reason']}")
+            continue
+        probed.append((url, local_path, result))
+        
+    direct = [p for p in probed if p[2]["kind"] != "archive"]
+    archives = [url for url, local_path, result in probed if result["kind"] == "archive"]
+    if direct and archives:
+        print(f"  Skipping {len(archives)} archive(s): tables available")
+        archives = []
+    rank = {"table": 0, "excel": 1}
+    direct.sort(key=lambda p: (rank[p[2]["kind"]], -(p[2]["mirna_frac"] or 0), p[2]["size"] or 0))
+    
+    selected, total = [], 0
+    for url, local_path, result in direct:
+        size = result["size"] or 0
+        if budget_bytes is not None and total + size > budget_bytes:
+            print(f"  Skipping {os.path.basename(local_path)}: {size / 1024**2:.1f} MB exceeds the series budget")
+            continue
+        selected.append((url, local_path))
+        total += size
+    return selected, archives
+
+def download_supp_files(gse_id, probe=True, peek=True, budget_bytes=None):
     """
-    Download supplementary files by constructing the URL directly.
+    List supplementary files by constructing the URL directly.
     Uses BeautifulSoup to parse the directory listing.
+    Returns (jobs, archives): (url, local_path) download jobs and, with
+    probe=True, (url, project_dir) archives to extract members from.
+    With probe=True only files that pass select_by_probe() are returned.
     """
     print(f"\nProcessing {gse_id}...")
     project_dir = os.path.join(DOWNLOAD_DIR, gse_id)
@@ -41,10 +168,12 @@ def download_supp_files(gse_id):
     
     try:
         print(f"Checking: {http_url}")
-        response = requests.get(http_url)
+        with instrument.span("http", method="GET", url=http_url) as event:
+            response = rate_limit.get(http_url)
+            event.update(status=response.status_code, bytes=len(response.content))
         if response.status_code != 200:
             print(f"Error: Status code {response.status_code} for {http_url}")
-            return
+            return [], []
 
         soup = BeautifulSoup(response.text, 'html.parser')
         
@@ -76,24 +205,46 @@ def download_supp_files(gse_id):
         
         if not target_files:
             print(f"No relevant supplementary files found in {http_url}")
-            return
-            
+            return [], []
+
+        pending = []
+        heads = {}
         for fname in target_files:
-            # Download
             file_url = f"{http_url}{fname}"
             local_path = os.path.join(project_dir, fname)
             
-            if os.path.exists(local_path):
-                # print(f"Skipping existing: {fname}")
+            # GEO has no checksums; one HEAD request per file tells us whether
+            # it changed since the manifest entry was recorded, and its size
+            # is reused by the probe
+            if probe or os.path.exists(local_path):
+                heads[file_url] = head_remote(file_url)
+            if probe and file_kind(fname) == "archive":
+                if archive_is_current(project_dir, file_url, heads[file_url]):
+                    continue
+            elif not needs_download(project_dir, fname, file_url, remote=heads.get(file_url)):
                 continue
                 
-            print(f"Downloading {fname}...")
-            urllib.request.urlretrieve(file_url, local_path)
-            
+            pending.append((file_url, local_path))
+
+        if not probe:
+            return pending, []
+        jobs, archives = select_by_probe(pending, peek=peek, budget_bytes=budget_bytes, heads=heads)
+        return jobs, [(url, project_dir) for url in archives]
+
     except Exception as e:
         print(f"Error accessing {http_url}: {e}")
+        return [], []
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download GEO supplementary files for miRNA candidates.")
+    parser.add_argument("--no-probe", action="store_true", help="Download every keyword-matching file (no HEAD/peek filter)")
+    parser.add_argument("--no-peek", action="store_true", help="Probe sizes with HEAD only, skip the header check")
+    parser.add_argument("--budget-mb", type=float, default=SERIES_BUDGET_MB, help="Max MB downloaded per series (0 = unlimited)")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    budget_bytes = int(args.budget_mb * 1024**2) if args.budget_mb > 0 else None
     ensure_dir(DOWNLOAD_DIR)
     
     if not os.path.exists(INPUT_CSV):
@@ -104,9 +255,25 @@ def main():
     gse_ids = df['GEO_ID'].unique().tolist()
     print(f"Found {len(gse_ids)} GEO datasets to process.")
     
+    jobs = []
+    archives = []
     for gse in gse_ids:
-        download_supp_files(gse)
-        time.sleep(1)
+        with instrument.accession_scope(gse):
+            series_jobs, series_archives = download_supp_files(gse, probe=not args.no_probe, peek=not args.no_peek, budget_bytes=budget_bytes)
+        jobs.extend(series_jobs)
+        archives.extend(series_archives)
+
+    print(f"\nQueued {len(jobs)} files for download.")
+    download_many(jobs, on_complete=record_download)
+    
+    # Series whose counts only exist inside _RAW.tar: pull the count-like members
+    for url, project_dir in archives:
+        print(f"\nExtracting count tables from {url}")
+        try:
+            with instrument.accession_scope(os.path.basename(project_dir)):
+                extract_remote_archive(url, project_dir)
+        except Exception as e:
+            print(f"  Archive extraction failed for {url}: {e}")
 
 if __name__ == "__main__":
     main()
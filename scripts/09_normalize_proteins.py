@@ -1,13 +1,28 @@
 import pandas as pd
 import numpy as np
 import os
-import re
+import time
+import argparse
+import instrument
+from matrix_store import save_matrix, merge_matrices, write_csv
+from study_cache import StudyCache, code_fingerprint
+from parallel import map_studies
+from disease_labels import classify_samples, RULE_FILES
 
 # Configuration
 RAW_DIR = "raw_data/pride_downloads"
 METADATA_FILE = "candidate_papers_enriched.csv"
 OUTPUT_DIR = "analysis_results/proteomics"
+# Helper modules whose code shapes the cached per-study results (part of the cache fingerprint)
+HELPER_MODULES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                  for name in ("matrix_store.py", "study_cache.py")]
 MIN_PROTEINS = 100 # Minimum proteins detected to keep a sample
+CHUNK_SIZE = None # Rows per chunk when reading proteinGroups.txt (None = single pass)
+
+# proteinGroups.txt columns we actually use; everything else is never parsed
+GENE_COLUMNS = ['gene names', 'genenames', 'gene_names', 'genes']
+PROTEIN_COLUMNS = ['majority protein ids', 'majority protein id', 'protein ids']
+FLAG_COLUMNS = ['Potential contaminant', 'Reverse', 'Only identified by site']
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
@@ -19,34 +34,68 @@ def load_study_metadata():
         return pd.read_csv(METADATA_FILE).set_index("Accession")["Enriched_Disease"].to_dict()
     return {}
 
-def infer_sample_type(sample_name, study_disease):
+def sniff_header(file_path):
+    """Read only the header line of a tab-separated MaxQuant table."""
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as fh:
+        return fh.readline().rstrip('\r\n').split('\t')
+
+def select_columns(header):
+    """Pick the ID, flag and intensity columns from a proteinGroups.txt header."""
+    gene_col = next((c for c in header if c.lower() in GENE_COLUMNS), None)
+    protein_col = next((c for c in header if c.lower() in PROTEIN_COLUMNS), None)
+    flag_cols = [c for c in FLAG_COLUMNS if c in header]
+    lfq_cols = [c for c in header if c.startswith("LFQ intensity ")]
+    return gene_col, protein_col, flag_cols, lfq_cols
+
+def read_protein_groups(file_path, id_cols, flag_cols, value_cols, chunksize=None, coerce=False):
     """
-    Infer if a sample is Case or Control based on its name.
-    sample_name: e.g., "EV_Control_01", "Cancer_02"
-    study_disease: e.g., "Ovarian Cancer"
+    Load only the needed columns, intensities as float32.
+    Yields DataFrames (one, or one per chunk when chunksize is set).
+    coerce=True parses intensities as text first and forces junk to NaN.
     """
-    s = sample_name.lower()
-    
-    # Specific Study Rules
-    # PXD036491 (COVID): HD = Healthy Donor, Pz/PZ = Patient
-    if s.startswith("hd"):
-        return "Healthy Control"
-    if s.startswith("pz"):
-        return study_disease if study_disease else "Case"
-    
-    # Control keywords
-    if any(x in s for x in ['control', 'ctrl', 'healthy', 'norm', 'hc_', '_hc', 'non-disease']):
-        return "Healthy Control"
-    
-    # If not control, assume it's the study disease
-    # (Unless it's a technical replicate pool, standard, etc.)
-    if any(x in s for x in ['pool', 'standard', 'ref']):
-        return "Technical Control"
-        
-    if pd.isna(study_disease) or study_disease == "":
-        return "Case (Unknown Disease)"
+    usecols = list(dict.fromkeys(id_cols + flag_cols + value_cols))
+    dtypes = {c: str for c in id_cols + flag_cols}
+    dtypes.update({c: (str if coerce else np.float32) for c in value_cols})
+    
+    # Chunks are parsed lazily, so each one is timed up to the point it is handed over
+    start = time.perf_counter()
+    size = os.path.getsize(file_path)
+    reader = pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=dtypes, chunksize=chunksize)
+    chunks = [reader] if chunksize is None else reader
+    for chunk in chunks:
+        if coerce:
+            for c in value_cols:
+                chunk[c] = pd.to_numeric(chunk[c], errors='coerce').astype(np.float32)
+        instrument.record("parse", path=file_path, bytes=size, rows=len(chunk), cols=chunk.shape[1],
+                          wall_s=round(time.perf_counter() - start, 6))
+        size = None # Bytes are counted once per file
+        yield chunk
+        start = time.perf_counter()
+
+def sum_by_feature(file_path, gene_col, protein_col, flag_cols, lfq_cols, coerce=False):
+    """Filter and group-sum each chunk; returns one partial sum per chunk."""
+    id_cols = [c for c in (gene_col, protein_col) if c]
+    partial_sums = []
+    for df in read_protein_groups(file_path, id_cols, flag_cols, lfq_cols, chunksize=CHUNK_SIZE, coerce=coerce):
+        # 1. Standard Filtering (MaxQuant)
+        # Remove Contaminants, Reverse, Only identified by site
+        for flag in flag_cols:
+            df = df[df[flag] != '+']
+            
+        # 2. Feature Selection (Gene Names, falling back to Protein IDs)
+        if gene_col:
+            feature_id = df[gene_col]
+            if protein_col:
+                feature_id = feature_id.fillna(df[protein_col])
+        else:
+            feature_id = df[protein_col]
         
-    return study_disease
+        # Group by Gene and Sum (handling isoforms mapped to same gene)
+        subset = df[lfq_cols].copy()
+        subset['Feature_ID'] = feature_id.fillna('Unknown')
+        with instrument.span("groupby", rows=len(subset)) as event:
+            partial_sums.append(instrument.frame_shape(event, subset.groupby('Feature_ID').sum()))
+    return partial_sums
 
 def process_maxquant_file(accession, folder_path, study_disease):
     """Process a single proteinGroups.txt file."""
@@ -57,108 +106,83 @@ def process_maxquant_file(accession, folder_path, study_disease):
     print(f"Processing {accession}...")
     
     try:
-        # Load data (only necessary columns to save memory)
-        # We need: Protein names, Gene names, Potential contaminant, Reverse, LFQ intensity *
-        df = pd.read_csv(file_path, sep='\t', low_memory=False)
+        # Sniff the header so we only parse the columns we need:
+        # Gene names / Protein IDs, contaminant/reverse flags, LFQ intensity *
+        header = sniff_header(file_path)
     except Exception as e:
         print(f"  Error reading file: {e}")
         return None, None
 
-    # 1. Standard Filtering (MaxQuant)
-    # Remove Contaminants, Reverse, Only identified by site
-    if 'Potential contaminant' in df.columns:
-        df = df[df['Potential contaminant'] != '+']
-    if 'Reverse' in df.columns:
-        df = df[df['Reverse'] != '+']
-    if 'Only identified by site' in df.columns:
-        df = df[df['Only identified by site'] != '+']
-
-    # 2. Feature Selection (Gene Names)
     # Handle variations in column naming
-    gene_col = None
-    for col in df.columns:
-        if col.lower() in ['gene names', 'genenames', 'gene_names', 'genes']:
-            gene_col = col
-            break
-            
-    protein_col = None
-    for col in df.columns:
-        if col.lower() in ['majority protein ids', 'majority protein id', 'protein ids']:
-            protein_col = col
-            break
-            
-    if gene_col:
-        df['Feature_ID'] = df[gene_col]
-        if protein_col:
-            df['Feature_ID'] = df['Feature_ID'].fillna(df[protein_col])
-    elif protein_col:
+    gene_col, protein_col, flag_cols, lfq_cols = select_columns(header)
+    
+    if not gene_col and protein_col:
         print(f"  Warning: No Gene Name column found. Using {protein_col}.")
-        df['Feature_ID'] = df[protein_col]
-    else:
+    elif not gene_col:
         print("  Error: No ID column found (Gene names/Protein IDs). Skipping.")
         return None, None
         
-    df['Feature_ID'] = df['Feature_ID'].fillna('Unknown')
-    
-    # Handle duplicates: Group by Feature_ID and take the one with highest total intensity, or sum?
-    # Standard approach: Take entry with most peptides, or sum intensities. 
-    # Let's keep it simple: Group by Feature_ID and sum.
-    
-    # 3. Extract LFQ Columns
-    lfq_cols = [c for c in df.columns if c.startswith("LFQ intensity ")]
     if not lfq_cols:
         print(f"  No LFQ columns found in {accession}. Checking 'Intensity' columns...")
-        lfq_cols = [c for c in df.columns if c.startswith("Intensity ") and c != "Intensity"]
+        lfq_cols = [c for c in header if c.startswith("Intensity ") and c != "Intensity"]
         
     if not lfq_cols:
         print(f"  Skipping {accession}: No intensity data found.")
         return None, None
 
-    # Create metadata for these samples
-    metadata_rows = []
-    cleaned_data = {} # {SampleID: {Gene: Intensity}}
-    
-    # Aggregate duplicates first
-    # We only care about Feature_ID and lfq_cols
-    subset = df[['Feature_ID'] + lfq_cols].copy()
-    # Convert to numeric, force errors to NaN
-    for c in lfq_cols:
-        subset[c] = pd.to_numeric(subset[c], errors='coerce')
+    try:
+        try:
+            partial_sums = sum_by_feature(file_path, gene_col, protein_col, flag_cols, lfq_cols)
+        except ValueError:
+            # Non-numeric junk in an intensity column: re-read with coercion
+            partial_sums = sum_by_feature(file_path, gene_col, protein_col, flag_cols, lfq_cols, coerce=True)
+    except Exception as e:
+        print(f"  Error reading file: {e}")
+        return None, None
         
-    # Group by Gene and Sum (handling isoforms mapped to same gene)
-    grouped = subset.groupby('Feature_ID').sum()
+    if not partial_sums:
+        return None, None
+        
+    # Combine per-chunk sums (a no-op for a single pass)
+    if len(partial_sums) == 1:
+        grouped = partial_sums[0]
+    else:
+        with instrument.span("groupby", parts=len(partial_sums)) as event:
+            grouped = instrument.frame_shape(event, pd.concat(partial_sums).groupby(level=0).sum())
     
     # Log2 Transform (x+1)
     grouped = np.log2(grouped + 1)
     
-    # Filter low quality samples (columns)
-    valid_samples = []
-    for col in grouped.columns:
-        # clean column name: "LFQ intensity Sample1" -> "Sample1"
-        original_sample_name = col.replace("LFQ intensity ", "").replace("Intensity ", "")
-        
-        # Check non-zero count
-        n_proteins = (grouped[col] > 0).sum()
-        if n_proteins < MIN_PROTEINS:
-            continue
-            
+    # Create metadata for these samples
+    # clean column names: "LFQ intensity Sample1" -> "Sample1"
+    sample_names = grouped.columns.str.replace("LFQ intensity ", "", regex=False).str.replace("Intensity ", "", regex=False)
+    
+    # Filter low quality samples (columns) on their non-zero count
+    n_proteins = (grouped > 0).sum().to_numpy()
+    keep = n_proteins >= MIN_PROTEINS
+    sample_names = sample_names[keep]
+    n_proteins = n_proteins[keep]
+    
+    # Infer labels for the whole study in one pass
+    labels = classify_samples(sample_names, study_disease, accession,
+                              technical=True, unknown="Case (Unknown Disease)")
+    
+    metadata_rows = []
+    cleaned_data = {} # {SampleID: {Gene: Intensity}}
+    for col, original_sample_name, label, n in zip(grouped.columns[keep], sample_names, labels, n_proteins):
         global_id = f"{accession}_{original_sample_name}"
         
-        # Infer Label
-        label = infer_sample_type(original_sample_name, study_disease)
-        
         metadata_rows.append({
             "Global_ID": global_id,
             "Accession": accession,
             "Original_Sample_ID": original_sample_name,
             "Condition": label,
-            "Proteins_Detected": n_proteins,
+            "Proteins_Detected": n,
             "Batch": accession # Study ID as Batch
         })
         
         # Store data with Global ID
         cleaned_data[global_id] = grouped[col]
-        valid_samples.append(global_id)
 
     if not cleaned_data:
         return None, None
@@ -167,23 +191,59 @@ def process_maxquant_file(accession, folder_path, study_disease):
     final_df = pd.DataFrame(cleaned_data)
     return final_df, metadata_rows
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Normalize and merge proteomics studies.")
+    parser.add_argument("--workers", type=int, default=1, help="Normalize accessions in N processes")
+    parser.add_argument("--sparse", action="store_true", help="Keep merged matrices sparse (NaN = not measured)")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     ensure_dir(OUTPUT_DIR)
     study_map = load_study_metadata()
+    cache = StudyCache("proteomics")
+    code_hash = code_fingerprint(os.path.abspath(__file__), *RULE_FILES, *HELPER_MODULES)
     
     all_dfs = []
     all_metadata = []
     
-    projects = [d for d in os.listdir(RAW_DIR) if os.path.isdir(os.path.join(RAW_DIR, d))]
+    # Sorted so the merged column order never depends on the filesystem
+    projects = sorted(d for d in os.listdir(RAW_DIR) if os.path.isdir(os.path.join(RAW_DIR, d)))
     print(f"Found {len(projects)} datasets to process.")
     
+    results = {}
+    jobs = [] # (accession, folder, disease) still to normalize
+    keys = {}
     for proj in projects:
         disease = study_map.get(proj, "Unknown")
-        df, meta = process_maxquant_file(proj, os.path.join(RAW_DIR, proj), disease)
+        folder = os.path.join(RAW_DIR, proj)
+        file_path = os.path.join(folder, "proteinGroups.txt")
+        
+        if not os.path.exists(file_path):
+            continue
+            
+        # Only new or changed studies are re-normalized
+        key = cache.key([file_path], {"MIN_PROTEINS": MIN_PROTEINS, "disease": disease, "code": code_hash})
+        cached = cache.load(proj, key)
+        if cached is not False:
+            print(f"Cached {proj}")
+            results[proj] = cached
+        else:
+            jobs.append((proj, folder, disease))
+            keys[proj] = key
+    
+    # Results come back in job order, so the merge is identical to a serial run
+    for (proj, folder, disease), (df, meta) in zip(jobs, map_studies(process_maxquant_file, jobs, args.workers)):
+        cache.save(proj, keys[proj], df, meta)
+        results[proj] = (df, meta)
         
+    for proj in projects:
+        df, meta = results.get(proj, (None, None))
         if df is not None and not df.empty:
             all_dfs.append(df)
             all_metadata.extend(meta)
+    
+    cache.flush()
             
     if not all_dfs:
         print("No valid data processed.")
@@ -191,13 +251,15 @@ def main():
 
     print("\nMerging all datasets...")
     # Outer join on index (Gene Names)
-    master_matrix = pd.concat(all_dfs, axis=1, join='outer')
+    master_matrix = merge_matrices(all_dfs, sparse=args.sparse)
     
     # Save Matrix
     matrix_path = os.path.join(OUTPUT_DIR, "merged_protein_matrix_log2.csv")
-    master_matrix.to_csv(matrix_path)
+    write_csv(master_matrix, matrix_path)
     print(f"Saved Matrix: {matrix_path}")
     print(f"  Dimensions: {master_matrix.shape}")
+    if args.sparse:
+        print(f"  Density: {master_matrix.sparse.density:.1%} observed")
     
     # Save Metadata
     meta_df = pd.DataFrame(all_metadata)
@@ -205,6 +267,10 @@ def main():
     meta_df.to_csv(meta_path, index=False)
     print(f"Saved Metadata: {meta_path}")
     print(f"  Samples: {len(meta_df)}")
+    
+    # Columnar copy (float32, metadata embedded) for fast partial loads
+    parquet_path = save_matrix(master_matrix, meta_df, os.path.join(OUTPUT_DIR, "merged_protein_matrix_log2.parquet"))
+    print(f"Saved Parquet: {parquet_path}")
     print("\nSample Counts by Condition:")
     print(meta_df['Condition'].value_counts().to_markdown())
 
@@ -1,12 +1,31 @@
 import pandas as pd
 import numpy as np
 import os
+import argparse
 import gzip
+import instrument
+from matrix_store import save_matrix, merge_matrices, write_csv
+from study_cache import StudyCache, code_fingerprint
+from parallel import map_studies
+from disease_labels import classify_samples, RULE_FILES
+from geo_archive import assemble_local_archives
+from table_sniff import read_table, sniff_table, mirna_profile, sample_columns, sample_stem, join_samples
 
 # Configuration
 RAW_DIR = "raw_data/geo_downloads"
 METADATA_FILE = "geo_mirna_candidates_enriched.csv"
 OUTPUT_DIR = "analysis_results/mirna"
+# Helper modules whose code shapes the cached per-study results (part of the cache fingerprint)
+HELPER_MODULES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                  for name in ("table_sniff.py", "geo_archive.py", "matrix_store.py", "study_cache.py")]
+# Optional miRBase aliases.txt (or .gz): "MIMAT0000076<TAB>hsa-miR-21;hsa-miR-21-5p;",
+# oldest name first, current name last. Used only if the file exists.
+MIRBASE_ALIASES = os.environ.get("EVDX_MIRBASE_ALIASES", "raw_data/mirbase/aliases.txt")
+
+# Candidate-file scoring (header peek only, no full parse)
+PEEK_ROWS = 200
+DATA_EXTENSIONS = ('.txt', '.tsv', '.csv', '.xlsx', '.xls')
+NAME_HINTS = ('count', 'matrix', 'raw')
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
@@ -17,56 +36,104 @@ def load_study_metadata():
         return pd.read_csv(METADATA_FILE).set_index("GEO_ID")["Inferred_Disease"].to_dict()
     return {}
 
+def load_sample_counts():
+    """GEO_ID -> Sample_Count from the candidate CSV (used to score candidate files)."""
+    if os.path.exists(METADATA_FILE):
+        meta = pd.read_csv(METADATA_FILE)
+        if "Sample_Count" in meta.columns:
+            counts = pd.to_numeric(meta.set_index("GEO_ID")["Sample_Count"], errors="coerce")
+            return counts.dropna().astype(int).to_dict()
+    return {}
+
 def load_count_matrix(file_path):
     """
     Load a count matrix from various formats (csv, tsv, txt, xlsx, gz).
+    The format is sniffed from the content (not the extension) and the file
+    is parsed exactly once.
     """
     try:
-        lower_path = file_path.lower()
-        
-        if lower_path.endswith('.xlsx') or lower_path.endswith('.xls'):
-            df = pd.read_excel(file_path)
-        elif lower_path.endswith('.csv') or lower_path.endswith('.csv.gz'):
-            df = pd.read_csv(file_path)
-        else:
-            # Try tab then whitespace for txt/tsv
-            try:
-                df = pd.read_csv(file_path, sep='\t')
-                if df.shape[1] < 2: # If only 1 col, maybe whitespace
-                    df = pd.read_csv(file_path, sep=r'\s+')
-            except:
-                df = pd.read_csv(file_path, sep=r'\s+')
-                
-        return df
+        return read_table(file_path)
     except Exception as e:
         print(f"  Error loading {os.path.basename(file_path)}: {e}")
         return None
 
-def clean_mirna_id(id_str):
+# Keep only the first pipe-separated part that names a miRNA ("seq|let-7a|..."
+# -> "let-7a"), skipping a bare "mir" part; IDs without such a part are left
+# alone. No lookarounds, so Arrow strings run it natively (RE2).
+PIPE_NAME = r"(?i)^(?:[^|]*\|)*?([^|]+(?:let|mir)[^|]*|(?:let|mir)[^|]+|let)(?:\|.*)?$"
+
+_alias_table = None
+_id_cache = {} # raw ID -> cleaned ID, shared by every study in this process
+
+def load_mirbase_aliases(path=MIRBASE_ALIASES):
     """
-    Standardize miRNA ID to 'hsa-mir-X'.
-    - Handle pipe-separated IDs (e.g. "seq|let-7a|...") by extracting the name.
-    - Lowercase
-    - Remove 'hsa-', 'mir-', 'miR-' prefix variations
-    - Re-add standard 'hsa-mir-' prefix
+    (exact, lower) dicts mapping every human alias and MIMAT/MI accession to
+    its current miRBase name. Lower-case keys that point at two different
+    names (e.g. precursor hsa-mir-21 vs. old mature hsa-miR-21) are dropped.
+    Empty dicts if no table is available.
     """
-    s = str(id_str).lower()
-    
+    global _alias_table
+    if _alias_table is not None:
+        return _alias_table
+    exact, lower, ambiguous = {}, {}, set()
+    if path and os.path.exists(path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as fh:
+            for line in fh:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 2:
+                    continue
+                names = [n for n in fields[1].split(";") if n]
+                if not names or not names[-1].startswith("hsa-"):
+                    continue
+                current = names[-1]
+                for alias in [fields[0]] + names:
+                    exact[alias] = current
+                    key = alias.lower()
+                    if lower.get(key, current) != current:
+                        ambiguous.add(key)
+                    lower[key] = current
+        for key in ambiguous:
+            del lower[key]
+    _alias_table = (exact, lower)
+    return _alias_table
+
+def _clean_unique_ids(raw):
+    """Vectorized cleaning of unique raw IDs (a Series of str)."""
     # Handle pipes (isomiR annotations)
-    if "|" in s:
-        parts = s.split("|")
-        found_name = None
-        # Look for the part that is the name (has 'let' or 'mir' but isn't just the prefix)
-        for p in parts:
-            if ("let" in p or "mir" in p) and not (p == "hsa" or p == "mir"):
-                found_name = p
-                break
-        if found_name:
-            s = found_name
-            
-    # Remove existing prefixes
-    s = s.replace('hsa-', '').replace('mir-', '').replace('mirna-', '')
-    return f"hsa-mir-{s}"
+    names = raw.str.replace(PIPE_NAME, r"\1", regex=True)
+    
+    # Retired / precursor-style names -> current miRBase name (e.g. hsa-miR-21 -> hsa-miR-21-5p)
+    exact, lower = load_mirbase_aliases()
+    if exact:
+        resolved = names.map(exact)
+        resolved = resolved.fillna(names.str.lower().map(lower))
+        names = resolved.fillna(names)
+    
+    # Lowercase, remove existing prefixes, re-add the standard one
+    s = names.str.lower()
+    s = s.str.replace('hsa-', '', regex=False).str.replace('mir-', '', regex=False).str.replace('mirna-', '', regex=False)
+    return "hsa-mir-" + s
+
+def clean_mirna_ids(ids):
+    """
+    Standardize miRNA IDs to 'hsa-mir-X' (lowercase, pipe-separated isomiR
+    names reduced to the miRNA name, optional miRBase alias resolution).
+    Each distinct ID is cleaned once and memoized; rows are then mapped by
+    their factorized code, so repeated isomiR names cost nothing extra.
+    """
+    codes, uniques = pd.factorize(np.asarray(ids, dtype=object), use_na_sentinel=False)
+    uniques = [str(u) for u in uniques]
+    new = [u for u in uniques if u not in _id_cache]
+    if new:
+        cleaned = _clean_unique_ids(pd.Series(new, dtype="string[pyarrow]"))
+        _id_cache.update(zip(new, cleaned.to_numpy(dtype=object)))
+    cleaned = np.array([_id_cache[u] for u in uniques], dtype=object)
+    return pd.Index(cleaned[codes], name=getattr(ids, "name", None))
+
+def clean_mirna_id(id_str):
+    """Single-ID form of clean_mirna_ids()."""
+    return clean_mirna_ids([id_str])[0]
 
 def standardize_mirna_matrix(df, gse_id, disease_label):
     """
@@ -99,7 +166,7 @@ def standardize_mirna_matrix(df, gse_id, disease_label):
     
     # --- HARMONIZATION STEP ---
     # Clean index values
-    df.index = df.index.map(clean_mirna_id)
+    df.index = clean_mirna_ids(df.index)
     # --------------------------
     
     # 2. Filter non-numeric columns (metadata)
@@ -113,7 +180,8 @@ def standardize_mirna_matrix(df, gse_id, disease_label):
     # Aggregate duplicates (Sum counts for same miRNA ID)
     if not numeric_df.index.is_unique:
         print(f"  Aggregating duplicate IDs in {gse_id}")
-        numeric_df = numeric_df.groupby(level=0).sum()
+        with instrument.span("groupby", rows=len(numeric_df)) as event:
+            numeric_df = instrument.frame_shape(event, numeric_df.groupby(level=0).sum())
         
     # 3. Normalize (Log2 CPM-ish)
     # Simple normalization: log2(x + 1)
@@ -135,84 +203,172 @@ def standardize_mirna_matrix(df, gse_id, disease_label):
         norm_df = np.log2(norm_df + 1)
         
     # 4. Create Metadata
-    metadata = []
-    for sample in norm_df.columns:
-        global_id = f"{gse_id}_{sample}"
-        s_lower = str(sample).lower()
-        
-        cond = "Unknown"
-        
-        # Control Keywords
-        if any(x in s_lower for x in ['control', 'ctrl', 'healthy', 'norm', 'hc', 'volunteer', 'non-tumor', 'non_tumor', 'donor']):
-            cond = "Healthy Control"
-        # Case Keywords (if not control)
-        elif any(x in s_lower for x in ['patient', 'case', 'tumor', 'cancer', 'disease', 'pd', 'ad', 'als']):
-            cond = disease_label if disease_label else "Case"
-        # Fallback: If we have a study disease label, assume it's a case-only study OR we missed the keyword
-        # But to be safe, let's mark ambiguous ones if we can't find a keyword? 
-        # Actually, for GEO, usually if it's not control, it's case.
-        elif disease_label:
-             cond = disease_label
-        else:
-             cond = "Case" # Default assumption for clinical datasets
-            
-        metadata.append({
-            "Global_ID": global_id,
-            "Accession": gse_id,
-            "Original_Sample_ID": sample,
-            "Condition": cond,
-            "Biofluid": "Serum/Plasma (inferred)"
-        })
+    # Control / case keywords for every sample at once; without a keyword a
+    # sample is taken as the study disease (GEO: if it's not control, it's case)
+    conditions = classify_samples(norm_df.columns, disease_label, gse_id)
+    metadata = [{
+        "Global_ID": f"{gse_id}_{sample}",
+        "Accession": gse_id,
+        "Original_Sample_ID": sample,
+        "Condition": cond,
+        "Biofluid": "Serum/Plasma (inferred)"
+    } for sample, cond in zip(norm_df.columns, conditions)]
         
     # Rename columns to Global ID
     norm_df.columns = [f"{gse_id}_{c}" for c in norm_df.columns]
     
     return norm_df, metadata
 
+def is_data_file(name):
+    lower = name.lower()
+    if lower.endswith('.gz'):
+        lower = lower[:-3]
+    return lower.endswith(DATA_EXTENSIONS)
+
+def score_candidate(path, expected_samples=None):
+    """
+    Score a candidate matrix from its size and first PEEK_ROWS rows only.
+    Returns a dict with the score and the features behind it, or None if
+    the file cannot be a count matrix (unreadable or no numeric columns).
+    """
+    try:
+        info = sniff_table(path)
+        peek = read_table(path, info, nrows=PEEK_ROWS)
+    except Exception:
+        return None
+    n_samples, mirna_frac = mirna_profile(peek)
+    if n_samples == 0:
+        return None
+    numeric = peek.select_dtypes(include=[np.number])
+    numeric_density = numeric.notna().to_numpy().mean() * n_samples / max(peek.shape[1] - 1, 1)
+    
+    score = 3 * mirna_frac + 2 * min(numeric_density, 1.0)
+    agreement = None
+    if expected_samples:
+        agreement = min(n_samples, expected_samples) / max(n_samples, expected_samples)
+        score += 3 * agreement
+    name = os.path.basename(path).lower()
+    if any(h in name for h in NAME_HINTS):
+        score += 0.5
+    score += 0.1 * np.log10(max(info["size"], 1)) # Tie-break: the larger file is usually the full matrix
+    return {"file": os.path.basename(path), "score": score, "n_samples": n_samples,
+            "mirna_frac": mirna_frac, "agreement": agreement}
+
+def select_target_files(proj_dir, expected_samples=None):
+    """
+    Pick the count matrix (or per-sample files to combine) from a GEO
+    download folder by scoring every candidate's header rows. A single
+    best file is preferred; compatible per-sample files (same layout,
+    miRNA row IDs) are combined when together they match the expected
+    sample count much better than any one file.
+    """
+    files = sorted(f for f in os.listdir(proj_dir) if not f.startswith('.') and is_data_file(f))
+    scored = [sc for sc in (score_candidate(os.path.join(proj_dir, f), expected_samples) for f in files) if sc]
+    if not scored:
+        return []
+    scored.sort(key=lambda sc: sc["score"], reverse=True)
+    best = scored[0]
+    
+    # Per-sample layout: several small files with miRNA IDs and the same column count
+    group = [sc for sc in scored if sc["mirna_frac"] >= 0.5 and sc["n_samples"] == best["n_samples"]]
+    if len(group) > 1 and best["n_samples"] <= 2:
+        combined = sum(sc["n_samples"] for sc in group)
+        if expected_samples:
+            combine = abs(combined - expected_samples) < abs(best["n_samples"] - expected_samples)
+        else:
+            combine = len(group) >= 3
+        if combine:
+            return sorted(sc["file"] for sc in group)
+    return [best["file"]]
+
+def load_combined_matrix(fpaths):
+    """
+    Load per-sample files and join them on their ID column. Numeric columns
+    are prefixed by the file's sample stem (e.g. GSM123456) so identical
+    column names such as "count" stay distinct.
+    """
+    parts = []
+    for fpath in fpaths:
+        raw_df = load_count_matrix(fpath)
+        if raw_df is not None:
+            parts.append(sample_columns(raw_df, sample_stem(fpath)))
+    if not parts:
+        return None
+    return join_samples(parts).reset_index()
+
+def process_project(proj, fpaths, disease):
+    """Load and standardize one study's count matrix (or its combined per-sample files)."""
+    raw_df = load_count_matrix(fpaths[0]) if len(fpaths) == 1 else load_combined_matrix(fpaths)
+    if raw_df is None:
+        return None, None
+    return standardize_mirna_matrix(raw_df, proj, disease)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Normalize and merge miRNA studies.")
+    parser.add_argument("--workers", type=int, default=1, help="Normalize accessions in N processes")
+    parser.add_argument("--sparse", action="store_true", help="Keep merged matrices sparse (NaN = not measured)")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     ensure_dir(OUTPUT_DIR)
     study_map = load_study_metadata()
+    sample_counts = load_sample_counts()
+    cache = StudyCache("mirna")
+    code_hash = code_fingerprint(os.path.abspath(__file__), *RULE_FILES, *HELPER_MODULES)
+    alias_files = [MIRBASE_ALIASES] if os.path.exists(MIRBASE_ALIASES) else []
+    if not alias_files:
+        print(f"No miRBase alias table at {MIRBASE_ALIASES}; IDs are matched as written.")
     
     all_dfs = []
     all_metadata = []
     
-    projects = [d for d in os.listdir(RAW_DIR) if os.path.isdir(os.path.join(RAW_DIR, d))]
+    # Sorted so the merged column order never depends on the filesystem
+    projects = sorted(d for d in os.listdir(RAW_DIR) if os.path.isdir(os.path.join(RAW_DIR, d)))
     print(f"Found {len(projects)} GEO datasets.")
     
+    results = {}
+    jobs = [] # (accession, file paths, disease) still to normalize
+    keys = {}
     for proj in projects:
         print(f"Processing {proj}...")
         proj_dir = os.path.join(RAW_DIR, proj)
-        files = [f for f in os.listdir(proj_dir) if not f.startswith('.')]
-        
-        # Find the best file (prefer "normalized" or "counts" or "matrix")
-        # Priority: *matrix* > *count* > *normalized*
-        target_file = None
-        
-        # Filter for count/matrix files
-        candidates = [f for f in files if "count" in f.lower() or "matrix" in f.lower() or "raw" in f.lower()]
-        
-        if not candidates:
-            # Fallback to any text/csv file
-            candidates = [f for f in files if f.endswith('txt.gz') or f.endswith('csv.gz') or f.endswith('.xlsx')]
+        # Whole _RAW.tar archives from older runs: assemble their per-GSM tables once
+        assemble_local_archives(proj_dir)
+        target_files = select_target_files(proj_dir, sample_counts.get(proj))
             
-        if candidates:
-            # Pick the largest file (likely the full matrix)
-            # Just pick the first one for now
-            target_file = candidates[0]
-            
-        if target_file:
-            fpath = os.path.join(proj_dir, target_file)
-            print(f"  Using {target_file}")
+        if target_files:
+            fpaths = [os.path.join(proj_dir, f) for f in target_files]
+            if len(target_files) == 1:
+                print(f"  Using {target_files[0]}")
+            else:
+                print(f"  Combining {len(target_files)} per-sample files")
             disease = study_map.get(proj, "Unknown")
             
-            raw_df = load_count_matrix(fpath)
-            if raw_df is not None:
-                norm_df, meta = standardize_mirna_matrix(raw_df, proj, disease)
-                if norm_df is not None:
-                    all_dfs.append(norm_df)
-                    all_metadata.extend(meta)
+            # Only new or changed studies are re-normalized
+            key = cache.key(fpaths + alias_files, {"disease": disease, "code": code_hash})
+            cached = cache.load(proj, key)
+            if cached is not False:
+                print("  Cached")
+                results[proj] = cached
+            else:
+                jobs.append((proj, fpaths, disease))
+                keys[proj] = key
         else:
             print(f"  No suitable data file found in {proj}")
+    
+    # Results come back in job order, so the merge is identical to a serial run
+    for (proj, fpaths, disease), (norm_df, meta) in zip(jobs, map_studies(process_project, jobs, args.workers)):
+        cache.save(proj, keys[proj], norm_df, meta)
+        results[proj] = (norm_df, meta)
+        
+    for proj in projects:
+        norm_df, meta = results.get(proj, (None, None))
+        if norm_df is not None:
+            all_dfs.append(norm_df)
+            all_metadata.extend(meta)
+    
+    cache.flush()
 
     if not all_dfs:
         print("No valid miRNA data processed.")
@@ -220,15 +376,17 @@ def main():
 
     print("\nMerging all miRNA datasets...")
     # Outer join on index (miRNA IDs)
-    # Warning: miRNA IDs might be mismatched (hsa-miR-21 vs hsa-miR-21-5p)
-    # This simple merge assumes exact string match. Ideally we'd map to miRBase.
-    master_matrix = pd.concat(all_dfs, axis=1, join='outer')
+    # IDs are matched exactly; hsa-miR-21 vs hsa-miR-21-5p only line up when
+    # the miRBase alias table (MIRBASE_ALIASES) is available
+    master_matrix = merge_matrices(all_dfs, sparse=args.sparse)
     
     # Save Matrix
     matrix_path = os.path.join(OUTPUT_DIR, "merged_mirna_matrix_log2.csv")
-    master_matrix.to_csv(matrix_path)
+    write_csv(master_matrix, matrix_path)
     print(f"Saved Matrix: {matrix_path}")
     print(f"  Dimensions: {master_matrix.shape}")
+    if args.sparse:
+        print(f"  Density: {master_matrix.sparse.density:.1%} observed")
     
     # Save Metadata
     meta_df = pd.DataFrame(all_metadata)
@@ -236,6 +394,10 @@ def main():
     meta_df.to_csv(meta_path, index=False)
     print(f"Saved Metadata: {meta_path}")
     print(f"  Samples: {len(meta_df)}")
+    
+    # Columnar copy (float32, metadata embedded) for fast partial loads
+    parquet_path = save_matrix(master_matrix, meta_df, os.path.join(OUTPUT_DIR, "merged_mirna_matrix_log2.parquet"))
+    print(f"Saved Parquet: {parquet_path}")
     print("\nSample Counts by Condition:")
     print(meta_df['Condition'].value_counts().to_markdown())
 
@@ -1,8 +1,12 @@
 import pandas as pd
-import requests
-import time
 import os
 import re
+import io
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+import http_cache
+from endpoints import EUTILS_BASE
+from disease_labels import infer_disease
 
 # Configuration
 PRIDE_CSV = "candidate_papers_enriched.csv"
@@ -10,8 +14,10 @@ GEO_CSV = "geo_mirna_candidates_enriched.csv"
 OUTPUT_PRIDE = "candidate_papers_final.csv"
 OUTPUT_GEO = "geo_mirna_candidates_final.csv"
 
-NCBI_API_KEY = "" # Leave empty or add if available
-EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+NCBI_API_KEY = os.environ.get("NCBI_API_KEY", "") # Leave empty or add if available (also raises the rate limit)
+
+SEARCH_WORKERS = 4
+EFETCH_BATCH = 200 # PMIDs per efetch call
 
 def search_pubmed_id(title):
     """Search PubMed for a paper title to get the PMID."""
@@ -24,7 +30,7 @@ def search_pubmed_id(title):
         "api_key": NCBI_API_KEY
     }
     try:
-        r = requests.get(url, params=params)
+        r = http_cache.get(url, params=params)
         data = r.json()
         ids = data.get("esearchresult", {}).get("idlist", [])
         if ids:
@@ -33,77 +39,65 @@ def search_pubmed_id(title):
         pass
     return None
 
+def resolve_pmids(titles):
+    """Resolve many titles to PMIDs concurrently (order preserved), paced by the E-utilities rate limit."""
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as pool:
+        return list(pool.map(search_pubmed_id, titles))
+
+def parse_abstracts(xml_bytes):
+    """
+    Stream-parse a PubmedArticleSet and return {PMID: abstract}.
+    Elements are cleared as soon as each article is read.
+    """
+    abstracts = {}
+    pmid = None
+    parts = []
+    for event, elem in ET.iterparse(io.BytesIO(xml_bytes), events=("start", "end")):
+        if event == "start":
+            if elem.tag == "PubmedArticle":
+                pmid = None
+                parts = []
+            continue
+        if elem.tag == "PMID" and pmid is None:
+            # First PMID in the article is its own (later ones are comments/corrections)
+            pmid = (elem.text or "").strip()
+        elif elem.tag == "AbstractText":
+            parts.append("".join(elem.itertext()).strip())
+        elif elem.tag == "PubmedArticle":
+            if pmid:
+                abstracts[pmid] = " ".join(p for p in parts if p)
+            elem.clear()
+    return abstracts
+
+def fetch_abstracts(pmids):
+    """Fetch abstracts for many PMIDs, EFETCH_BATCH per efetch call. Returns {PMID: abstract}."""
+    pmids = sorted(set(p for p in pmids if p))
+    url = f"{EUTILS_BASE}/efetch.fcgi"
+    abstracts = {}
+    for i in range(0, len(pmids), EFETCH_BATCH):
+        chunk = pmids[i:i+EFETCH_BATCH]
+        params = {
+            "db": "pubmed",
+            "id": ",".join(chunk),
+            "retmode": "xml",
+            "api_key": NCBI_API_KEY
+        }
+        try:
+            r = http_cache.get(url, params=params)
+            r.raise_for_status()
+            abstracts.update(parse_abstracts(r.content))
+        except Exception as e:
+            print(f"  Error fetching abstracts {i+1}-{i+len(chunk)}: {e}")
+    return abstracts
+
 def fetch_abstract(pmid):
     """Fetch abstract text for a PMID."""
     if not pmid: return ""
-    
-    url = f"{EUTILS_BASE}/efetch.fcgi"
-    params = {
-        "db": "pubmed",
-        "id": pmid,
-        "retmode": "xml",
-        "api_key": NCBI_API_KEY
-    }
-    try:
-        r = requests.get(url, params=params)
-        text = r.text
-        # Simple regex extract for AbstractText
-        # <AbstractText>...</AbstractText>
-        matches = re.findall(r'<AbstractText.*?>(.*?)</AbstractText>', text, re.DOTALL)
-        if matches:
-            return " ".join(matches)
-    except:
-        pass
-    return ""
+    return fetch_abstracts([pmid]).get(pmid, "")
 
 def infer_disease_from_text(text):
-    """Expanded disease inference logic."""
-    t = str(text).lower()
-    
-    # Mapping rules (Priority order)
-    rules = [
-        ("Alzheimer", "Alzheimer's Disease"),
-        ("Parkinson", "Parkinson's Disease"),
-        ("Amyotrophic lateral sclerosis", "ALS"),
-        ("ALS", "ALS"),
-        ("Multiple Sclerosis", "Multiple Sclerosis"),
-        ("Schizophrenia", "Schizophrenia"),
-        ("Glioblastoma", "Glioblastoma"),
-        ("Ovarian Cancer", "Ovarian Cancer"),
-        ("Ovarian carcinoma", "Ovarian Cancer"),
-        ("Pancreatic Cancer", "Pancreatic Cancer"),
-        ("Pancreatic ductal adenocarcinoma", "Pancreatic Cancer"),
-        ("Breast Cancer", "Breast Cancer"),
-        ("Triple-negative breast cancer", "Breast Cancer (TNBC)"),
-        ("Lung Cancer", "Lung Cancer"),
-        ("NSCLC", "Lung Cancer"),
-        ("Lung adenocarcinoma", "Lung Cancer"),
-        ("Liver Cancer", "Liver Cancer"),
-        ("Hepatocellular carcinoma", "Liver Cancer"),
-        ("HCC", "Liver Cancer"),
-        ("Gastric Cancer", "Gastric Cancer"),
-        ("Colorectal Cancer", "Colorectal Cancer"),
-        ("Prostate Cancer", "Prostate Cancer"),
-        ("Melanoma", "Melanoma"),
-        ("COVID-19", "COVID-19"),
-        ("SARS-CoV-2", "COVID-19"),
-        ("Sepsis", "Sepsis"),
-        ("Myocardial infarction", "Heart Disease"),
-        ("Thrombocytopenia", "Thrombocytopenia"),
-        ("Eosinophilic esophagitis", "Eosinophilic Esophagitis"),
-        ("Tuberculosis", "Tuberculosis"),
-        ("Diabetes", "Diabetes"),
-        ("Rheumatoid Arthritis", "Rheumatoid Arthritis")
-    ]
-    
-    for keyword, label in rules:
-        if keyword.lower() in t:
-            return label
-            
-    if "cancer" in t or "tumor" in t or "carcinoma" in t:
-        return "Cancer (Unspecified)"
-        
-    return ""
+    """Expanded disease inference logic (priority order lives in disease_ontology.json)."""
+    return infer_disease(text)
 
 def process_csv(input_file, output_file, id_col):
     if not os.path.exists(input_file):
@@ -113,22 +107,29 @@ def process_csv(input_file, output_file, id_col):
     df = pd.read_csv(input_file)
     print(f"\nProcessing {input_file} ({len(df)} rows)...")
     
-    abstracts = []
-    new_labels = []
-    
-    for index, row in df.iterrows():
-        title = row.get('Title', '')
+    # 1. Decide which rows need a lookup
+    existing_labels = []
+    pending = [] # row positions that need PubMed
+    for pos, (index, row) in enumerate(df.iterrows()):
         existing_label = row.get('Inferred_Disease', '') if 'Inferred_Disease' in row else row.get('Enriched_Disease', '')
+        existing_labels.append(existing_label)
         
         # Skip if we already have a specific label (not just "Cancer (Unspecified)" or empty)
         if existing_label and "Unspecified" not in str(existing_label) and "Unknown" not in str(existing_label):
-            abstracts.append("Skipped (Label exists)")
-            new_labels.append(existing_label)
             continue
-            
-        print(f"  Fetching info for: {title[:30]}...")
-        pmid = search_pubmed_id(title)
-        abstract = fetch_abstract(pmid)
+        pending.append(pos)
+        
+    # 2. Resolve titles -> PMIDs concurrently, then fetch abstracts in batches
+    titles = [str(df['Title'].iloc[pos]) if 'Title' in df.columns else '' for pos in pending]
+    print(f"  Resolving {len(titles)} titles on PubMed...")
+    pmids = resolve_pmids(titles)
+    abstract_map = fetch_abstracts(pmids)
+    
+    # 3. Infer labels
+    abstracts = ["Skipped (Label exists)"] * len(df)
+    new_labels = list(existing_labels)
+    for pos, title, pmid in zip(pending, titles, pmids):
+        abstract = abstract_map.get(pmid, "") if pmid else ""
         
         # Infer from Abstract
         inferred = infer_disease_from_text(abstract)
@@ -137,10 +138,8 @@ def process_csv(input_file, output_file, id_col):
         if not inferred:
             inferred = infer_disease_from_text(title)
             
-        abstracts.append(abstract[:100] + "..." if abstract else "")
-        new_labels.append(inferred if inferred else existing_label)
-        
-        time.sleep(0.5) # Rate limit
+        abstracts[pos] = abstract[:100] + "..." if abstract else ""
+        new_labels[pos] = inferred if inferred else existing_labels[pos]
         
     df['Abstract_Snippet'] = abstracts
     df['Final_Disease_Label'] = new_labels
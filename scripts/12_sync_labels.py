@@ -8,6 +8,49 @@ MIRNA_META = "analysis_results/mirna/merged_mirna_metadata.csv"
 PROT_LABELS = "candidate_papers_final.csv"
 MIRNA_LABELS = "geo_mirna_candidates_final.csv"
 
+# Optional sample-level groups (SampleID -> Disease/Control) per accession
+INFERRED_META = "analysis_results/{acc}/inferred_metadata.csv"
+GENERIC_CONDITIONS = ["case", "case (unknown disease)", "cancer (unspecified)", "unknown"]
+
+def load_sample_groups(accessions):
+    """
+    Read each accession's inferred_metadata.csv once.
+    Returns one frame of (Accession, SampleID, Group); later rows win on duplicates.
+    """
+    frames = []
+    for acc in accessions:
+        path = INFERRED_META.format(acc=acc)
+        if not os.path.exists(path):
+            continue
+        try:
+            groups = pd.read_csv(path, usecols=['SampleID', 'Group'], dtype=str)
+        except Exception as e:
+            # print(f"Error reading {path}: {e}")
+            continue
+        groups.insert(0, 'Accession', acc)
+        frames.append(groups)
+        
+    if not frames:
+        return pd.DataFrame(columns=['Accession', 'SampleID', 'Group'])
+    groups = pd.concat(frames, ignore_index=True).dropna(subset=['SampleID', 'Group'])
+    return groups.drop_duplicates(['Accession', 'SampleID'], keep='last')
+
+def resolve_sample_groups(meta_df, groups):
+    """
+    Group for every metadata row: exact SampleID match within the accession,
+    else the ID with its last '_suffix' stripped (e.g. EV1_1 -> EV1).
+    """
+    sample_ids = meta_df['Original_Sample_ID'].astype(str)
+    base_ids = sample_ids.str.rsplit('_', n=1).str[0].where(sample_ids.str.contains('_', regex=False))
+    
+    def lookup(ids):
+        keys = pd.DataFrame({'Accession': meta_df['Accession'].values, 'SampleID': ids.values})
+        return keys.merge(groups, on=['Accession', 'SampleID'], how='left')['Group'].values
+        
+    direct = pd.Series(lookup(sample_ids), index=meta_df.index)
+    fallback = pd.Series(lookup(base_ids), index=meta_df.index)
+    return direct.fillna(fallback)
+
 def update_metadata(meta_path, label_path, id_col, label_col):
     if not os.path.exists(meta_path) or not os.path.exists(label_path):
         print(f"Skipping {meta_path} (Files missing)")
@@ -24,50 +67,22 @@ def update_metadata(meta_path, label_path, id_col, label_col):
     # Logic: If we have a better label in label_map, use it.
     # But respect 'Healthy Control' labels from the sample level.
     
-    new_conditions = []
-    for index, row in meta_df.iterrows():
-        acc = row['Accession']
-        current_cond = row['Condition']
-        sample_id = row['Original_Sample_ID']
-        
-        # Check for sample-level inferred metadata
-        inferred_meta_path = f"analysis_results/{acc}/inferred_metadata.csv"
-        if os.path.exists(inferred_meta_path):
-            try:
-                # Load on demand (or cache it for performance if list is huge)
-                sample_map = pd.read_csv(inferred_meta_path).set_index('SampleID')['Group'].to_dict()
-                
-                mapped_group = None
-                if sample_id in sample_map:
-                    mapped_group = sample_map[sample_id]
-                elif "_" in sample_id:
-                    # Try stripping suffix (e.g. EV1_1 -> EV1)
-                    base_id = sample_id.rsplit('_', 1)[0]
-                    if base_id in sample_map:
-                        mapped_group = sample_map[base_id]
-                        
-                if mapped_group:
-                    # Map "Disease" to the specific label, "Control" to "Healthy Control"
-                    if mapped_group.lower() == "disease":
-                        current_cond = "Case" # Let downstream logic pick the specific disease name
-                    elif mapped_group.lower() == "control":
-                        current_cond = "Healthy Control"
-            except Exception as e:
-                # print(f"Error reading {inferred_meta_path}: {e}")
-                pass
-        
-        better_label = label_map.get(acc, "")
-        
-        if str(current_cond).lower() in ["case", "case (unknown disease)", "cancer (unspecified)", "unknown"]:
-            if pd.notna(better_label) and better_label:
-                new_conditions.append(better_label)
-            else:
-                new_conditions.append(current_cond)
-        elif "control" in str(current_cond).lower():
-            new_conditions.append("Healthy Control")
-        else:
-            # Keep existing specific label
-            new_conditions.append(current_cond)
+    # 1. Sample-level groups: "Disease" -> "Case" (downstream picks the specific
+    #    disease name), "Control" -> "Healthy Control"
+    groups = load_sample_groups(meta_df['Accession'].unique())
+    group = resolve_sample_groups(meta_df, groups).str.lower()
+    current = meta_df['Condition'].mask(group == "disease", "Case")
+    current = current.mask(group == "control", "Healthy Control")
+    
+    # 2. Study-level labels replace generic conditions; control stays control
+    better_label = meta_df['Accession'].map(label_map)
+    has_better = better_label.notna() & (better_label.astype(str) != "")
+    current_lower = current.astype(str).str.lower()
+    is_generic = current_lower.isin(GENERIC_CONDITIONS)
+    is_control = ~is_generic & current_lower.str.contains("control", regex=False)
+    
+    new_conditions = current.where(~(is_generic & has_better), better_label)
+    new_conditions = new_conditions.mask(is_control, "Healthy Control")
             
     meta_df['Refined_Condition'] = new_conditions
     
@@ -0,0 +1,259 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import importlib
+import contextlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Benchmarks never write to the pipeline's event log (set before the pipeline modules load instrument)
+os.environ["EVDX_EVENTS"] = ""
+
+import table_sniff
+from synthetic import make_protein_groups, make_count_matrix
+from matrix_store import merge_matrices, save_matrix, write_csv
+
+proteomics = importlib.import_module("09_normalize_proteins")
+mirna = importlib.import_module("10_normalize_mirna")
+
+# Configuration
+FIXTURE_DIR = os.path.join(tempfile.gettempdir(), "evdx_benchmark")  # Reused across runs (generation is deterministic)
+DEFAULT_THRESHOLD = 0.25   # Fail when a stage is 25% slower or hungrier than the baseline
+MIN_DELTA_SECONDS = 0.05   # ...and the difference is above timer noise
+MIN_DELTA_MB = 2.0
+STUDY_DISEASE = "Colorectal Cancer"
+
+# features x samples per study x studies. "large" is 20,000 samples per suite.
+SCALES = {
+    "smoke":  {"features": 500,  "samples": 6,   "studies": 3,  "formats": "tsv,csv.gz,xlsx"},
+    "small":  {"features": 3000, "samples": 40,  "studies": 6,  "formats": "tsv,csv.gz,xlsx"},
+    "medium": {"features": 5000, "samples": 200, "studies": 20, "formats": "tsv,csv.gz,xlsx"},
+    "large":  {"features": 8000, "samples": 500, "studies": 40, "formats": "tsv,csv.gz"},
+}
+
+# --- Fixtures ---
+
+def build_fixtures(root, features, samples, studies, formats, seed=1):
+    """
+    Write (or reuse) one folder per study for each suite. Returns
+    {"proteomics": [folders], "mirna": [file paths]}.
+    """
+    tag = f"f{features}_s{samples}_n{studies}_seed{seed}"
+    base = os.path.join(root, tag)
+    done_marker = os.path.join(base, ".complete-" + "-".join(formats))
+    fixtures = {"proteomics": [], "mirna": []}
+    for k in range(studies):
+        folder = os.path.join(base, "proteomics", f"PXD9{k:05d}")
+        fixtures["proteomics"].append(folder)
+        fmt = formats[k % len(formats)]
+        gse = f"GSE9{k:05d}"
+        fixtures["mirna"].append(os.path.join(base, "mirna", gse, f"{gse}_counts.{fmt}"))
+    if os.path.exists(done_marker):
+        return fixtures
+
+    print(f"Generating fixtures in {base} ...")
+    for k, (folder, count_path) in enumerate(zip(fixtures["proteomics"], fixtures["mirna"])):
+        os.makedirs(folder, exist_ok=True)
+        os.makedirs(os.path.dirname(count_path), exist_ok=True)
+        make_protein_groups(os.path.join(folder, "proteinGroups.txt"), features, samples, seed * 1000 + k)
+        make_count_matrix(count_path, features, samples, seed * 1000 + k, count_path.rsplit("_counts.", 1)[1])
+    open(done_marker, "w").close()
+    return fixtures
+
+# --- Measurement ---
+
+def reset_caches():
+    """Per-file memo tables would make every repeat after the first a cache hit."""
+    table_sniff._sniffed.clear()
+    mirna._id_cache.clear()
+
+def measure(func, repeat=1, memory=True):
+    """
+    Best-of-repeat wall time of func(), then (memory=True) one more call under
+    tracemalloc for its peak Python/NumPy allocation. Pipeline output is muted.
+    Returns (result, seconds, peak_mb or None).
+    """
+    best, result = None, None
+    for _ in range(max(1, repeat)):
+        reset_caches()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak_mb = None
+    if memory:
+        reset_caches()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024**2
+        finally:
+            tracemalloc.stop()
+    return result, best, peak_mb
+
+def _stage(results, name, seconds, peak_mb, samples, input_bytes=None):
+    entry = {"seconds": round(seconds, 4), "samples_per_s": round(samples / seconds, 1) if seconds else None,
+             "peak_mb": round(peak_mb, 1) if peak_mb is not None else None}
+    if input_bytes is not None:
+        entry["mb_per_s"] = round(input_bytes / 1024**2 / seconds, 1) if seconds else None
+    results[name] = entry
+
+def _save_stages(results, suite, matrix, metadata, out_dir, repeat, memory):
+    samples = matrix.shape[1]
+    csv_path = os.path.join(out_dir, f"{suite}_matrix.csv")
+    parquet_path = os.path.join(out_dir, f"{suite}_matrix.parquet")
+    _, seconds, peak = measure(lambda: write_csv(matrix, csv_path), repeat, memory)
+    _stage(results, f"{suite}.save_csv", seconds, peak, samples)
+    _, seconds, peak = measure(lambda: save_matrix(matrix, metadata, parquet_path), repeat, memory)
+    _stage(results, f"{suite}.save_parquet", seconds, peak, samples)
+
+def bench_proteomics(folders, out_dir, repeat=1, memory=True, sparse=False):
+    """
+    load: header sniff plus the filtered group-sum read of every proteinGroups.txt;
+    normalize: process_maxquant_file() end to end (it reads the file itself);
+    merge: merge_matrices(); save: CSV and Parquet writers.
+    """
+    results = {}
+    paths = [os.path.join(f, "proteinGroups.txt") for f in folders]
+    input_bytes = sum(os.path.getsize(p) for p in paths)
+
+    def load():
+        sums = []
+        for path in paths:
+            gene_col, protein_col, flag_cols, lfq_cols = proteomics.select_columns(proteomics.sniff_header(path))
+            sums.extend(proteomics.sum_by_feature(path, gene_col, protein_col, flag_cols, lfq_cols))
+        return sums
+
+    sums, seconds, peak = measure(load, repeat, memory)
+    n_samples = sum(s.shape[1] for s in sums)
+    _stage(results, "proteomics.load", seconds, peak, n_samples, input_bytes)
+
+    def normalize():
+        return [proteomics.process_maxquant_file(os.path.basename(f), f, STUDY_DISEASE) for f in folders]
+
+    studies, seconds, peak = measure(normalize, repeat, memory)
+    _stage(results, "proteomics.normalize", seconds, peak, n_samples, input_bytes)
+    dfs = [df for df, _ in studies if df is not None]
+    metadata = pd.DataFrame([row for _, meta in studies if meta for row in meta])
+
+    matrix, seconds, peak = measure(lambda: merge_matrices(dfs, sparse=sparse), repeat, memory)
+    _stage(results, "proteomics.merge", seconds, peak, matrix.shape[1])
+    _save_stages(results, "proteomics", matrix, metadata, out_dir, repeat, memory)
+    return results
+
+def bench_mirna(paths, out_dir, repeat=1, memory=True, sparse=False):
+    """
+    load: sniff and parse every count matrix (load_count_matrix());
+    normalize: standardize_mirna_matrix() on the loaded frames;
+    merge: merge_matrices(); save: CSV and Parquet writers.
+    """
+    results = {}
+    input_bytes = sum(os.path.getsize(p) for p in paths)
+    accessions = [os.path.basename(os.path.dirname(p)) for p in paths]
+
+    raw, seconds, peak = measure(lambda: [mirna.load_count_matrix(p) for p in paths], repeat, memory)
+    n_samples = sum(df.shape[1] - 1 for df in raw)
+    _stage(results, "mirna.load", seconds, peak, n_samples, input_bytes)
+
+    def normalize():
+        return [mirna.standardize_mirna_matrix(df, acc, STUDY_DISEASE) for df, acc in zip(raw, accessions)]
+
+    studies, seconds, peak = measure(normalize, repeat, memory)
+    _stage(results, "mirna.normalize", seconds, peak, n_samples)
+    dfs = [df for df, _ in studies if df is not None]
+    metadata = pd.DataFrame([row for _, meta in studies if meta for row in meta])
+
+    matrix, seconds, peak = measure(lambda: merge_matrices(dfs, sparse=sparse), repeat, memory)
+    _stage(results, "mirna.merge", seconds, peak, matrix.shape[1])
+    _save_stages(results, "mirna", matrix, metadata, out_dir, repeat, memory)
+    return results
+
+# --- Baselines ---
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Stages whose time or peak memory grew beyond threshold (and above noise). Returns messages."""
+    regressions = []
+    for stage, now in current["results"].items():
+        before = baseline["results"].get(stage)
+        if before is None:
+            continue
+        for metric, floor in (("seconds", MIN_DELTA_SECONDS), ("peak_mb", MIN_DELTA_MB)):
+            old, new = before.get(metric), now.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append(f"{stage} {metric}: {old} -> {new} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+def print_results(results):
+    table = pd.DataFrame(results).T
+    print(table.to_string(na_rep="-"))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the normalizers on synthetic MaxQuant/GEO studies.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Preset size (overridden by the options below)")
+    parser.add_argument("--features", type=int, help="Rows per study")
+    parser.add_argument("--samples", type=int, help="Samples per study")
+    parser.add_argument("--studies", type=int, help="Studies per suite")
+    parser.add_argument("--formats", help="miRNA file formats cycled across studies (tsv,csv.gz,xlsx)")
+    parser.add_argument("--suite", choices=["all", "proteomics", "mirna"], default="all")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak measurement")
+    parser.add_argument("--sparse", action="store_true", help="Benchmark the sparse merge backend")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR, help="Where synthetic studies are generated and reused")
+    parser.add_argument("--save", metavar="JSON", help="Write the results (e.g. as the new baseline)")
+    parser.add_argument("--baseline", metavar="JSON", help="Fail if a stage regressed against these results")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown/growth as a fraction")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = dict(SCALES[args.scale])
+    for key in ("features", "samples", "studies", "formats"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    formats = params["formats"].split(",")
+    fixtures = build_fixtures(args.fixtures, params["features"], params["samples"], params["studies"], formats)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        if args.suite in ("all", "proteomics"):
+            results.update(bench_proteomics(fixtures["proteomics"], out_dir, args.repeat, not args.no_memory, args.sparse))
+        if args.suite in ("all", "mirna"):
+            results.update(bench_mirna(fixtures["mirna"], out_dir, args.repeat, not args.no_memory, args.sparse))
+
+    current = {"params": {**params, "sparse": args.sparse}, "results": results,
+               "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__}
+    print(f"\n{params['studies']} studies x {params['samples']} samples x {params['features']} features"
+          f" ({params['formats']}{', sparse' if args.sparse else ''}), best of {args.repeat}")
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(current, fh, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        if baseline.get("params") != current["params"]:
+            sys.exit(f"Baseline {args.baseline} was recorded with different parameters: {baseline.get('params')}")
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
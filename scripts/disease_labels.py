@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+
+# Configuration
+ONTOLOGY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "disease_ontology.json")
+RULE_FILES = [os.path.abspath(__file__), ONTOLOGY_FILE]  # For cache fingerprints of callers
+
+# A "word" here is a run of letters: digits, '_' and '-' all count as
+# boundaries, so 'pd' matches "PD_03" and "PD3" but 'als' never matches "signals"
+LEFT = r"(?<![a-z])"
+RIGHT = r"(?![a-z])"
+SEPARATOR = r"[\s_\-]*"
+
+def _synonym_pattern(synonym):
+    """'ovarian cancer*' -> ovarian[\\s_\\-]*cancer (any suffix); no '*' -> right boundary."""
+    prefix = synonym.endswith("*")
+    words = re.split(r"[\s_\-]+", synonym.rstrip("*").strip().lower())
+    body = SEPARATOR.join(re.escape(w) for w in words)
+    return body if prefix else body + RIGHT
+
+def _alternation(synonyms):
+    # Longest first, so 'lung adenocarcinoma' wins over 'lung' at the same position
+    patterns = sorted({_synonym_pattern(s) for s in synonyms}, key=len, reverse=True)
+    return LEFT + "(?:" + "|".join(patterns) + ")"
+
+class LabelMatcher:
+    """
+    All synonyms of an ontology section compiled into one alternation regex:
+    a single left-to-right scan per text, whatever the number of synonyms.
+    Entry order is priority order.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        groups = []
+        self.group_entry = {}
+        for i, entry in enumerate(entries):
+            name = f"e{i}"
+            groups.append(f"(?P<{name}>{_alternation(entry['synonyms'])})")
+            self.group_entry[name] = i
+        self.regex = re.compile("|".join(groups))
+        # Per-entry patterns for the vectorized path (label_series)
+        self.entry_regex = [re.compile(_alternation(e["synonyms"])) for e in entries]
+        self.context = [
+            re.compile(_alternation(e["context"])) if e.get("context") else None
+            for e in entries
+        ]
+
+    def matches(self, text):
+        """All (label, start, end) hits in text order, context rules applied."""
+        t = str(text).lower()
+        hits = []
+        for m in self.regex.finditer(t):
+            i = self.group_entry[m.lastgroup]
+            ctx = self.context[i]
+            if ctx is not None and not ctx.search(t):
+                continue
+            hits.append((self.entries[i]["label"], m.start(), m.end()))
+        return hits
+
+    def label(self, text, include_generic=True):
+        """Highest-priority label found in text, or "" if none."""
+        t = str(text).lower()
+        best = None
+        for m in self.regex.finditer(t):
+            i = self.group_entry[m.lastgroup]
+            if best is not None and i >= best:
+                continue
+            if not include_generic and self.entries[i].get("generic"):
+                continue
+            ctx = self.context[i]
+            if ctx is not None and not ctx.search(t):
+                continue
+            best = i
+        return self.entries[best]["label"] if best is not None else ""
+
+    def label_series(self, texts, include_generic=True):
+        """
+        label() for a whole Index/Series at once: one str.contains per entry,
+        then np.select keeps the highest-priority hit. Returns an object array
+        aligned with texts ("" where nothing matched).
+        """
+        t = pd.Series(pd.Index(texts).astype(str)).str.lower()
+        conditions, choices = [], []
+        for i, entry in enumerate(self.entries):
+            if not include_generic and entry.get("generic"):
+                continue
+            mask = t.str.contains(self.entry_regex[i])
+            if self.context[i] is not None:
+                mask &= t.str.contains(self.context[i])
+            conditions.append(mask.to_numpy(dtype=bool))
+            choices.append(entry["label"])
+        if not conditions:
+            return np.full(len(t), "", dtype=object)
+        return np.select(conditions, choices, default="").astype(object)
+
+_ontology = None
+_matchers = {}
+
+def load_ontology():
+    global _ontology
+    if _ontology is None:
+        with open(ONTOLOGY_FILE) as fh:
+            _ontology = json.load(fh)
+    return _ontology
+
+def get_matcher(section="diseases"):
+    """Compiled matcher for an ontology section (built once per process)."""
+    if section not in _matchers:
+        _matchers[section] = LabelMatcher(load_ontology()[section])
+    return _matchers[section]
+
+def infer_disease(text, include_generic=True):
+    """Standardized disease label for free text (titles, abstracts, GSM characteristics)."""
+    return get_matcher("diseases").label(text, include_generic)
+
+# Per-study sample-name rules: accession -> [(compiled regex, condition)].
+# Seeded from "study_rules" in the ontology; add_study_rule() plugs in more.
+_study_rules = None
+
+def study_rules(accession):
+    global _study_rules
+    if _study_rules is None:
+        _study_rules = {}
+        for acc, rules in load_ontology().get("study_rules", {}).items():
+            for rule in rules:
+                add_study_rule(acc, rule["pattern"], rule["label"])
+    return _study_rules.get(accession, [])
+
+def add_study_rule(accession, pattern, label):
+    """Condition for sample names of one study matching pattern ('Case' = the study disease)."""
+    if _study_rules is None:
+        study_rules(None)
+    _study_rules.setdefault(accession, []).append((re.compile(pattern), label))
+
+def classify_samples(names, study_disease="", accession=None, technical=False, unknown="Case"):
+    """
+    Condition for every sample name of one study in a single vectorized pass.
+    Priority: study rules, then Healthy Control keywords, then (technical=True)
+    pool/standard/reference samples. Case keywords and unmatched names get the
+    study disease, or `unknown` when the study has none.
+    Returns a list aligned with names.
+    """
+    names = pd.Series(pd.Index(names).astype(str))
+    lower = names.str.lower()
+    disease = unknown if pd.isna(study_disease) or study_disease == "" else study_disease
+    
+    conditions, choices = [], []
+    for regex, label in study_rules(accession):
+        conditions.append(lower.str.contains(regex).to_numpy(dtype=bool))
+        choices.append(label)
+    
+    keyword = get_matcher("sample_conditions").label_series(lower)
+    conditions.append(keyword == "Healthy Control")
+    choices.append("Healthy Control")
+    if technical:
+        conditions.append(get_matcher("technical_conditions").label_series(lower) != "")
+        choices.append("Technical Control")
+    
+    result = np.select(conditions, choices, default="Case").astype(object)
+    result[result == "Case"] = disease
+    return result.tolist()
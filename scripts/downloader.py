@@ -0,0 +1,183 @@
+import os
+import time
+import threading
+import requests
+import urllib.request
+import instrument
+import rate_limit
+import http_client
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Configuration
+MAX_WORKERS = 8        # Total concurrent transfers
+MAX_PER_HOST = 4       # Concurrent transfers against a single host
+MAX_RETRIES = 5        # Resumes after a transfer breaks mid-stream (HTTP errors: rate_limit)
+BACKOFF_BASE = 1.0     # Seconds; doubles on every resume
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+_host_locks = {}
+_host_locks_guard = threading.Lock()
+
+def _host_semaphore(url, per_host):
+    """One semaphore per host so a single server is never hammered."""
+    host = urlparse(url).netloc
+    with _host_locks_guard:
+        if host not in _host_locks:
+            _host_locks[host] = threading.BoundedSemaphore(per_host)
+        return _host_locks[host]
+
+class TransferInterrupted(IOError):
+    """The body broke off mid-stream; the .part file holds what arrived so far."""
+
+def normalize_url(url):
+    """Convert FTP links to HTTPS where the archive serves both (PRIDE, NCBI)."""
+    if url.startswith("ftp://ftp.pride.ebi.ac.uk") or url.startswith("ftp://ftp.ncbi.nlm.nih.gov"):
+        return url.replace("ftp://", "https://", 1)
+    return url
+
+def _validator(headers):
+    """If-Range value for a response: a strong ETag, else Last-Modified."""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+def _discard_partial(part_path):
+    for path in (part_path, part_path + ".validator"):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _fetch(url, local_path):
+    """
+    Stream url into local_path + '.part', resuming from an existing partial
+    file with an HTTP Range request guarded by If-Range, so a file that
+    changed upstream comes back whole instead of being spliced. The final
+    file only appears after an atomic rename, so an interrupted transfer
+    never looks complete.
+    Returns the response headers (for ETag/Last-Modified bookkeeping).
+    """
+    part_path = local_path + ".part"
+    validator_path = part_path + ".validator"  # Validator of the response the .part came from
+    if url.startswith("ftp://"):
+        # requests cannot speak FTP; no resume, but still atomic
+        try:
+            _, headers = urllib.request.urlretrieve(url, part_path)
+        except OSError as e:
+            raise TransferInterrupted(f"FTP transfer of {url} failed ({e})") from e
+        os.replace(part_path, local_path)
+        return dict(headers)
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = None
+    if offset and os.path.exists(validator_path):
+        with open(validator_path) as fh:
+            validator = fh.read().strip() or None
+    if offset and validator is None:
+        # Nothing proves the partial bytes belong to the current file
+        _discard_partial(part_path)
+        offset = 0
+    headers = dict(http_client.IDENTITY)
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+
+    with rate_limit.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+        if r.status_code == 416:
+            # Range not satisfiable: fine only if the .part is exactly the whole file
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            if offset and total.isdigit() and int(total) == offset:
+                os.replace(part_path, local_path)
+                os.remove(validator_path)
+                return dict(r.headers)
+            _discard_partial(part_path)
+            r.close()
+            return _fetch(url, local_path)
+        r.raise_for_status()
+
+        if offset and r.status_code == 206 and not r.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+            # A range we did not ask for: refetch the whole file
+            _discard_partial(part_path)
+            r.close()
+            return _fetch(url, local_path)
+        if offset and r.status_code != 206:
+            # Changed upstream (If-Range answered 200) or Range ignored; start over
+            offset = 0
+        mode = "ab" if offset else "wb"
+        if not offset:
+            with open(validator_path, "w") as fh:
+                fh.write(_validator(r.headers) or "")
+
+        try:
+            with open(part_path, mode) as fh:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        fh.write(chunk)
+        except requests.RequestException as e:
+            raise TransferInterrupted(f"Transfer of {url} broke off ({e})") from e
+
+        expected = r.headers.get("Content-Length")
+        if expected is not None and os.path.getsize(part_path) != offset + int(expected):
+            raise TransferInterrupted(f"Incomplete transfer for {url}")
+        headers = dict(r.headers)
+
+    os.replace(part_path, local_path)
+    os.remove(validator_path)
+    return headers
+
+def download_file(url, local_path, per_host=MAX_PER_HOST, retries=MAX_RETRIES, on_complete=None):
+    """
+    Download one file. Returns True on success. rate_limit retries HTTP
+    errors and failed connections; this loop only resumes transfers that
+    broke off mid-stream, from the .part offset with exponential backoff.
+    on_complete(url, local_path, headers) may reject the file by returning False.
+    """
+    url = normalize_url(url)
+    directory = os.path.dirname(local_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    sem = _host_semaphore(url, per_host)
+    # Downloads run in pool threads; tag them with the accession folder they land in
+    accession = os.path.basename(directory) or None
+    for attempt in range(retries + 1):
+        try:
+            with sem, instrument.span("download", url=url, accession=accession, attempt=attempt) as event:
+                headers = _fetch(url, local_path)
+                event["bytes"] = os.path.getsize(local_path)
+            if on_complete is not None and on_complete(url, local_path, headers) is False:
+                return False
+            print(f"Downloaded: {local_path}")
+            return True
+        except TransferInterrupted as e:
+            if attempt == retries:
+                print(f"Error downloading {url}: {e}")
+                return False
+            wait = BACKOFF_BASE * (2 ** attempt)
+            print(f"  Resume {attempt + 1}/{retries} for {os.path.basename(local_path)} in {wait:.0f}s ({e})")
+            time.sleep(wait)
+        except Exception as e:
+            print(f"Error downloading {url}: {e}")
+            return False
+
+def download_many(jobs, max_workers=MAX_WORKERS, per_host=MAX_PER_HOST, on_complete=None):
+    """
+    Download a list of (url, local_path) pairs concurrently.
+    Returns {local_path: success}.
+    """
+    results = {}
+    if not jobs:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(download_file, url, path, per_host, MAX_RETRIES, on_complete): path
+            for url, path in jobs
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    ok = sum(1 for v in results.values() if v)
+    print(f"Downloads finished: {ok}/{len(results)} succeeded.")
+    return results
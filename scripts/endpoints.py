@@ -0,0 +1,25 @@
+import os
+from urllib.parse import urlparse
+
+# Public service base URLs. Per run, EVDX_BASE_URL points every service at one
+# server that mirrors their paths (e.g. mock_services.py on localhost), and
+# EVDX_PRIDE_API / EVDX_EUTILS / EVDX_GEO_FILES override a single service.
+SERVICES = {
+    "PRIDE_API": "https://www.ebi.ac.uk/pride/ws/archive/v2",
+    "EUTILS": "https://eutils.ncbi.nlm.nih.gov/entrez/eutils",
+    "GEO_FILES": "https://ftp.ncbi.nlm.nih.gov/geo/series",
+}
+
+def service_url(name):
+    """Base URL of a service for this run (no trailing slash)."""
+    override = os.environ.get(f"EVDX_{name}")
+    if override:
+        return override.rstrip("/")
+    base = os.environ.get("EVDX_BASE_URL")
+    if base:
+        return base.rstrip("/") + urlparse(SERVICES[name]).path
+    return SERVICES[name]
+
+PRIDE_API_BASE = service_url("PRIDE_API")
+EUTILS_BASE = service_url("EUTILS")
+GEO_FILES_BASE = service_url("GEO_FILES")
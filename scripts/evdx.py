@@ -0,0 +1,300 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import instrument
+
+# Configuration
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)  # Scripts use paths relative to the repo root
+STATE_FILE = "raw_data/pipeline_state.json"
+LOG_DIR = "raw_data/pipeline_logs"
+MAX_PARALLEL = 2                              # The PRIDE and GEO chains
+
+# Non-Python files a helper module reads (part of its code fingerprint)
+CODE_DATA = {"disease_labels.py": ["disease_ontology.json"]}
+
+# The pipeline as a DAG: each stage declares the files/folders it reads and
+# writes; edges follow from an input lying at or under another stage's output.
+# "args" lists the run options forwarded to the stage (e.g. --workers).
+STAGES = [
+    {"name": "pride_scout", "script": "01_pride_scout.py",
+     "inputs": [], "outputs": ["pride_scout_results.csv"]},
+    {"name": "pride_candidates", "script": "generate_candidate_list.py",
+     "inputs": ["pride_scout_results.csv"], "outputs": ["candidate_papers_for_review.csv"]},
+    {"name": "pride_enrich", "script": "07_enrich_pride_metadata.py",
+     "inputs": ["candidate_papers_for_review.csv"], "outputs": ["candidate_papers_enriched.csv"]},
+    {"name": "pride_download", "script": "02_download_pride_data.py",
+     "inputs": ["candidate_papers_enriched.csv"], "outputs": ["raw_data/pride_downloads"]},
+    {"name": "proteomics_normalize", "script": "09_normalize_proteins.py", "args": ["workers", "sparse"],
+     "inputs": ["raw_data/pride_downloads", "candidate_papers_enriched.csv"],
+     "outputs": ["analysis_results/proteomics"]},
+    {"name": "geo_scout", "script": "05_geo_scout.py",
+     "inputs": [], "outputs": ["geo_mirna_candidates.csv"]},
+    {"name": "geo_enrich", "script": "06_enrich_geo_metadata.py",
+     "inputs": ["geo_mirna_candidates.csv"],
+     "outputs": ["geo_mirna_candidates_enriched.csv", "geo_sample_metadata.csv"]},
+    {"name": "geo_download", "script": "08_download_geo_data.py",
+     "inputs": ["geo_mirna_candidates_enriched.csv"], "outputs": ["raw_data/geo_downloads"]},
+    {"name": "mirna_normalize", "script": "10_normalize_mirna.py", "args": ["workers", "sparse"],
+     "inputs": ["raw_data/geo_downloads", "geo_mirna_candidates_enriched.csv"],
+     "outputs": ["analysis_results/mirna"]},
+    {"name": "pubmed_labels", "script": "11_fetch_pubmed_abstracts.py",
+     "inputs": ["candidate_papers_enriched.csv", "geo_mirna_candidates_enriched.csv"],
+     "outputs": ["candidate_papers_final.csv", "geo_mirna_candidates_final.csv"]},
+    # Rewrites the normalizers' metadata in place
+    {"name": "sync_labels", "script": "12_sync_labels.py",
+     "inputs": ["analysis_results/proteomics/merged_metadata.csv", "analysis_results/mirna/merged_mirna_metadata.csv",
+                "candidate_papers_final.csv", "geo_mirna_candidates_final.csv"],
+     "outputs": ["analysis_results/proteomics/merged_metadata.csv", "analysis_results/mirna/merged_mirna_metadata.csv"]},
+    {"name": "paper_list", "script": "generate_paper_list_doc.py",
+     "inputs": ["candidate_papers_final.csv", "geo_mirna_candidates_final.csv"],
+     "outputs": ["documentation/05_Selected_Papers.md"]},
+]
+
+def _within(path, parent):
+    return path == parent or path.startswith(parent.rstrip("/") + "/")
+
+def build_graph(stages=STAGES):
+    """{stage name: set of upstream stage names}."""
+    deps = {s["name"]: set() for s in stages}
+    for stage in stages:
+        for other in stages:
+            if other is stage:
+                continue
+            # A stage that rewrites a file in place (sync_labels) only depends on its producer
+            if any(_within(i, o) for i in stage["inputs"] for o in other["outputs"]):
+                deps[stage["name"]].add(other["name"])
+    return deps
+
+def code_files(script, seen=None):
+    """The script plus every local module it imports (recursively) and their data files."""
+    seen = seen if seen is not None else set()
+    if script in seen:
+        return seen
+    seen.add(script)
+    with open(os.path.join(SCRIPTS_DIR, script)) as fh:
+        source = fh.read()
+    for module in re.findall(r"^\s*(?:from|import)\s+(\w+)", source, flags=re.M):
+        if os.path.exists(os.path.join(SCRIPTS_DIR, module + ".py")):
+            code_files(module + ".py", seen)
+    seen.update(CODE_DATA.get(script, []))
+    return seen
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def path_fingerprint(path):
+    """
+    Content hash for a file; for a folder, a hash of every file's relative
+    path, size and mtime (stat only, so large download folders stay cheap).
+    Hidden files (manifests) and partial downloads are ignored.
+    """
+    if os.path.isfile(path):
+        return _hash_file(path)
+    if not os.path.isdir(path):
+        return None
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or name.endswith(('.part', '.part.validator')):
+                continue
+            st = os.stat(os.path.join(root, name))
+            h.update(f"{os.path.relpath(os.path.join(root, name), path)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+def stage_fingerprint(stage, options):
+    payload = {
+        "code": {f: _hash_file(os.path.join(SCRIPTS_DIR, f)) for f in sorted(code_files(stage["script"]))},
+        "inputs": {p: path_fingerprint(p) for p in stage["inputs"]},
+        # --workers does not change outputs, so only output-shaping options count
+        "args": [a for a in stage_args(stage, options) if a == "--sparse"],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def stage_args(stage, options):
+    args = []
+    if "workers" in stage.get("args", []) and options.workers > 1:
+        args += ["--workers", str(options.workers)]
+    if "sparse" in stage.get("args", []) and options.sparse:
+        args.append("--sparse")
+    return args
+
+def load_state():
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE) as fh:
+            return json.load(fh)
+    return {}
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(state, fh, indent=2, sort_keys=True)
+    os.replace(tmp, STATE_FILE)
+
+def stale_reason(stage, state, options):
+    """Why a stage must run, or None if it is up to date."""
+    if stage["name"] in options.force:
+        return "forced"
+    if any(not os.path.exists(p) for p in stage["outputs"]):
+        return "missing outputs"
+    recorded = state.get(stage["name"], {}).get("fingerprint")
+    if recorded is None:
+        return "never run"
+    if recorded != stage_fingerprint(stage, options):
+        return "inputs or code changed"
+    return None
+
+def select_stages(targets, deps):
+    """Targets plus everything upstream of them (all stages if no targets)."""
+    if not targets:
+        return set(deps)
+    unknown = [t for t in targets if t not in deps]
+    if unknown:
+        sys.exit(f"Unknown stage(s): {', '.join(unknown)}. Known: {', '.join(deps)}")
+    wanted, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in wanted:
+            wanted.add(name)
+            todo.extend(deps[name])
+    return wanted
+
+def run_stage(stage, options):
+    """
+    Run one script from the repo root, output to LOG_DIR/{stage}.log. Returns (ok, seconds).
+    Its events go to options.events_path, tagged with the stage and run; --profile wraps it in
+    cProfile/tracemalloc (reports in instrument.PROFILE_DIR).
+    """
+    os.makedirs(LOG_DIR, exist_ok=True)
+    script = os.path.join(SCRIPTS_DIR, stage["script"])
+    cmd = [sys.executable, script] + stage_args(stage, options)
+    if options.profile:
+        cmd = [sys.executable, os.path.join(SCRIPTS_DIR, "instrument.py"), "profile", options.profile] + cmd[1:]
+    env = dict(os.environ, EVDX_STAGE=stage["name"], EVDX_RUN_ID=options.run_id, EVDX_EVENTS=options.events_path)
+    start = time.time()
+    with open(os.path.join(LOG_DIR, f"{stage['name']}.log"), "w") as log:
+        result = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, env=env)
+    return result.returncode == 0, time.time() - start
+
+def run(options):
+    deps = build_graph()
+    by_name = {s["name"]: s for s in STAGES}
+    wanted = select_stages(options.targets, deps)
+    state = load_state()
+    options.run_id = time.strftime("%Y%m%dT%H%M%S")
+    # Events are on for pipeline runs (EVDX_EVENTS="" turns them off); older runs rotate out
+    options.events_path = os.environ.get("EVDX_EVENTS", instrument.DEFAULT_EVENTS_PATH)
+    if options.events_path and not options.dry_run:
+        instrument.rotate_events(options.events_path)
+
+    pending = [s["name"] for s in STAGES if s["name"] in wanted]  # Declaration order breaks ties
+    done, failed, skipped, ran = set(), set(), set(), []
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, options.jobs)) as pool:
+        while pending or running:
+            # Start every stage whose upstream stages have finished
+            for name in list(pending):
+                upstream = deps[name] & wanted
+                if upstream & (failed | skipped):
+                    print(f"[skip] {name}: upstream failed")
+                    pending.remove(name)
+                    skipped.add(name)
+                    continue
+                if not upstream <= done:
+                    continue
+                pending.remove(name)
+                stage = by_name[name]
+                reason = stale_reason(stage, state, options)
+                if reason is None and options.dry_run and upstream & set(ran):
+                    reason = "upstream will rerun"
+                if reason is None:
+                    print(f"[ok]   {name}: up to date")
+                    done.add(name)
+                    continue
+                if options.dry_run:
+                    print(f"[run]  {name}: {reason} (dry run)")
+                    done.add(name)
+                    ran.append(name)
+                    continue
+                print(f"[run]  {name}: {reason}")
+                running[pool.submit(run_stage, stage, options)] = name
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                ok, seconds = future.result()
+                if ok:
+                    # Fingerprint after the run, so in-place rewrites are not seen as changes
+                    state[name] = {"fingerprint": stage_fingerprint(by_name[name], options),
+                                   "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                   "seconds": round(seconds, 1)}
+                    save_state(state)
+                    done.add(name)
+                    ran.append(name)
+                    print(f"[done] {name} ({seconds:.1f}s)")
+                else:
+                    failed.add(name)
+                    print(f"[fail] {name}: see {LOG_DIR}/{name}.log")
+
+    verb = "would run" if options.dry_run else "ran"
+    print(f"\n{len(ran)} stage(s) {verb}, {len(failed)} failed, {len(skipped)} skipped, {len(done) - len(ran)} up to date.")
+    if ran and not options.dry_run and options.events_path:
+        print(f"Timing breakdown: python scripts/evdx.py report (events in {options.events_path})")
+    return 1 if failed else 0
+
+def status(options):
+    deps = build_graph()
+    state = load_state()
+    for stage in STAGES:
+        reason = stale_reason(stage, state, options) or "up to date"
+        upstream = ", ".join(sorted(deps[stage["name"]])) or "-"
+        print(f"{stage['name']:<22} {reason:<24} <- {upstream}")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="evdx", description="EVDx pipeline runner.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("run", "Run stale stages (and their upstream) in dependency order"),
+                            ("status", "Show which stages are stale and why")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--force", nargs="*", default=[], metavar="STAGE", help="Rerun these stages even if up to date (e.g. pride_scout geo_scout to refresh)")
+        p.add_argument("--workers", type=int, default=1, help="Forwarded to the normalizers")
+        p.add_argument("--sparse", action="store_true", help="Forwarded to the normalizers")
+        if name == "run":
+            p.add_argument("targets", nargs="*", help="Stages to bring up to date (default: all)")
+            p.add_argument("--jobs", type=int, default=MAX_PARALLEL, help="Independent stages run at once")
+            p.add_argument("--dry-run", action="store_true", help="List what would run")
+            p.add_argument("--profile", choices=["cpu", "mem"], help="Profile each stage with cProfile (cpu) or tracemalloc (mem)")
+    p = sub.add_parser("report", help="Where the last run spent its time (network vs. parsing, slowest accessions)")
+    p.add_argument("--top", type=int, default=10, help="Slowest accessions to list")
+    p.add_argument("--stage", help="Only this stage")
+    p.add_argument("--all-runs", action="store_true", help="Include every recorded run, not just the latest")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    options = parse_args(argv)
+    os.chdir(PROJECT_ROOT)
+    if options.command == "run":
+        return run(options)
+    if options.command == "report":
+        instrument.summarize(top=options.top, stage=options.stage, all_runs=options.all_runs)
+        return 0
+    return status(options)
+
+if __name__ == "__main__":
+    sys.exit(main())
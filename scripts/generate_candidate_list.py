@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from disease_labels import infer_disease as match_disease
 
 # Configuration
 PRIDE_RESULTS_FILE = "pride_scout_results.csv"
@@ -45,21 +46,7 @@ def generate_list():
     
     # Try to infer disease from title for convenience
     def infer_disease(title):
-        t = str(title).lower()
-        if "alzheimer" in t: return "Alzheimer's Disease"
-        if "ovarian" in t: return "Ovarian Cancer"
-        if "liver" in t or "hepatocellular" in t or "hcc" in t: return "Liver Cancer"
-        if "lung" in t: return "Lung Cancer"
-        if "covid" in t or "sars-cov-2" in t: return "COVID-19"
-        if "als" in t or "amyotrophic" in t: return "ALS"
-        if "parkinson" in t: return "Parkinson's Disease"
-        if "sepsis" in t or "septic" in t: return "Sepsis"
-        if "melanoma" in t: return "Melanoma"
-        if "gastric" in t: return "Gastric Cancer"
-        if "rheumatoid" in t: return "Rheumatoid Arthritis"
-        if "hiv" in t: return "HIV"
-        if "pancreatic" in t: return "Pancreatic Cancer"
-        return "Unknown (Check Title)"
+        return match_disease(title, include_generic=False) or "Unknown (Check Title)"
 
     review_list['Proposed_Disease_Label'] = review_list['Title'].apply(infer_disease)
     
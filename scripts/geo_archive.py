@@ -0,0 +1,259 @@
+import os
+import io
+import gzip
+import json
+import tarfile
+import pandas as pd
+import instrument
+import rate_limit
+import http_client
+from table_sniff import (sniff_bytes, head_frame, mirna_profile, sample_columns, sample_stem,
+                         join_samples, GZIP_MAGIC, MIN_MIRNA_FRACTION, SNIFF_BYTES)
+from manifest import load_manifest, head_remote, record_file
+
+# Configuration
+MEMBER_EXTENSIONS = ('.txt', '.tsv', '.csv')   # Optionally gzipped
+MAX_MEMBER_BYTES = 64 * 1024**2                # Per-GSM count tables are small; bigger members are raw data
+ARCHIVE_TIMEOUT = 60
+BLOCK = tarfile.BLOCKSIZE
+ASSEMBLED_SUFFIX = "_counts.tsv.gz"             # GSE1234_RAW.tar -> GSE1234_RAW_counts.tsv.gz
+
+class RangeUnsupported(Exception):
+    pass
+
+def assembled_name(archive_name):
+    base = os.path.basename(archive_name)
+    for ext in ('.tar.gz', '.tgz', '.tar'):
+        if base.lower().endswith(ext):
+            base = base[:-len(ext)]
+            break
+    return base + ASSEMBLED_SUFFIX
+
+def is_count_member(name, size):
+    """Per-sample table worth reading (by extension and size only)."""
+    base = os.path.basename(name).lower()
+    if base.endswith('.gz'):
+        base = base[:-3]
+    return base.endswith(MEMBER_EXTENSIONS) and 0 < size <= MAX_MEMBER_BYTES
+
+def _get_range(url, start, length):
+    with instrument.span("http", method="GET", url=url, range_start=start) as event:
+        r = rate_limit.get(url, headers={**http_client.IDENTITY, "Range": f"bytes={start}-{start + length - 1}"}, timeout=ARCHIVE_TIMEOUT)
+        event.update(status=r.status_code, bytes=len(r.content))
+    if r.status_code != 206:
+        raise RangeUnsupported(f"HTTP {r.status_code} for a Range request")
+    return r.content
+
+def _pax_path(data):
+    """'path' record of a PAX extended header ("<len> path=<name>\\n" records)."""
+    pos = 0
+    while pos < len(data):
+        length = int(data[pos:data.index(b" ", pos)])
+        key, _, value = data[data.index(b" ", pos) + 1:pos + length - 1].partition(b"=")
+        if key == b"path":
+            return value.decode("utf-8", errors="replace")
+        pos += length
+    return None
+
+def _padded(size):
+    return (size + BLOCK - 1) // BLOCK * BLOCK
+
+def iter_remote_members(url, want=is_count_member):
+    """
+    Yield (name, data) for wanted members of an uncompressed remote tar by
+    hopping from header to header with Range requests: one 512-byte read per
+    skipped member, so large raw files inside the archive are never transferred.
+    The hops reuse pooled keep-alive connections (http_client).
+    Raises RangeUnsupported if the server does not honour Range.
+    """
+    offset = 0
+    header = _get_range(url, 0, BLOCK)
+    long_name = None
+    while len(header) == BLOCK and header != tarfile.NUL * BLOCK:
+        try:
+            info = tarfile.TarInfo.frombuf(header, tarfile.ENCODING, "surrogateescape")
+        except tarfile.HeaderError:
+            break
+        data_offset = offset + BLOCK
+        next_offset = data_offset + _padded(info.size)
+
+        if info.type in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE):
+            data = _get_range(url, data_offset, info.size)
+            if info.type == tarfile.GNUTYPE_LONGNAME:
+                long_name = data.rstrip(b"\0").decode("utf-8", errors="replace")
+            else:
+                long_name = _pax_path(data) or long_name
+            header = _get_range(url, next_offset, BLOCK)
+        elif info.isfile() and want(long_name or info.name, info.size):
+            # Member data and the next header in one request
+            chunk = _get_range(url, data_offset, _padded(info.size) + BLOCK)
+            yield long_name or info.name, chunk[:info.size]
+            header = chunk[_padded(info.size):]
+            long_name = None
+        else:
+            header = _get_range(url, next_offset, BLOCK)
+            long_name = None
+        offset = next_offset
+
+def iter_stream_members(fileobj, want=is_count_member):
+    """
+    Yield (name, data) for wanted members while streaming through a tar
+    (plain or compressed) once; other members are read past, never stored.
+    """
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if member.isfile() and want(member.name, member.size):
+                yield member.name, tar.extractfile(member).read()
+
+def _member_samples(name, data):
+    """Per-sample columns from one member, or None if it is not a miRNA count table."""
+    if data.startswith(GZIP_MAGIC):
+        data = gzip.decompress(data)
+    info = sniff_bytes(data[:SNIFF_BYTES], complete=len(data) <= SNIFF_BYTES)
+    n_numeric, frac = mirna_profile(head_frame(info))
+    if n_numeric == 0 or frac < MIN_MIRNA_FRACTION:
+        return None
+    with instrument.span("parse", path=name, bytes=len(data)) as event:
+        frame = instrument.frame_shape(event, pd.read_csv(io.BytesIO(data), sep=info["sep"],
+                                                          skiprows=info["header_row"], engine="c"))
+    return sample_columns(frame, sample_stem(name))
+
+def assemble_members(members):
+    """
+    Build one study matrix from (name, data) members. Only one member's raw
+    bytes are held at a time; what accumulates is its numeric columns.
+    Returns (matrix or None, number of members used).
+    """
+    parts = []
+    for name, data in members:
+        try:
+            part = _member_samples(name, data)
+        except Exception as e:
+            print(f"    Skipping member {name}: {e}")
+            continue
+        if part is not None:
+            parts.append(part)
+    if not parts:
+        return None, 0
+    return join_samples(parts), len(parts)
+
+def _write_matrix(matrix, out_path):
+    tmp = out_path + ".part"
+    matrix.to_csv(tmp, sep="\t", compression="gzip")
+    os.replace(tmp, out_path)
+
+def _no_counts_marker(project_dir, fname):
+    """Hidden sentinel for an archive known to hold no count tables."""
+    return os.path.join(project_dir, f".{assembled_name(fname)}.none")
+
+def _archive_stamp(path):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def _remote_stamp(remote):
+    """Marker text for a remote archive: its ETag/Last-Modified, or None without validators."""
+    validators = {key: remote[key] for key in ("etag", "last_modified") if remote.get(key) is not None}
+    return json.dumps(validators, sort_keys=True) if validators else None
+
+def _read_marker(marker):
+    if not os.path.exists(marker):
+        return None
+    with open(marker) as fh:
+        return fh.read().strip()
+
+def archive_is_current(project_dir, url, remote=None):
+    """
+    True if the archive is unchanged upstream (ETag/Last-Modified) since it
+    was either assembled into a matrix or found to hold no count tables.
+    `remote` is a head_remote() result the caller already has, if any.
+    """
+    fname = url.rsplit("/", 1)[-1]
+    out_name = assembled_name(fname)
+    out_path = os.path.join(project_dir, out_name)
+    marker = _read_marker(_no_counts_marker(project_dir, fname))
+    if marker is not None:
+        stamp = _remote_stamp(remote if remote is not None else head_remote(url))
+        return stamp is not None and stamp == marker
+    entry = load_manifest(project_dir).get(out_name)
+    if entry is None or not os.path.exists(out_path) or os.path.getsize(out_path) != entry.get("size"):
+        return False
+    if remote is None:
+        remote = head_remote(url)
+    for key in ("etag", "last_modified"):
+        if remote.get(key) is not None and entry.get(key) is not None and remote[key] != entry[key]:
+            return False
+    return True
+
+def extract_remote_archive(url, project_dir):
+    """
+    Assemble the count-like members of a remote GEO archive into
+    {name}_RAW_counts.tsv.gz without downloading or unpacking the archive.
+    Uses Range hops for plain .tar files, otherwise one streaming pass.
+    Returns the output path, or None if no member was a miRNA count table;
+    such archives get a marker with their validators, so archive_is_current()
+    skips them until they change upstream.
+    """
+    fname = url.rsplit("/", 1)[-1]
+    out_path = os.path.join(project_dir, assembled_name(fname))
+    marker = _no_counts_marker(project_dir, fname)
+    matrix, used = None, 0
+    stream = not fname.lower().endswith(".tar") # Compressed tars cannot be walked with Range
+    if not stream:
+        try:
+            matrix, used = assemble_members(iter_remote_members(url))
+        except RangeUnsupported:
+            print(f"  Range not supported for {fname}; streaming it once instead")
+            stream = True
+    if stream:
+        # The event covers transfer and parsing, which overlap in a streaming pass
+        with instrument.span("http", method="GET", url=url, streamed=True) as event, \
+                rate_limit.get(url, stream=True, timeout=ARCHIVE_TIMEOUT) as r:
+            event["status"] = r.status_code
+            r.raise_for_status()
+            r.raw.decode_content = True
+            matrix, used = assemble_members(iter_stream_members(r.raw))
+            event["bytes"] = r.raw.tell()
+    remote = head_remote(url)
+    if matrix is None:
+        print(f"  No miRNA count tables inside {fname}")
+        stamp = _remote_stamp(remote)
+        if stamp is not None:
+            with open(marker, "w") as fh:
+                fh.write(stamp)
+        return None
+    if os.path.exists(marker):
+        os.remove(marker)
+    _write_matrix(matrix, out_path)
+    record_file(project_dir, os.path.basename(out_path), url, remote)
+    print(f"  Assembled {used} samples from {fname} -> {os.path.basename(out_path)}")
+    return out_path
+
+def assemble_local_archives(project_dir):
+    """
+    Assemble any already-downloaded GEO tar archives in a folder (older runs,
+    or 08 --no-probe) that have no assembled matrix yet. Returns the new paths.
+    Archives without count tables get a marker (keyed on their size and
+    mtime) so later runs skip them until the file changes.
+    """
+    created = []
+    for fname in sorted(os.listdir(project_dir)):
+        if fname.startswith('.') or not fname.lower().endswith(('.tar', '.tar.gz', '.tgz')):
+            continue
+        out_path = os.path.join(project_dir, assembled_name(fname))
+        if os.path.exists(out_path):
+            continue
+        archive_path = os.path.join(project_dir, fname)
+        marker = _no_counts_marker(project_dir, fname)
+        if _read_marker(marker) == _archive_stamp(archive_path):
+            continue
+        with open(archive_path, "rb") as fh:
+            matrix, used = assemble_members(iter_stream_members(fh))
+        if matrix is not None:
+            _write_matrix(matrix, out_path)
+            print(f"  Assembled {used} samples from {fname}")
+            created.append(out_path)
+        else:
+            print(f"  No miRNA count tables inside {fname}")
+            with open(marker, "w") as fh:
+                fh.write(_archive_stamp(archive_path))
+    return created
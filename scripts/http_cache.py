@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import requests
+import instrument
+import rate_limit
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlencode
+
+# Configuration
+CACHE_PATH = os.environ.get("EVDX_HTTP_CACHE", "raw_data/http_cache.sqlite")
+MAX_CACHE_BYTES = int(os.environ.get("EVDX_HTTP_CACHE_MAX_MB", "512")) * 1024 * 1024
+OFFLINE = os.environ.get("EVDX_OFFLINE", "") not in ("", "0")  # Replay only, never touch the network
+DEFAULT_TTL = 24 * 3600
+
+# Per-endpoint TTLs in seconds (first matching URL fragment wins).
+# Search results move; published project/sample records and abstracts rarely do.
+ENDPOINT_TTLS = [
+    ("/search/projects", 24 * 3600),
+    ("/files", 7 * 24 * 3600),
+    ("/pride/ws/archive/v2/projects/", 7 * 24 * 3600),
+    ("esearch.fcgi", 24 * 3600),
+    ("esummary.fcgi", 30 * 24 * 3600),
+    ("efetch.fcgi", 30 * 24 * 3600),
+]
+
+# Params that never affect the response body and must not end up in the key
+IGNORED_PARAMS = {"api_key", "tool", "email"}
+
+class CacheMiss(requests.ConnectionError):
+    """Raised in offline mode when a request has never been recorded."""
+
+class CachedResponse:
+    """Minimal stand-in for requests.Response rebuilt from the cache."""
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} (cached) for url: {self.url}", response=self)
+
+_conn = None
+_lock = threading.Lock()
+
+def _db():
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(CACHE_PATH)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, body BLOB, "
+            "size INTEGER, stored_at REAL, accessed_at REAL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+        _conn.commit()
+    return _conn
+
+def cache_key(method, url, params=None):
+    """Key on method, URL and sorted params (credentials excluded)."""
+    items = sorted(
+        (str(k), str(v)) for k, v in (params or {}).items()
+        if k not in IGNORED_PARAMS and v not in (None, "")
+    )
+    raw = f"{method.upper()} {url}?{urlencode(items)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def ttl_for(url):
+    for fragment, ttl in ENDPOINT_TTLS:
+        if fragment in url:
+            return ttl
+    return DEFAULT_TTL
+
+def lookup(url, params=None, method="GET", ttl=None):
+    """Return a CachedResponse if a fresh entry exists (any entry when offline), else None."""
+    key = cache_key(method, url, params)
+    with _lock:
+        row = _db().execute(
+            "SELECT status, headers, body, stored_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, headers, body, stored_at = row
+        if not OFFLINE and time.time() - stored_at > (ttl if ttl is not None else ttl_for(url)):
+            return None
+        _db().execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        _db().commit()
+    return CachedResponse(url, status, json.loads(headers), body)
+
+def store(url, params, response, method="GET"):
+    """Persist a successful response and evict least-recently-used entries over budget."""
+    if response.status_code != 200:
+        return
+    key = cache_key(method, url, params)
+    body = response.content
+    headers = json.dumps({k: v for k, v in response.headers.items() if k.lower() in ("content-type", "etag", "last-modified")})
+    now = time.time()
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, url, response.status_code, headers, body, len(body), now, now),
+        )
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > MAX_CACHE_BYTES:
+            for old_key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                if total <= MAX_CACHE_BYTES:
+                    break
+                db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= size
+        db.commit()
+
+def get(url, params=None, ttl=None, **kwargs):
+    """
+    Drop-in for requests.get with an on-disk cache in front of it; misses go
+    out through the service's rate limiter (rate_limit.py).
+    Set EVDX_OFFLINE=1 to replay recorded responses without any network access.
+    """
+    cached = lookup(url, params, ttl=ttl)
+    if cached is not None:
+        instrument.record("http", method="GET", url=url, status=cached.status_code,
+                          bytes=len(cached.content), cached=True, wall_s=0.0)
+        return cached
+    if OFFLINE:
+        raise CacheMiss(f"Offline mode: no cached response for {url} {params or ''}")
+    with instrument.span("http", method="GET", url=url, cached=False) as event:
+        response = rate_limit.get(url, params=params, **kwargs)
+        event.update(status=response.status_code, bytes=len(response.content))
+    store(url, params, response)
+    return response
+
+def post(url, data=None, ttl=None, **kwargs):
+    """
+    post() twin of get() for E-utilities calls whose form body is too long
+    for a URL: keyed on the form fields, replayed offline like GETs.
+    """
+    cached = lookup(url, data, method="POST", ttl=ttl)
+    if cached is not None:
+        instrument.record("http", method="POST", url=url, status=cached.status_code,
+                          bytes=len(cached.content), cached=True, wall_s=0.0)
+        return cached
+    if OFFLINE:
+        raise CacheMiss(f"Offline mode: no cached response for POST {url}")
+    with instrument.span("http", method="POST", url=url, cached=False) as event:
+        response = rate_limit.post(url, data=data, **kwargs)
+        event.update(status=response.status_code, bytes=len(response.content))
+    store(url, data, response, method="POST")
+    return response
+
+async def aget(client, url, params=None, ttl=None, **kwargs):
+    """get() for coroutines, sending misses through an httpx.AsyncClient (http_client.async_client())."""
+    cached = lookup(url, params, ttl=ttl)
+    if cached is not None:
+        instrument.record("http", method="GET", url=url, status=cached.status_code,
+                          bytes=len(cached.content), cached=True, wall_s=0.0)
+        return cached
+    if OFFLINE:
+        raise CacheMiss(f"Offline mode: no cached response for {url} {params or ''}")
+    with instrument.span("http", method="GET", url=url, cached=False) as event:
+        response = await rate_limit.arequest(client, "GET", url, params=params, **kwargs)
+        event.update(status=response.status_code, bytes=len(response.content), http_version=response.http_version)
+    store(url, params, response)
+    return response
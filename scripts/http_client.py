@@ -0,0 +1,51 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # Async callers fall back to the sync pool in threads
+    httpx = None
+try:
+    import h2  # httpx needs it for HTTP/2
+    HTTP2 = httpx is not None
+except ImportError:
+    HTTP2 = False
+
+# Configuration
+POOL_CONNECTIONS = 8    # Hosts kept in the pool (PRIDE API/files, E-utilities, GEO files, ...)
+POOL_MAXSIZE = 16       # Keep-alive connections per host; >= the largest worker pool (8)
+HEADERS = {"Accept-Encoding": "gzip, deflate"}  # Keep-alive is the HTTP/1.1 default
+# Byte-exact transfers (Range requests, resumable downloads, size checks)
+# must see the file itself, not a gzip transfer encoding of it
+IDENTITY = {"Accept-Encoding": "identity"}
+
+_session = None
+_session_lock = threading.Lock()
+
+def session():
+    """
+    Process-wide requests.Session: one keep-alive pool per host, shared by
+    every thread (urllib3's pool is thread-safe), so repeated calls to the
+    same API skip the TCP+TLS handshake.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers.update(HEADERS)
+            _session = s
+        return _session
+
+def async_client():
+    """
+    httpx.AsyncClient multiplexing requests over HTTP/2 where the server
+    supports it (h2 installed), or None when httpx is not installed.
+    """
+    if httpx is None:
+        return None
+    limits = httpx.Limits(max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE)
+    return httpx.AsyncClient(http2=HTTP2, limits=limits, headers=HEADERS, follow_redirects=True)
@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import contextvars
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+# Configuration
+DEFAULT_EVENTS_PATH = "raw_data/pipeline_events.jsonl"
+EVENTS_PATH = os.environ.get("EVDX_EVENTS", "")  # Opt-in; evdx.py run sets it to DEFAULT_EVENTS_PATH
+KEEP_RUNS = 5  # evdx runs kept in the events file (rotate_events)
+PROFILE_DIR = "raw_data/profiles"
+STAGE = os.environ.get("EVDX_STAGE") or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+RUN_ID = os.environ.get("EVDX_RUN_ID")  # Set by evdx.py for every stage of one run
+NETWORK_KINDS = {"http", "download"}
+
+_accession = contextvars.ContextVar("evdx_accession", default=None)
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (MB), or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024**2 if sys.platform == "darwin" else 1024), 1)
+
+def emit(event):
+    """Append one event line. Single O_APPEND writes keep lines whole across worker processes."""
+    if not EVENTS_PATH:
+        return
+    event.setdefault("stage", STAGE)
+    event["run"] = RUN_ID
+    if event.get("accession") is None:
+        event["accession"] = _accession.get()
+    event["ts"] = round(time.time(), 3)
+    event["pid"] = os.getpid()
+    event["peak_rss_mb"] = peak_rss_mb()
+    line = (json.dumps(event, default=str) + "\n").encode("utf-8")
+    directory = os.path.dirname(EVENTS_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd = os.open(EVENTS_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def record(kind, **fields):
+    """One-off event (no timing), e.g. a cache hit."""
+    emit({"kind": kind, **fields})
+
+@contextmanager
+def span(kind, **fields):
+    """
+    Time a block and emit one event with its wall time. The yielded dict can
+    be filled in inside the block (bytes, rows, cols, status, ...).
+    Kinds: http, download, read, parse, groupby, concat, accession.
+    """
+    event = {"kind": kind, **fields}
+    start = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event["error"] = type(e).__name__
+        raise
+    finally:
+        event["wall_s"] = round(time.perf_counter() - start, 6)
+        emit(event)
+
+@contextmanager
+def accession_scope(accession):
+    """Tag every event inside with this accession and time the whole accession."""
+    token = _accession.set(accession)
+    try:
+        with span("accession", accession=accession) as event:
+            yield event
+    finally:
+        _accession.reset(token)
+
+def frame_shape(event, df):
+    """Store rows/cols of a DataFrame (or None) in an event."""
+    if df is not None:
+        event["rows"], event["cols"] = df.shape
+    return df
+
+# --- Reporting ---
+
+def rotate_events(path, keep_runs=KEEP_RUNS):
+    """
+    Trim the events file to its last keep_runs - 1 evdx runs before a new run
+    starts, so it never grows without bound. Events without a run id (a
+    script run on its own with EVDX_EVENTS set) are dropped as well.
+    """
+    if not path or not os.path.exists(path):
+        return
+    lines, runs = [], []
+    with open(path, "rb") as fh:
+        for line in fh:
+            try:
+                run = json.loads(line).get("run")
+            except ValueError:
+                continue  # Half-written line from an interrupted run
+            lines.append((run, line))
+            if run is not None and run not in runs:
+                runs.append(run)
+    keep = set(sorted(runs)[-(keep_runs - 1):]) if keep_runs > 1 else set()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.writelines(line for run, line in lines if run in keep)
+    os.replace(tmp, path)
+
+def load_events(path=EVENTS_PATH or DEFAULT_EVENTS_PATH):
+    import pandas as pd
+    if not path or not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_json(path, lines=True)
+
+def summarize(path=EVENTS_PATH or DEFAULT_EVENTS_PATH, top=10, stage=None, all_runs=False):
+    """
+    Print where time went: network vs. parse per stage and the top-N slowest
+    accessions. Only the latest evdx run is included unless all_runs is set.
+    """
+    events = load_events(path)
+    for col in ("bytes", "rows", "accession", "run"):
+        if col not in events.columns:
+            events[col] = None
+    if not all_runs and events["run"].notna().any():
+        latest = events["run"].dropna().max()
+        events = events[events["run"] == latest]
+        print(f"Run {latest}")
+    if stage:
+        events = events[events["stage"] == stage]
+    if events.empty:
+        print(f"No events in {path}.")
+        return
+
+    leaf = events[events["kind"] != "accession"].copy()
+    leaf["class"] = leaf["kind"].where(~leaf["kind"].isin(NETWORK_KINDS), "network")
+    leaf.loc[leaf["class"] != "network", "class"] = "compute/io"
+    by_stage = leaf.pivot_table(index="stage", columns="class", values="wall_s", aggfunc="sum", fill_value=0)
+    print("Wall time by stage (s):")
+    print(by_stage.round(2).to_string())
+
+    by_kind = leaf.groupby(["stage", "kind"]).agg(events=("wall_s", "size"), wall_s=("wall_s", "sum"),
+                                                  mb=("bytes", lambda b: b.fillna(0).sum() / 1024**2))
+    print("\nBy operation:")
+    print(by_kind.round(2).to_string())
+
+    accessions = events[events["kind"] == "accession"]
+    if accessions.empty:
+        return
+    slowest = (accessions.groupby(["stage", "accession"])
+               .agg(wall_s=("wall_s", "sum"), peak_rss_mb=("peak_rss_mb", "max"))
+               .sort_values("wall_s", ascending=False).head(top))
+    network = leaf[leaf["class"] == "network"].groupby(["stage", "accession"])["wall_s"].sum()
+    slowest["network_s"] = network.reindex(slowest.index).fillna(0)
+    mb = leaf.groupby(["stage", "accession"])["bytes"].sum() / 1024**2
+    slowest["mb"] = mb.reindex(slowest.index).fillna(0)
+    print(f"\nTop {top} slowest accessions:")
+    print(slowest.round(2).to_string())
+
+# --- Profiling ---
+
+def profile_script(mode, script, args, top=30):
+    """
+    Run a pipeline script under cProfile (mode "cpu") or tracemalloc ("mem")
+    and write the report to PROFILE_DIR/{stage}.(prof|cpu.txt|mem.txt).
+    """
+    global STAGE
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = os.path.splitext(os.path.basename(script))[0]
+    # Events belong to the profiled script (and its worker processes), not to "instrument"
+    STAGE = os.environ.setdefault("EVDX_STAGE", name)
+    sys.argv = [script] + list(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+
+    if mode == "cpu":
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(runpy.run_path, script, run_name="__main__")
+        finally:
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}.prof"))
+            with open(os.path.join(PROFILE_DIR, f"{name}.cpu.txt"), "w") as fh:
+                pstats.Stats(profiler, stream=fh).sort_stats("cumulative").print_stats(top)
+        return
+
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(os.path.join(PROFILE_DIR, f"{name}.mem.txt"), "w") as fh:
+            fh.write(f"Traced memory: current {current / 1024**2:.1f} MB, peak {peak / 1024**2:.1f} MB\n\n")
+            for stat in snapshot.statistics("lineno")[:top]:
+                fh.write(f"{stat}\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline profiling and event reports.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("profile", help="Run a script under cProfile (cpu) or tracemalloc (mem)")
+    p.add_argument("mode", choices=["cpu", "mem"])
+    p.add_argument("script")
+    p.add_argument("args", nargs=argparse.REMAINDER)
+    r = sub.add_parser("report", help="Summarize the event log")
+    r.add_argument("--top", type=int, default=10)
+    r.add_argument("--stage")
+    r.add_argument("--all-runs", action="store_true")
+    options = parser.parse_args(argv)
+    if options.command == "profile":
+        profile_script(options.mode, options.script, options.args)
+    else:
+        summarize(top=options.top, stage=options.stage, all_runs=options.all_runs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import instrument
+import rate_limit
+import http_client
+
+# Configuration
+MANIFEST_NAME = ".manifest.jsonl"  # One per accession folder; dot-prefixed so loaders skip it
+HASH_CHUNK = 1024 * 1024
+HEAD_TIMEOUT = 30
+
+_write_lock = threading.Lock()
+
+def manifest_path(project_dir):
+    return os.path.join(project_dir, MANIFEST_NAME)
+
+def load_manifest(project_dir):
+    """
+    Load {file_name: entry} for an accession folder.
+    The manifest is append-only JSONL; the last line for a file wins.
+    """
+    path = manifest_path(project_dir)
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path) as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Half-written line from an interrupted run
+            entries[entry["file_name"]] = entry
+    return entries
+
+def _append_entry(project_dir, entry):
+    with _write_lock:
+        with open(manifest_path(project_dir), "a") as fh:
+            fh.write(json.dumps(entry, sort_keys=True) + "\n")
+
+def file_digest(path, algorithm="sha256"):
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _algorithm_for(checksum):
+    """Guess the hash algorithm of an upstream checksum from its hex length."""
+    return {32: "md5", 40: "sha1", 64: "sha256"}.get(len(checksum or ""))
+
+def head_remote(url):
+    """HEAD a URL and return its validators (size, ETag, Last-Modified)."""
+    try:
+        with instrument.span("http", method="HEAD", url=url) as event:
+            r = rate_limit.head(url, headers=http_client.IDENTITY, allow_redirects=True, timeout=HEAD_TIMEOUT)
+            event["status"] = r.status_code
+        if r.status_code != 200:
+            return {}
+        size = r.headers.get("Content-Length")
+        return {
+            "size": int(size) if size is not None else None,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+    except Exception as e:
+        print(f"  HEAD failed for {url}: {e}")
+        return {}
+
+def _upstream_changed(entry, expected_size, expected_checksum, remote):
+    if expected_size is not None and entry.get("size") != expected_size:
+        return True
+    if expected_checksum and entry.get("upstream_checksum") not in (None, expected_checksum):
+        return True
+    for key in ("etag", "last_modified", "size"):
+        if remote.get(key) is not None and entry.get(key) is not None and remote[key] != entry[key]:
+            return True
+    return False
+
+def verify_local(local_path, expected_size=None, expected_checksum=None):
+    """Check a file on disk against upstream size and (optionally) checksum."""
+    if expected_size is not None and os.path.getsize(local_path) != expected_size:
+        return False
+    algorithm = _algorithm_for(expected_checksum)
+    if algorithm and file_digest(local_path, algorithm) != expected_checksum.lower():
+        return False
+    return True
+
+def needs_download(project_dir, file_name, url, expected_size=None, expected_checksum=None, remote=None):
+    """
+    Decide whether a file must be (re)fetched.
+    - Missing locally -> fetch.
+    - Known to the manifest -> compare against upstream metadata (PRIDE sizes and
+      checksums, or `remote`: validators from a head_remote() call the caller
+      already made); only a size stat is done locally, so verified files cost
+      no hashing.
+    - On disk but not in the manifest (older runs) -> verify once and adopt it.
+    """
+    local_path = os.path.join(project_dir, file_name)
+    if not os.path.exists(local_path):
+        return True
+
+    remote = remote or {}
+    if expected_size is None:
+        expected_size = remote.get("size")
+
+    entry = load_manifest(project_dir).get(file_name)
+    if entry is not None:
+        if _upstream_changed(entry, expected_size, expected_checksum, remote):
+            print(f"  Changed upstream: {file_name}")
+            return True
+        if os.path.getsize(local_path) != entry.get("size"):
+            print(f"  Corrupted (size mismatch): {file_name}")
+            return True
+        return False
+
+    if not verify_local(local_path, expected_size, expected_checksum):
+        print(f"  Corrupted (failed verification): {file_name}")
+        return True
+    record_file(project_dir, file_name, url, remote, expected_checksum)
+    return False
+
+def record_file(project_dir, file_name, url, headers=None, upstream_checksum=None):
+    """Append a verified entry (URL, size, validators, SHA-256) for a file on disk."""
+    headers = headers or {}
+    local_path = os.path.join(project_dir, file_name)
+    entry = {
+        "file_name": file_name,
+        "url": url,
+        "size": os.path.getsize(local_path),
+        "etag": headers.get("etag") or headers.get("ETag"),
+        "last_modified": headers.get("last_modified") or headers.get("Last-Modified"),
+        "sha256": file_digest(local_path),
+        "upstream_checksum": upstream_checksum,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    _append_entry(project_dir, entry)
+    return entry
+
+def record_download(url, local_path, headers, upstream_checksum=None):
+    """Callback for downloader.download_many: verify and record a finished transfer."""
+    project_dir, file_name = os.path.split(local_path)
+    algorithm = _algorithm_for(upstream_checksum)
+    if algorithm and file_digest(local_path, algorithm) != upstream_checksum.lower():
+        print(f"  Checksum mismatch after download: {file_name}")
+        os.remove(local_path)
+        return False
+    record_file(project_dir, file_name, url, headers, upstream_checksum)
+    return True
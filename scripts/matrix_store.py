@@ -0,0 +1,142 @@
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+import pyarrow.compute as pc
+import instrument
+
+# Configuration
+INDEX_COLUMN = "Feature_ID"
+METADATA_KEY = b"evdx.metadata"  # Sample metadata (JSON records) embedded in the schema
+
+# Sparse backend: only observed values are stored. The fill value is NaN
+# ("not measured"), so a measured 0.0 is kept explicitly and never confused
+# with a missing feature.
+SPARSE_DTYPE = pd.SparseDtype(np.float32, np.nan)
+
+def to_sparse(matrix):
+    return matrix.astype(SPARSE_DTYPE)
+
+def is_sparse(matrix):
+    return any(isinstance(dt, pd.SparseDtype) for dt in matrix.dtypes)
+
+def merge_matrices(dfs, sparse=False):
+    """
+    Outer-join per-study matrices on their feature index.
+    The dense path is the plain pd.concat; the sparse path aligns each study
+    to the same union index while keeping only its observed values.
+    """
+    with instrument.span("concat", parts=len(dfs), sparse=sparse) as event:
+        if not sparse:
+            return instrument.frame_shape(event, pd.concat(dfs, axis=1, join='outer'))
+
+        # Same row order as the dense outer concat
+        union = pd.concat([pd.DataFrame(index=df.index) for df in dfs], axis=1, join='outer').index
+        parts = [to_sparse(df).reindex(union).astype(SPARSE_DTYPE) for df in dfs]
+        return instrument.frame_shape(event, pd.concat(parts, axis=1))
+
+def write_csv(matrix, path, block_rows=2000):
+    """
+    CSV writer for either backend. Sparse matrices are densified one row
+    block at a time, which keeps memory bounded. The layout matches the
+    dense output, but values are float32 text: identical for the protein
+    matrix (float32 when dense too), shorter-precision for miRNA (float64).
+    """
+    if not is_sparse(matrix):
+        matrix.to_csv(path)
+        return path
+    with open(path, "w", newline="") as fh:
+        for start in range(0, max(len(matrix), 1), block_rows):
+            block = matrix.iloc[start:start + block_rows].sparse.to_dense()
+            block.to_csv(fh, header=(start == 0))
+    return path
+
+def _column_array(column):
+    """float32 Arrow array with NaN stored as null (missing), one column at a time."""
+    if isinstance(column.dtype, pd.SparseDtype):
+        column = column.sparse.to_dense()
+    return pa.array(column.to_numpy(dtype=np.float32, na_value=np.nan), from_pandas=True)
+
+def _to_table(matrix, metadata=None):
+    """
+    Features as rows, one float32 column per sample (sample-major on disk).
+    Missing values are written as Parquet nulls, so unobserved cells cost a bit each.
+    """
+    arrays = [pa.array(matrix.index.astype(str))]
+    arrays += [_column_array(matrix.iloc[:, j]) for j in range(matrix.shape[1])]
+    names = [INDEX_COLUMN] + [str(c) for c in matrix.columns]
+    table = pa.Table.from_arrays(arrays, names=names)
+    if metadata is not None:
+        schema_meta = dict(table.schema.metadata or {})
+        schema_meta[METADATA_KEY] = metadata.to_json(orient="records").encode("utf-8")
+        table = table.replace_schema_metadata(schema_meta)
+    return table
+
+def save_matrix(matrix, metadata, path):
+    """
+    Write a merged matrix as Parquet (.parquet) or Feather (.feather) with the
+    sample metadata embedded. Note: 12_sync_labels.py refines the CSV metadata
+    afterwards; the embedded copy is the normalize-time snapshot.
+    """
+    table = _to_table(matrix, metadata)
+    if path.endswith(".feather"):
+        feather.write_feather(table, path, compression="zstd")
+    else:
+        pq.write_table(table, path, compression="zstd")
+    return path
+
+def _schema(path):
+    if path.endswith(".feather"):
+        # Feather reads are memory-mapped, so this does not load the data
+        return feather.read_table(path, memory_map=True).schema
+    return pq.read_schema(path)
+
+def list_samples(path):
+    """Sample (column) names without reading any values."""
+    return [n for n in _schema(path).names if n != INDEX_COLUMN]
+
+def load_metadata(path):
+    """Embedded sample metadata as a DataFrame (empty if none was stored)."""
+    raw = (_schema(path).metadata or {}).get(METADATA_KEY)
+    if raw is None:
+        return pd.DataFrame()
+    return pd.DataFrame(json.loads(raw.decode("utf-8")))
+
+def load_matrix(path, samples=None, accessions=None, features=None, sparse=False):
+    """
+    Load a merged matrix, reading only the requested columns.
+    samples: Global_IDs to load; accessions: load every sample of these studies
+    (e.g. ["GSE174705"]); features: row IDs to keep. All None loads everything.
+    sparse=True returns NaN-filled sparse columns built one column at a time.
+    """
+    columns = None
+    if samples is not None or accessions is not None:
+        available = list_samples(path)
+        wanted = set(samples or [])
+        prefixes = tuple(f"{acc}_" for acc in (accessions or []))
+        columns = [INDEX_COLUMN] + [
+            c for c in available if c in wanted or (prefixes and c.startswith(prefixes))
+        ]
+
+    if path.endswith(".feather"):
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        if features is not None:
+            mask = pc.is_in(table[INDEX_COLUMN], value_set=pa.array([str(f) for f in features]))
+            table = table.filter(mask)
+    else:
+        filters = [(INDEX_COLUMN, "in", [str(f) for f in features])] if features is not None else None
+        table = pq.read_table(path, columns=columns, filters=filters)
+
+    if not sparse:
+        return table.to_pandas().set_index(INDEX_COLUMN)
+    
+    index = pd.Index(table[INDEX_COLUMN].to_pylist(), name=INDEX_COLUMN)
+    columns = {}
+    for name in table.column_names:
+        if name == INDEX_COLUMN:
+            continue
+        dense = table[name].to_numpy(zero_copy_only=False).astype(np.float32)
+        columns[name] = pd.arrays.SparseArray(dense, fill_value=np.nan, dtype=SPARSE_DTYPE)
+    return pd.DataFrame(columns, index=index)
@@ -0,0 +1,490 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+import collections
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+from requests.structures import CaseInsensitiveDict
+from xml.sax.saxutils import escape
+from endpoints import SERVICES
+from http_cache import cache_key
+from synthetic import make_protein_groups, make_count_matrix, make_raw_archive
+
+# Local stand-in for PRIDE, GEO E-utilities, the GEO suppl/ file tree and
+# PubMed, serving a deterministic synthetic world under the real URL paths:
+#   python scripts/mock_services.py --latency 0.05 --error-rate 0.01 --rate-limit 10
+#   EVDX_BASE_URL=http://127.0.0.1:8765 python scripts/01_pride_scout.py
+
+# Configuration
+DEFAULT_PORT = 8765
+DATA_DIR = os.path.join(tempfile.gettempdir(), "evdx_mock")  # Generated files, reused across runs
+PRIDE_PATH = urlparse(SERVICES["PRIDE_API"]).path   # /pride/ws/archive/v2
+EUTILS_PATH = urlparse(SERVICES["EUTILS"]).path     # /entrez/eutils
+GEO_PATH = urlparse(SERVICES["GEO_FILES"]).path     # /geo/series
+PRIDE_FILES_PATH = "/pride/data"                    # Where the file listings point
+STATS_PATH = "/_mock/stats"
+LAST_MODIFIED = formatdate(1700000000, usegmt=True)  # Fixed, so ETag/Last-Modified checks see no change
+
+DISEASES = ["colorectal cancer", "breast cancer", "Alzheimer's disease", "Parkinson's disease",
+            "sepsis", "pancreatic cancer", "COVID-19", "multiple sclerosis"]
+PRIDE_TITLES = ["{fluid} exosome proteomics in {disease}", "Plasma proteomics of extracellular vesicles in {disease}",
+                "Serum proteomics and microvesicle cargo in {disease}", "{fluid} extracellular vesicle proteome of {disease}"]
+GEO_TITLES = ["{fluid} exosomal miRNA profiling in {disease}", "Circulating extracellular vesicle microRNAs in {disease}"]
+
+def _words(text):
+    return " ".join(re.sub(r"[^\w\s]", "", text).lower().split())
+
+class World:
+    """
+    Deterministic synthetic catalogue: PRIDE projects with result files,
+    GEO series with sample records and supplementary files, and one PubMed
+    article per study (same title, abstract naming the disease).
+    Data files are generated on first use into data_dir.
+    """
+    def __init__(self, projects=40, series=30, samples=12, features=800, seed=1, data_dir=DATA_DIR):
+        self.samples = samples
+        self.features = features
+        self.seed = seed
+        self.data_dir = os.path.join(data_dir, f"f{features}_s{samples}_seed{seed}")
+        self.histories = {}
+        self.lock = threading.Lock()
+        self.file_locks = collections.defaultdict(threading.Lock)
+        rng = random.Random(seed)
+
+        self.projects = {}
+        for k in range(projects):
+            acc = f"PXD9{k:05d}"
+            disease = rng.choice(DISEASES)
+            fluid = "Cell culture" if rng.random() < 0.15 else rng.choice(["Plasma", "Serum"])
+            human = rng.random() > 0.1
+            self.projects[acc] = {
+                "accession": acc,
+                "title": rng.choice(PRIDE_TITLES).format(fluid=fluid, disease=disease),
+                "projectDescription": f"{fluid} extracellular vesicles (exosomes) from {disease} patients and healthy controls.",
+                "sampleProcessingProtocol": f"EVs were isolated from {fluid.lower()} by size-exclusion chromatography.",
+                "dataProcessingProtocol": "Raw files were processed with MaxQuant 1.6.17 (LFQ)." if rng.random() < 0.85 else "Processed with Proteome Discoverer.",
+                "organisms": [{"name": "Homo sapiens (Human)", "accession": "9606"} if human else {"name": "Mus musculus (Mouse)", "accession": "10090"}],
+                "diseases": [{"name": disease}] if rng.random() < 0.6 else [],
+                "keywords": ["extracellular vesicles", "liquid biopsy"],
+                "submissionDate": f"20{rng.randint(18, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "_has_results": rng.random() < 0.8,
+            }
+
+        self.series = {}       # GSE -> docsum
+        self.docsums = {}      # uid -> docsum (series and samples)
+        self.series_samples = {}
+        sample_uid = 300000000
+        for k in range(series):
+            gse = f"GSE9{k:05d}"
+            uid = str(200000000 + k)
+            disease = rng.choice(DISEASES)
+            fluid = rng.choice(["Plasma", "Serum"])
+            doc = {
+                "uid": uid, "accession": gse, "entrytype": "GSE", "gse": gse[3:],
+                "title": rng.choice(GEO_TITLES).format(fluid=fluid, disease=disease),
+                "summary": f"Small RNA sequencing of {fluid.lower()} exosomes from {disease} patients and healthy controls.",
+                "taxon": "Homo sapiens", "n_samples": samples,
+                "pdat": f"20{rng.randint(18, 25)}/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}",
+            }
+            self.series[gse] = doc
+            self.docsums[uid] = doc
+            uids = []
+            for j in range(samples):
+                sample_uid += 1
+                control = rng.random() < 0.4
+                self.docsums[str(sample_uid)] = {
+                    "uid": str(sample_uid), "accession": f"GSM9{k:04d}{j:03d}", "entrytype": "GSM", "gse": gse[3:],
+                    "title": f"{'HC' if control else 'Patient'}_{j + 1} {fluid.lower()} exosome",
+                    "summary": "healthy control" if control else f"diagnosis: {disease}",
+                    "taxon": "Homo sapiens",
+                }
+                uids.append(str(sample_uid))
+            self.series_samples[gse] = uids
+
+        self.articles = {}
+        for n, (title, text) in enumerate(
+                [(p["title"], p["projectDescription"]) for p in self.projects.values()] +
+                [(s["title"], s["summary"]) for s in self.series.values()]):
+            self.articles[str(39000000 + n)] = (title, f"Background: {text} Results: candidate biomarkers were identified.")
+        self.pmid_by_title = {_words(title): pmid for pmid, (title, _) in self.articles.items()}
+
+    # --- PRIDE ---
+
+    def search_projects(self, keyword, page, page_size):
+        keyword = keyword.lower()
+        hits = [p for p in self.projects.values() if keyword in f"{p['title']} {p['projectDescription']}".lower()]
+        return [self.project(p["accession"]) for p in hits[page * page_size:(page + 1) * page_size]]
+
+    def project(self, acc):
+        p = self.projects.get(acc)
+        return None if p is None else {k: v for k, v in p.items() if not k.startswith("_")}
+
+    def project_files(self, acc, base_url):
+        p = self.projects.get(acc)
+        if p is None:
+            return None
+        names = ["proteinGroups.txt", "experimentalDesignTemplate.txt"] if p["_has_results"] else []
+        names.append(f"{acc}_run01.raw")
+        files = []
+        for name in names:
+            path = self.data_file(f"{PRIDE_FILES_PATH}/{acc}/{name}")
+            with open(path, "rb") as fh:
+                checksum = hashlib.sha1(fh.read()).hexdigest()
+            files.append({
+                "fileName": name, "fileSizeBytes": os.path.getsize(path), "checksum": checksum,
+                "publicFileLocations": [{"name": "FTP Protocol", "value": f"{base_url}{PRIDE_FILES_PATH}/{acc}/{name}"}],
+            })
+        return files
+
+    # --- GEO suppl/ ---
+
+    def suppl_files(self, gse):
+        """File names in a series' suppl/ folder: a matrix, an xlsx or a _RAW.tar, plus non-count files."""
+        k = int(gse[4:])
+        if k % 4 == 3:
+            names = [f"{gse}_RAW.tar"]
+        elif k % 4 == 2:
+            names = [f"{gse}_miRNA_counts.xlsx"]
+        else:
+            names = [f"{gse}_counts.txt.gz"]
+        names.append(f"{gse}_filelist.txt")
+        if k % 3 == 0:
+            names.append(f"{gse}_raw_reads.fastq.gz")
+        return names
+
+    def data_file(self, rel_path):
+        """Path of a served file, generated on first use (None if it does not exist)."""
+        parts = rel_path.strip("/").split("/")
+        name = parts[-1]
+        if rel_path.startswith(PRIDE_FILES_PATH + "/"):
+            acc = parts[-2]
+            if acc not in self.projects:
+                return None
+        elif rel_path.startswith(GEO_PATH + "/"):
+            acc = parts[-3] if len(parts) >= 3 else ""
+            if acc not in self.series or name not in self.suppl_files(acc):
+                return None
+        else:
+            return None
+        path = os.path.join(self.data_dir, *parts)
+        with self.file_locks[path]:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = os.path.join(os.path.dirname(path), ".tmp-" + name)  # Keeps the extension (Excel writer)
+                self._generate(tmp, acc, name)
+                os.replace(tmp, path)
+        return path
+
+    def _generate(self, path, acc, name):
+        seed = self.seed * 100000 + int(acc[4:])
+        if name == "proteinGroups.txt":
+            make_protein_groups(path, self.features, self.samples, seed)
+        elif name.endswith("_RAW.tar"):
+            make_raw_archive(path, self.features, self.samples, seed)
+        elif name.endswith(".xlsx"):
+            make_count_matrix(path, self.features, self.samples, seed, "xlsx")
+        elif name.endswith("_counts.txt.gz"):
+            make_count_matrix(path, self.features, self.samples, seed, "csv.gz")
+        else:
+            with open(path, "wb") as fh:
+                fh.write(f"{acc} {name}\n".encode() * 64)
+
+    def suppl_listing(self, gse):
+        """Apache-style directory index of a series' suppl/ folder."""
+        if gse not in self.series:
+            return None
+        rows = []
+        for name in self.suppl_files(gse):
+            size = os.path.getsize(self.data_file(f"{GEO_PATH}/{gse[:-3]}nnn/{gse}/suppl/{name}"))
+            rows.append(f'<a href="{name}">{name}</a>{" " * max(1, 50 - len(name))}2023-11-14 22:13  {size}')
+        index = f"{GEO_PATH}/{gse[:-3]}nnn/{gse}/suppl/"
+        return (f"<html><head><title>Index of {index}</title></head><body><h1>Index of {index}</h1>"
+                f'<pre>      <a href="?C=N;O=D">Name</a>  <a href="?C=M;O=A">Last modified</a>  <a href="?C=S;O=A">Size</a>\n'
+                f'<hr><a href="{GEO_PATH}/{gse[:-3]}nnn/{gse}/">Parent Directory</a>\n' + "\n".join(rows) +
+                "\n<hr></pre></body></html>")
+
+    # --- E-utilities ---
+
+    def esearch(self, params):
+        db, term = params.get("db", ""), params.get("term", "")
+        retmax = int(params.get("retmax", 20))
+        if db == "pubmed":
+            pmid = self.pmid_by_title.get(_words(re.sub(r"\[Title\]$", "", term)))
+            ids = [pmid] if pmid else []
+        elif "gse_gsm[Filter]" in term:
+            ids = [uid for gse in re.findall(r"(GSE\d+)\[Accession\]", term) for uid in self.series_samples.get(gse, [])]
+        else:
+            ids = [doc["uid"] for doc in self.series.values()]
+        start = int(params.get("retstart", 0))
+        page = ids[start:start + retmax]
+        result = {"count": str(len(ids)), "retmax": str(len(page)), "retstart": str(start), "idlist": page}
+        if params.get("usehistory") == "y":
+            webenv = hashlib.sha1(term.encode()).hexdigest()[:24]
+            with self.lock:
+                self.histories[webenv] = ids
+            result.update(webenv=webenv, querykey="1")
+        return {"esearchresult": result}
+
+    def esummary(self, params):
+        if params.get("WebEnv"):
+            with self.lock:
+                ids = self.histories.get(params["WebEnv"])
+            if ids is None:
+                return {"error": "Invalid WebEnv"}
+            start = int(params.get("retstart", 0))
+            ids = ids[start:start + int(params.get("retmax", 20))]
+        else:
+            ids = [i for i in params.get("id", "").split(",") if i]
+        found = [i for i in ids if i in self.docsums]
+        return {"result": {"uids": found, **{i: self.docsums[i] for i in found}}}
+
+    def efetch(self, params):
+        articles = []
+        for pmid in params.get("id", "").split(","):
+            if pmid in self.articles:
+                title, abstract = self.articles[pmid]
+                articles.append(f"<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+                                f"<ArticleTitle>{escape(title)}</ArticleTitle><Abstract>"
+                                f"<AbstractText>{escape(abstract)}</AbstractText></Abstract>"
+                                f"</Article></MedlineCitation></PubmedArticle>")
+        return '<?xml version="1.0" ?>\n<PubmedArticleSet>' + "".join(articles) + "</PubmedArticleSet>"
+
+class Faults:
+    """Latency, random errors/429s and a per-client request-rate limit."""
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, rate_limit=0.0, retry_after=1, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.recent = collections.defaultdict(collections.deque)  # client -> request times in the last second
+        self.lock = threading.Lock()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self.lock:
+                wait = self.rng.gauss(self.latency, self.jitter) if self.jitter else self.latency
+            time.sleep(max(0.0, wait))
+
+    def verdict(self, client):
+        """None to serve the request, else (status, extra headers)."""
+        now = time.monotonic()
+        with self.lock:
+            if self.rate_limit:
+                recent = self.recent[client]
+                while recent and now - recent[0] >= 1.0:
+                    recent.popleft()
+                if len(recent) >= self.rate_limit:
+                    return 429, {"Retry-After": str(self.retry_after)}
+                recent.append(now)
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return 429, {"Retry-After": str(self.retry_after)}
+        if roll < self.throttle_rate + self.error_rate:
+            return self.rng.choice([500, 502, 503]), {}
+        return None
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+    world = None
+    faults = Faults()
+    replay = None     # sqlite3 connection to an http_cache database
+    replay_lock = threading.Lock()
+    stats = collections.Counter()
+    stats_lock = threading.Lock()
+    verbose = False
+
+    def log_message(self, fmt, *args):
+        if self.verbose:
+            super().log_message(fmt, *args)
+
+    def _route(self):
+        path = urlparse(self.path).path
+        if path.startswith(EUTILS_PATH + "/"):
+            return path.rsplit("/", 1)[-1]
+        if path.startswith(PRIDE_PATH + "/"):
+            return "pride search" if "/search/" in path else "pride files" if path.endswith("/files") else "pride project"
+        if path.endswith("/suppl/"):
+            return "geo listing"
+        return "file"
+
+    def _count(self, status):
+        with self.stats_lock:
+            self.stats[f"{self.command} {self._route()} {status}"] += 1
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        self._count(status)
+
+    def _json(self, data, status=200):
+        if data is None:
+            self._send(404, json.dumps({"error": "Not found"}))
+        else:
+            self._send(status, json.dumps(data))
+
+    def _params(self):
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        if self.command == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            params.update(parse_qsl(self.rfile.read(length).decode("utf-8"), keep_blank_values=True))
+        return url.path, params
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_HEAD(self):
+        self._handle()
+
+    def _handle(self):
+        path, params = self._params()
+        if path == STATS_PATH:
+            with self.stats_lock:
+                stats = dict(self.stats)
+            return self._json(stats)  # _send() takes stats_lock again to count this request
+        self.faults.delay()
+        verdict = self.faults.verdict(self.client_address[0])
+        if verdict is not None:
+            status, headers = verdict
+            return self._send(status, json.dumps({"error": "Injected fault"}), headers=headers)
+        if self.command == "GET" and self.replay is not None and self._replay(path, params):
+            return
+        base_url = f"http://{self.headers.get('Host', f'127.0.0.1:{self.server.server_port}')}"
+
+        if path.startswith(PRIDE_PATH + "/"):
+            rest = path[len(PRIDE_PATH):].strip("/").split("/")
+            if rest == ["search", "projects"]:
+                return self._json(self.world.search_projects(params.get("keyword", ""), int(params.get("page", 0)),
+                                                             int(params.get("pageSize", 100))))
+            if len(rest) == 3 and rest[0] == "projects" and rest[2] == "files":
+                return self._json(self.world.project_files(rest[1], base_url))
+            if len(rest) == 2 and rest[0] == "projects":
+                return self._json(self.world.project(rest[1]))
+        elif path.startswith(EUTILS_PATH + "/"):
+            tool = path.rsplit("/", 1)[-1]
+            if tool == "esearch.fcgi":
+                return self._json(self.world.esearch(params))
+            if tool == "esummary.fcgi":
+                return self._json(self.world.esummary(params))
+            if tool == "efetch.fcgi":
+                return self._send(200, self.world.efetch(params), "text/xml")
+        elif path.startswith(GEO_PATH + "/") and path.endswith("/suppl/"):
+            listing = self.world.suppl_listing(path.rstrip("/").split("/")[-2])
+            if listing is not None:
+                return self._send(200, listing, "text/html")
+        else:
+            file_path = self.world.data_file(path)
+            if file_path is not None:
+                return self._file(file_path)
+        self._send(404, json.dumps({"error": f"No route for {path}"}))
+
+    def _file(self, file_path):
+        """Serve a file with HEAD validators and single-range Range support (If-Range honoured)."""
+        size = os.path.getsize(file_path)
+        headers = {"Accept-Ranges": "bytes", "Last-Modified": LAST_MODIFIED,
+                   "ETag": f'"{size:x}-{int(os.path.getmtime(file_path)):x}"'}
+        start, end, status = 0, size - 1, 200
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and if_range is not None and if_range not in (headers["ETag"], LAST_MODIFIED):
+            match = None  # Changed since the client's copy: send the whole file
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                return self._send(416, b"", "application/octet-stream", {"Content-Range": f"bytes */{size}"})
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        with open(file_path, "rb") as fh:
+            fh.seek(start)
+            body = fh.read(end - start + 1)
+        self._send(status, body, "application/octet-stream", headers)
+
+    def _replay(self, path, params):
+        """Serve a response recorded in the http_cache database, if there is one for this request."""
+        for name, real in SERVICES.items():
+            prefix = urlparse(real).path
+            if path.startswith(prefix + "/"):
+                key = cache_key("GET", real + path[len(prefix):], params)
+                with self.replay_lock:
+                    row = self.replay.execute("SELECT status, headers, body FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return False
+                status, headers, body = row
+                self._send(status, body, CaseInsensitiveDict(json.loads(headers)).get("Content-Type", "application/json"))
+                return True
+        return False
+
+def start_server(world, faults=None, port=DEFAULT_PORT, host="127.0.0.1", replay=None, verbose=False):
+    """Start the stand-in on a background thread. Returns the server (server.shutdown() stops it)."""
+    handler = type("MockHandler", (Handler,), {
+        "world": world, "faults": faults or Faults(), "verbose": verbose, "stats": collections.Counter(),
+        "replay": sqlite3.connect(f"file:{replay}?mode=ro", uri=True, check_same_thread=False) if replay else None,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for PRIDE, GEO (E-utilities and suppl/ files) and PubMed.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--projects", type=int, default=40, help="Synthetic PRIDE projects")
+    parser.add_argument("--series", type=int, default=30, help="Synthetic GEO series")
+    parser.add_argument("--samples", type=int, default=12, help="Samples per study")
+    parser.add_argument("--features", type=int, default=800, help="Rows per generated data file")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Where generated files are written and reused")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean added delay per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Std. dev. of the delay (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 500/502/503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered 429")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests/s per client before 429s (0 = unlimited)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 429")
+    parser.add_argument("--replay", metavar="SQLITE", help="Serve GETs recorded in this http_cache database first")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    world = World(args.projects, args.series, args.samples, args.features, args.seed, args.data_dir)
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.rate_limit, args.retry_after, args.seed)
+    server = start_server(world, faults, args.port, args.host, args.replay, args.verbose)
+    print(f"Serving {len(world.projects)} PRIDE projects, {len(world.series)} GEO series on http://{args.host}:{args.port}")
+    print(f"  export EVDX_BASE_URL=http://{args.host}:{args.port}  (and a separate EVDX_HTTP_CACHE)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("\nRequests served:")
+        for key, count in sorted(server.RequestHandlerClass.stats.items()):
+            print(f"  {key}: {count}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+from concurrent.futures import ProcessPoolExecutor
+import instrument
+
+def _run_study(func, args):
+    """func(*args) with the job's first element (the accession) tagged in the event log."""
+    with instrument.accession_scope(args[0]):
+        return func(*args)
+
+def map_studies(func, jobs, workers=1):
+    """
+    Run func(*args) for every args tuple in jobs and return the results in
+    job order, whatever order the workers finish in. workers <= 1 runs serially
+    in this process, which is also what a single job does. The first element
+    of each args tuple is the study accession.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return [_run_study(func, args) for args in jobs]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        futures = [pool.submit(_run_study, func, args) for args in jobs]
+        return [f.result() for f in futures]
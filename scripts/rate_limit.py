@@ -0,0 +1,231 @@
+import os
+import time
+import asyncio
+import atexit
+import threading
+import collections
+import requests
+import instrument
+import http_client
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from endpoints import SERVICES, service_url
+
+# Requests/s per service (NCBI allows 3, or 10 with an API key). Hosts that
+# are not one of the endpoints get DEFAULT_HOST_RATE. Override per run with
+# EVDX_RATE_LIMITS="EUTILS=5,PRIDE_API=20,ftp.pride.ebi.ac.uk=2,default=4".
+NCBI_API_KEY = os.environ.get("NCBI_API_KEY", "")
+DEFAULT_RATES = {
+    "PRIDE_API": 10,
+    "EUTILS": 10 if NCBI_API_KEY else 3,
+    "GEO_FILES": 10,
+}
+DEFAULT_HOST_RATE = 5
+
+# Retries and AIMD
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0          # Seconds; doubles on every retry without Retry-After
+MAX_RETRY_AFTER = 300       # Longer server-requested pauses drop the call instead
+THROTTLE_STATUSES = {429, 503}          # Slow the whole host down
+RETRY_STATUSES = {500, 502, 504}        # Retry this call only
+DECREASE_FACTOR = 0.5       # Rate multiplier on every throttling response
+INCREASE_STEP = 0.05        # Fraction of the configured rate regained per success
+MIN_RATE_FRACTION = 0.05    # Never slow below this fraction of the configured rate
+
+def _configured_rates():
+    rates = dict(DEFAULT_RATES)
+    for item in os.environ.get("EVDX_RATE_LIMITS", "").split(","):
+        key, sep, value = item.partition("=")
+        if sep:
+            rates[key.strip()] = float(value)
+    return rates
+
+RATES = _configured_rates()
+BASES = {name: service_url(name) for name in SERVICES}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket for one service. The refill rate is adaptive:
+    halved on 429/503, nudged back towards the configured rate on success.
+    """
+    def __init__(self, name, rate):
+        self.name = name
+        self.ceiling = float(rate)
+        self.rate = float(rate)
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def _take(self, waited):
+        """Take a token and return None, or the seconds to wait before trying again."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                self.stats["requests"] += 1
+                self.stats["wait_s"] += waited
+                return None
+            return max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+
+    def acquire(self):
+        """Block until a request may go out (bursts up to one second's worth)."""
+        waited = 0.0
+        while (delay := self._take(waited)) is not None:
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self):
+        """acquire() for coroutines: waits without blocking the event loop."""
+        waited = 0.0
+        while (delay := self._take(waited)) is not None:
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def throttled(self, pause):
+        """Multiplicative decrease, and hold every caller back for `pause` seconds."""
+        with self.lock:
+            self.rate = max(self.ceiling * MIN_RATE_FRACTION, self.rate * DECREASE_FACTOR)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            self.stats["throttled"] += 1
+
+    def succeeded(self):
+        """Additive increase back towards the configured rate."""
+        with self.lock:
+            self.rate = min(self.ceiling, self.rate + self.ceiling * INCREASE_STEP)
+
+    def count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+
+_buckets = {}
+_buckets_guard = threading.Lock()
+
+def bucket_key(url):
+    """Service name when the URL lives under one of the endpoints, else its host."""
+    for name, base in BASES.items():
+        if url.startswith(base + "/") or url == base:
+            return name
+    return urlparse(url).netloc
+
+def bucket_for(url):
+    key = bucket_key(url)
+    with _buckets_guard:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(key, RATES.get(key, RATES.get("default", DEFAULT_HOST_RATE)))
+        return _buckets[key]
+
+def retry_after(headers):
+    """Seconds requested by a Retry-After header (delta or HTTP date), or None."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _retry_plan(bucket, method, url, attempt, retries, status, headers=None):
+    """
+    Bookkeeping after a failed attempt. Returns the seconds this caller should
+    sleep before retrying (0 when the bucket pause covers it), or None when
+    the call is dropped.
+    """
+    backoff = BACKOFF_BASE * (2 ** attempt)
+    pause = retry_after(headers) if headers is not None else None
+    if attempt == retries or (pause or 0) > MAX_RETRY_AFTER:
+        bucket.count("dropped")
+        instrument.record("retry", method=method, url=url, attempt=attempt, status=status, dropped=True)
+        return None
+    bucket.count("retried")
+    instrument.record("retry", method=method, url=url, attempt=attempt, status=status, pause_s=pause)
+    if status in THROTTLE_STATUSES:
+        bucket.throttled(pause if pause is not None else backoff)
+        return 0.0
+    return pause if pause is not None else backoff
+
+def request(method, url, retries=MAX_RETRIES, **kwargs):
+    """
+    Send a request through the pooled session (http_client) behind the
+    service's token bucket. 429/503 slow the bucket down and pause it for
+    Retry-After (or an exponential backoff); 500/502/504 and connection
+    errors retry this call after a backoff. Once retries run out the last
+    response is returned (or the error raised).
+    """
+    bucket = bucket_for(url)
+    session = http_client.session()
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            wait = _retry_plan(bucket, method, url, attempt, retries, type(e).__name__)
+            if wait is None:
+                raise
+        else:
+            if response.status_code not in THROTTLE_STATUSES and response.status_code not in RETRY_STATUSES:
+                bucket.succeeded()
+                return response
+            wait = _retry_plan(bucket, method, url, attempt, retries, response.status_code, response.headers)
+            if wait is None:
+                return response
+            response.close()
+        time.sleep(wait)
+
+async def arequest(client, method, url, retries=MAX_RETRIES, **kwargs):
+    """request() for an httpx.AsyncClient (http_client.async_client())."""
+    bucket = bucket_for(url)
+    for attempt in range(retries + 1):
+        await bucket.acquire_async()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except http_client.httpx.TransportError as e:
+            wait = _retry_plan(bucket, method, url, attempt, retries, type(e).__name__)
+            if wait is None:
+                raise
+        else:
+            if response.status_code not in THROTTLE_STATUSES and response.status_code not in RETRY_STATUSES:
+                bucket.succeeded()
+                return response
+            wait = _retry_plan(bucket, method, url, attempt, retries, response.status_code, response.headers)
+            if wait is None:
+                return response
+            await response.aclose()
+        await asyncio.sleep(wait)
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
+
+def summary():
+    """One line per service that was called: requests, throttles, retries, drops, waiting."""
+    lines = []
+    for key, bucket in sorted(_buckets.items()):
+        s = bucket.stats
+        if not s["requests"]:
+            continue
+        lines.append(
+            f"  {key}: {s['requests']} requests at {bucket.rate:.1f}/{bucket.ceiling:g} req/s, "
+            f"{s['throttled']} throttled, {s['retried']} retried, {s['dropped']} dropped, "
+            f"{s['wait_s']:.1f}s waiting"
+        )
+    return lines
+
+@atexit.register
+def _report():
+    lines = summary()
+    if lines:
+        print("Rate limits:", *lines, sep="\n")
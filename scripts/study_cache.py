@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+# Configuration
+CACHE_ROOT = "raw_data/study_cache"
+HASH_CHUNK = 1024 * 1024
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_fingerprint(path, memo=None):
+    """
+    SHA-256 of an input file. memo maps path -> [size, mtime_ns, sha256] from
+    the previous run, so unchanged files are not re-hashed.
+    """
+    st = os.stat(path)
+    if memo is not None:
+        prev = memo.get(path)
+        if prev and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+            return prev[2]
+    digest = _sha256(path)
+    if memo is not None:
+        memo[path] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+def code_fingerprint(*paths):
+    """Hash of a normalizer script (plus the rule files and helper modules it uses), so any change invalidates its cache."""
+    if len(paths) == 1:
+        return _sha256(paths[0])[:16]
+    combined = "".join(_sha256(p) for p in paths)
+    return hashlib.sha256(combined.encode("ascii")).hexdigest()[:16]
+
+class StudyCache:
+    """
+    Per-accession normalized artifacts: {acc}.parquet (the study matrix) and
+    {acc}.json (cache key, input hashes and the metadata fragment).
+    """
+    def __init__(self, name):
+        self.directory = os.path.join(CACHE_ROOT, name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.memo_path = os.path.join(self.directory, "_file_hashes.json")
+        self.memo = {}
+        if os.path.exists(self.memo_path):
+            with open(self.memo_path) as fh:
+                self.memo = json.load(fh)
+
+    def key(self, input_paths, params):
+        """Cache key from the input file hashes plus the normalization parameters."""
+        payload = {
+            "inputs": {os.path.basename(p): file_fingerprint(p, self.memo) for p in input_paths},
+            "params": params,
+        }
+        raw = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _paths(self, accession):
+        base = os.path.join(self.directory, accession)
+        return base + ".parquet", base + ".json"
+
+    def load(self, accession, key):
+        """Return (df, metadata_rows) on a hit, (None, None) for a cached empty result, or False on a miss."""
+        matrix_path, meta_path = self._paths(accession)
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as fh:
+            entry = json.load(fh)
+        if entry.get("key") != key:
+            return False
+        if entry.get("empty"):
+            return None, None
+        if not os.path.exists(matrix_path):
+            return False
+        return pd.read_parquet(matrix_path), entry["metadata"]
+
+    def save(self, accession, key, df, metadata_rows):
+        matrix_path, meta_path = self._paths(accession)
+        entry = {"key": key, "empty": df is None or df.empty}
+        if not entry["empty"]:
+            tmp = matrix_path + ".tmp"
+            df.to_parquet(tmp)
+            os.replace(tmp, matrix_path)
+            entry["metadata"] = json.loads(pd.DataFrame(metadata_rows).to_json(orient="records"))
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(entry, fh)
+        os.replace(tmp, meta_path)
+
+    def flush(self):
+        """Persist the file-hash memo for the next run."""
+        with open(self.memo_path, "w") as fh:
+            json.dump(self.memo, fh)
@@ -0,0 +1,106 @@
+import io
+import gzip
+import tarfile
+import numpy as np
+import pandas as pd
+
+# Deterministic synthetic study data for the benchmarks and the local service
+# stand-in (mock_services.py). The same seed always yields the same bytes.
+
+# Sample name styles (and weights) so label inference sees controls, cases and pools
+SAMPLE_KINDS = ["HC", "Control", "Patient", "Case", "Pool"]
+SAMPLE_WEIGHTS = [0.25, 0.1, 0.4, 0.2, 0.05]
+
+def _sample_names(rng, n, prefix=""):
+    kinds = rng.choice(SAMPLE_KINDS, size=n, p=SAMPLE_WEIGHTS)
+    return [f"{prefix}{kind}_{j + 1}" for j, kind in enumerate(kinds)]
+
+def _with_zeros(rng, values, fraction):
+    values[rng.random(values.shape) < fraction] = 0
+    return values
+
+def make_protein_groups(path, features, samples, seed):
+    """
+    proteinGroups.txt-shaped table: IDs with isoforms sharing a gene name,
+    rows without a gene name, contaminant/reverse/site flags, unused columns
+    and both "Intensity" and "LFQ intensity" blocks (~30% zeros).
+    """
+    rng = np.random.default_rng(seed)
+    genes = np.array([f"GENE{i}" for i in range(features)], dtype=object)
+    isoform = rng.random(features) < 0.1
+    genes[isoform] = genes[rng.integers(0, features, isoform.sum())]
+    genes[rng.random(features) < 0.03] = ""
+    proteins = [f"P{seed % 100:02d}{i:05d};P{seed % 100:02d}{i:05d}-2" for i in range(features)]
+
+    def flag(p):
+        return np.where(rng.random(features) < p, "+", "")
+
+    names = _sample_names(rng, samples)
+    lfq = _with_zeros(rng, rng.lognormal(22, 2, (features, samples)), 0.3)
+    raw = lfq * rng.uniform(0.8, 1.2, lfq.shape)
+    frame = pd.concat([
+        pd.DataFrame({
+            "Protein IDs": proteins,
+            "Majority protein IDs": proteins,
+            "Gene names": genes,
+            "Peptides": rng.integers(1, 60, features),
+            "Sequence coverage [%]": rng.uniform(1, 90, features).round(1),
+            "Intensity": raw.sum(axis=1),
+        }),
+        pd.DataFrame(raw, columns=[f"Intensity {n}" for n in names]),
+        pd.DataFrame(lfq, columns=[f"LFQ intensity {n}" for n in names]),
+        pd.DataFrame({"Only identified by site": flag(0.01), "Reverse": flag(0.01),
+                      "Potential contaminant": flag(0.03)}),
+    ], axis=1)
+    frame.to_csv(path, sep="\t", index=False, float_format="%.1f")
+
+def _mirna_ids(rng, features):
+    """Canonical, lower-case, isomiR ("seq|name|...") and duplicate IDs, plus a few GO-term rows."""
+    names = [f"hsa-miR-{i // 2 + 1}-{'5p' if i % 2 == 0 else '3p'}" for i in range(features)]
+    ids = np.array(names, dtype=object)
+    bases = "ACGT"
+    for i in np.flatnonzero(rng.random(features) < 0.15):
+        seq = "".join(rng.choice(list(bases), 22))
+        ids[i] = f"{seq}|{names[i]}|{int(rng.integers(-2, 3)):+d}"
+    lower = rng.random(features) < 0.05
+    ids[lower] = [s.lower() for s in ids[lower]]
+    dup = rng.random(features) < 0.05
+    ids[dup] = ids[rng.integers(0, features, dup.sum())]
+    ids[:3] = ["GO:0005576", "GO:0070062", "KEGG:hsa05200"][:min(3, features)]
+    return ids
+
+def make_count_matrix(path, features, samples, seed, fmt):
+    """
+    GEO-style count matrix (negative binomial counts, many zeros) as a tab
+    separated .tsv, a gzipped CSV with '#' preamble lines, or an .xlsx.
+    """
+    rng = np.random.default_rng(seed)
+    names = _sample_names(rng, samples, prefix=f"GSM{seed:05d}")
+    counts = _with_zeros(rng, rng.negative_binomial(2, 0.01, (features, samples)), 0.35)
+    frame = pd.DataFrame(counts, columns=names)
+    frame.insert(0, "miRNA", _mirna_ids(rng, features))
+    if fmt == "xlsx":
+        frame.to_excel(path, index=False)
+    elif fmt == "csv.gz":
+        body = frame.to_csv(index=False)
+        with open(path, "wb") as fh, gzip.GzipFile(fileobj=fh, mode="wb", mtime=0) as gz:
+            gz.write(f"# Synthetic counts, seed {seed}\n# Generated by benchmark.py\n{body}".encode("utf-8"))
+    else:
+        frame.to_csv(path, sep="\t", index=False)
+
+
+def make_raw_archive(path, features, samples, seed):
+    """
+    GEO-style GSE_RAW.tar: one gzipped two-column table per sample
+    ("GSM..._x.txt.gz"), the layout 08/geo_archive.py assemble from.
+    """
+    rng = np.random.default_rng(seed)
+    names = _sample_names(rng, samples, prefix=f"GSM{seed:05d}")
+    ids = _mirna_ids(rng, features)
+    with tarfile.open(path, "w") as tar:
+        for name, counts in zip(names, _with_zeros(rng, rng.negative_binomial(2, 0.01, (samples, features)), 0.35)):
+            table = pd.DataFrame({"miRNA": ids, "count": counts}).to_csv(sep="\t", index=False)
+            data = gzip.compress(table.encode("utf-8"), mtime=0)
+            info = tarfile.TarInfo(f"{name}.txt.gz")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
@@ -0,0 +1,156 @@
+import os
+import io
+import gzip
+import numpy as np
+import pandas as pd
+import instrument
+
+# Configuration
+SNIFF_BYTES = 64 * 1024           # Decompressed bytes inspected per file
+PYARROW_MIN_BYTES = 32 * 1024**2  # Use the multithreaded pyarrow engine above this size
+DELIMITERS = ["\t", ",", ";"]     # In preference order; '|' is never a delimiter (isomiR IDs)
+PREAMBLE = ("#", "!")             # Comment / GEO "!Series_..." lines before the header
+MIRNA_LIKE = r"(?i)(?:mir|let)[-_]?\d|mimat\d"  # miRNA names and miRBase mature accessions
+MIN_MIRNA_FRACTION = 0.2          # Share of miRNA-like row IDs for a table to count as miRNA data
+
+GZIP_MAGIC = b"\x1f\x8b"
+XLSX_MAGIC = b"PK\x03\x04"
+XLS_MAGIC = b"\xd0\xcf\x11\xe0"
+
+_sniffed = {} # (path, size, mtime_ns) -> sniff result
+
+def _detect_delimiter(lines):
+    """
+    First delimiter that splits every sampled line into the same (>1) number
+    of fields; None means whitespace-separated (or a single column).
+    """
+    for delim in DELIMITERS:
+        counts = {line.count(delim) for line in lines}
+        if len(counts) == 1 and counts != {0}:
+            return delim
+    # Ragged tables (e.g. a header without the row-name column) still count
+    for delim in DELIMITERS:
+        if all(line.count(delim) for line in lines):
+            return delim
+    return None
+
+def sniff_table(path):
+    """
+    Inspect the first SNIFF_BYTES of a table once: compression, Excel
+    signature, delimiter and header row. Results are cached per file
+    (path, size and mtime), so repeated calls cost nothing.
+    Returns a dict: format ("excel"/"text"), excel_engine, compression,
+    sep, header_row, n_columns, size, head_lines (the sampled lines).
+    """
+    st = os.stat(path)
+    cache_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if cache_key in _sniffed:
+        return _sniffed[cache_key]
+
+    with open(path, "rb") as fh:
+        magic = fh.read(4)
+    info = {"size": st.st_size, "format": "text", "excel_engine": None, "compression": None,
+            "sep": "\t", "header_row": 0, "n_columns": 0, "head_lines": []}
+
+    if magic.startswith(XLSX_MAGIC) or magic.startswith(XLS_MAGIC):
+        info["format"] = "excel"
+        info["excel_engine"] = "openpyxl" if magic.startswith(XLSX_MAGIC) else "xlrd"
+        _sniffed[cache_key] = info
+        return info
+
+    if magic.startswith(GZIP_MAGIC):
+        info["compression"] = "gzip"
+        with gzip.open(path, "rb") as fh:
+            head = fh.read(SNIFF_BYTES)
+    else:
+        with open(path, "rb") as fh:
+            head = fh.read(SNIFF_BYTES)
+
+    info.update(sniff_bytes(head, complete=len(head) < SNIFF_BYTES))
+    _sniffed[cache_key] = info
+    return info
+
+def sniff_bytes(head, complete=False):
+    """
+    Delimiter, header row and sampled lines from the (decompressed) first
+    bytes of a table. complete=False drops the trailing partial line.
+    """
+    lines = head.decode("utf-8", errors="replace").splitlines()
+    if not complete and len(lines) > 1:
+        lines = lines[:-1] # Drop the partial last line
+
+    header_row = 0
+    while header_row < len(lines) and (not lines[header_row].strip() or lines[header_row].startswith(PREAMBLE)):
+        header_row += 1
+    table_lines = [l for l in lines[header_row:] if l.strip()]
+
+    sep = _detect_delimiter(table_lines[:50]) if table_lines else "\t"
+    info = {"sep": sep if sep is not None else r"\s+", "header_row": header_row,
+            "head_lines": table_lines, "n_columns": 0}
+    if table_lines:
+        info["n_columns"] = len(table_lines[0].split(sep)) if sep is not None else len(table_lines[0].split())
+    return info
+
+def head_frame(info):
+    """DataFrame of the sampled lines only (no file access)."""
+    if not info["head_lines"]:
+        return pd.DataFrame()
+    return pd.read_csv(io.StringIO("\n".join(info["head_lines"])), sep=info["sep"], engine="c")
+
+def mirna_profile(frame):
+    """(numeric column count, share of miRNA-like row IDs) of a table sample."""
+    numeric = frame.select_dtypes(include=[np.number])
+    if frame.empty:
+        return 0, 0.0
+    # Row IDs: first text column, else the index (ragged headers)
+    text_cols = frame.select_dtypes(exclude=[np.number]).columns
+    ids = frame[text_cols[0]] if len(text_cols) else frame.index.to_series()
+    return numeric.shape[1], float(ids.astype(str).str.contains(MIRNA_LIKE).mean())
+
+def read_table(path, info=None, nrows=None):
+    """
+    Parse a table exactly once with the options found by sniff_table():
+    read_excel for Excel signatures, otherwise read_csv with the sniffed
+    delimiter and header row on the C engine, or pyarrow for large
+    single-character-delimited files.
+    """
+    info = info or sniff_table(path)
+    with instrument.span("parse", path=path, bytes=info["size"], nrows=nrows) as event:
+        if info["format"] == "excel":
+            event["engine"] = info["excel_engine"]
+            return instrument.frame_shape(event, pd.read_excel(path, engine=info["excel_engine"], nrows=nrows))
+
+        kwargs = {"sep": info["sep"], "skiprows": info["header_row"], "compression": info["compression"]}
+        use_pyarrow = nrows is None and len(info["sep"]) == 1 and info["size"] >= PYARROW_MIN_BYTES
+        if use_pyarrow:
+            try:
+                event["engine"] = "pyarrow"
+                return instrument.frame_shape(event, pd.read_csv(path, engine="pyarrow", **kwargs))
+            except Exception:
+                pass # Fall back to the C engine (e.g. ragged rows pyarrow rejects)
+        event["engine"] = "c"
+        return instrument.frame_shape(event, pd.read_csv(path, engine="c", nrows=nrows, **kwargs))
+
+def sample_stem(name):
+    """Sample name from a per-sample file name: "GSM123456_serum1.txt.gz" -> "GSM123456"."""
+    return os.path.basename(name).split('.')[0].split('_')[0]
+
+def sample_columns(frame, stem):
+    """
+    Numeric columns of a per-sample table, indexed by its first text column
+    and named by the sample stem (stem, or stem_column if there are several)
+    so identical names such as "count" stay distinct. Duplicate IDs are summed.
+    """
+    text_cols = frame.select_dtypes(exclude=[np.number]).columns
+    if len(text_cols):
+        frame = frame.set_index(text_cols[0])
+    numeric = frame.select_dtypes(include=[np.number])
+    numeric.columns = [stem] if numeric.shape[1] == 1 else [f"{stem}_{c}" for c in numeric.columns]
+    return numeric.groupby(level=0).sum() if not numeric.index.is_unique else numeric
+
+def join_samples(parts):
+    """Outer-join per-sample columns on their miRNA IDs into one study matrix."""
+    with instrument.span("concat", parts=len(parts)) as event:
+        combined = instrument.frame_shape(event, pd.concat(parts, axis=1, join='outer'))
+    combined.index.name = "miRNA"
+    return combined
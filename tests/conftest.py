@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from mock_services import World, start_server, GEO_PATH
+
+
+@pytest.fixture
+def mock_server(tmp_path):
+    """Local stand-in on a free port; its files live under tmp_path/mock."""
+    server = start_server(World(projects=3, series=4, data_dir=str(tmp_path / "mock")), port=0)
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+
+
+def geo_suppl(server, gse, name):
+    """(URL, served path) of a file in a mock GEO series' suppl/ folder."""
+    rel = f"{GEO_PATH}/{gse[:-3]}nnn/{gse}/suppl/{name}"
+    return server.base_url + rel, os.path.join(server.RequestHandlerClass.world.data_dir, *rel.strip("/").split("/"))
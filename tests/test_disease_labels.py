@@ -0,0 +1,48 @@
+import pytest
+
+from disease_labels import LabelMatcher, get_matcher, infer_disease, classify_samples
+
+
+@pytest.mark.parametrize("text, label", [
+    ("Plasma EVs in Alzheimers patients", "Alzheimer's Disease"),
+    ("ALS_03 serum", "ALS"),
+    ("exosomal signals in plasma", ""),                        # 'als' needs letter boundaries
+    ("breast cancer and ovarian cancer cohorts", "Ovarian Cancer"),  # Ontology order wins, not text order
+    ("ovarian tissue of healthy donors", ""),                  # 'ovarian' needs a cancer context term
+    ("ovarian tumour EVs", "Ovarian Cancer"),
+    ("lung adenocarcinoma", "Lung Cancer"),
+    ("tumour-derived vesicles", "Cancer (Unspecified)"),
+])
+def test_infer_disease(text, label):
+    assert infer_disease(text) == label
+
+
+def test_generic_labels_can_be_switched_off():
+    assert infer_disease("tumour-derived vesicles", include_generic=False) == ""
+
+
+def test_label_series_matches_label():
+    matcher = get_matcher("diseases")
+    texts = ["PD_01", "Parkinson plasma", "breast tumour", "signals", "sepsis and HIV"]
+    assert list(matcher.label_series(texts)) == [matcher.label(t) for t in texts]
+
+
+def test_entry_order_is_priority():
+    matcher = LabelMatcher([
+        {"label": "Specific", "synonyms": ["gastric cancer*"]},
+        {"label": "Generic", "synonyms": ["cancer*"], "generic": True},
+    ])
+    assert matcher.label("cancer of the gastric cancer type") == "Specific"
+    assert [hit[0] for hit in matcher.matches("cancer of the gastric cancer type")] == ["Generic", "Specific"]
+
+
+def test_classify_samples():
+    names = ["Control_01", "HC3", "Patient_2", "Pool_A", "controlled_5", "abnormal_6"]
+    assert classify_samples(names, "ALS", technical=True) == [
+        "Healthy Control", "Healthy Control", "ALS", "Technical Control", "ALS", "ALS"]
+    assert classify_samples(["Patient_2"], "") == ["Case"]
+
+
+def test_study_rules_come_first():
+    assert classify_samples(["HD1", "Pz2", "Control_3"], "ALS", accession="PXD036491") == [
+        "Healthy Control", "ALS", "Healthy Control"]
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+import requests
+
+from conftest import geo_suppl
+from downloader import download_file, _fetch
+
+GSE = "GSE900000"  # Every mock series serves a small {gse}_filelist.txt
+
+
+@pytest.fixture
+def served(mock_server):
+    """(URL, bytes) of a file on the mock server."""
+    url, _ = geo_suppl(mock_server, GSE, f"{GSE}_filelist.txt")
+    path = mock_server.RequestHandlerClass.world.data_file(url[len(mock_server.base_url):])
+    with open(path, "rb") as fh:
+        return url, fh.read()
+
+
+def _etag(url):
+    return requests.head(url, timeout=5).headers["ETag"]
+
+
+def _partial(local_path, data, validator):
+    with open(local_path + ".part", "wb") as fh:
+        fh.write(data)
+    if validator is not None:
+        with open(local_path + ".part.validator", "w") as fh:
+            fh.write(validator)
+
+
+def _statuses(mock_server):
+    return {key.rsplit(" ", 1)[1] for key in mock_server.RequestHandlerClass.stats if key.startswith("GET file")}
+
+
+def test_resume_appends_to_matching_partial(mock_server, served, tmp_path):
+    url, data = served
+    local = str(tmp_path / "file.txt")
+    _partial(local, data[:100], _etag(url))
+    _fetch(url, local)
+    assert open(local, "rb").read() == data
+    assert _statuses(mock_server) == {"206"}
+    assert not os.path.exists(local + ".part.validator")
+
+
+def test_partial_without_validator_is_refetched(mock_server, served, tmp_path):
+    url, data = served
+    local = str(tmp_path / "file.txt")
+    _partial(local, b"x" * 100, None)  # Truncated leftover of unknown origin
+    _fetch(url, local)
+    assert open(local, "rb").read() == data
+    assert _statuses(mock_server) == {"200"}
+
+
+def test_changed_etag_restarts_instead_of_splicing(mock_server, served, tmp_path):
+    url, data = served
+    local = str(tmp_path / "file.txt")
+    _partial(local, b"stale bytes from an older version", '"0-0"')
+    _fetch(url, local)
+    assert open(local, "rb").read() == data
+    assert _statuses(mock_server) == {"200"}
+
+
+def test_416_with_complete_partial_is_promoted(mock_server, served, tmp_path):
+    url, data = served
+    local = str(tmp_path / "file.txt")
+    _partial(local, data, _etag(url))
+    _fetch(url, local)
+    assert open(local, "rb").read() == data
+    assert _statuses(mock_server) == {"416"}
+
+
+def test_416_with_oversized_partial_is_refetched(mock_server, served, tmp_path):
+    url, data = served
+    local = str(tmp_path / "file.txt")
+    _partial(local, data + b"corrupted tail", _etag(url))
+    _fetch(url, local)
+    assert open(local, "rb").read() == data
+    assert _statuses(mock_server) == {"416", "200"}
+
+
+def test_download_file_fails_fast_on_404(mock_server, tmp_path):
+    url = mock_server.base_url + "/geo/series/GSE900nnn/GSE900000/suppl/missing.txt"
+    assert download_file(url, str(tmp_path / "missing.txt")) is False
+    assert not os.path.exists(tmp_path / "missing.txt")
+    assert sum(n for key, n in mock_server.RequestHandlerClass.stats.items() if "404" in key) == 1
@@ -0,0 +1,39 @@
+import io
+import os
+import tarfile
+
+from conftest import geo_suppl
+from geo_archive import archive_is_current, extract_remote_archive
+
+GSE = "GSE900003"  # Series with a _RAW.tar in the mock world
+
+
+def _write_tar(path, members):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tarfile.open(path, "w") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def _range_gets(server):
+    return sum(n for key, n in server.RequestHandlerClass.stats.items() if key.startswith("GET file"))
+
+
+def test_archive_without_counts_is_skipped_until_it_changes(mock_server, tmp_path):
+    url, served = geo_suppl(mock_server, GSE, f"{GSE}_RAW.tar")
+    _write_tar(served, {"GSM1_notes.txt": b"sample notes, no counts\n" * 20})
+    project_dir = tmp_path / GSE
+    project_dir.mkdir()
+
+    assert not archive_is_current(str(project_dir), url)
+    assert extract_remote_archive(url, str(project_dir)) is None
+
+    walked = _range_gets(mock_server)
+    assert archive_is_current(str(project_dir), url)
+    assert _range_gets(mock_server) == walked  # Only a HEAD, no Range hops
+
+    # New upstream content (size, hence ETag, changes) is walked again
+    _write_tar(served, {"GSM1_notes.txt": b"sample notes, no counts\n" * 1000})
+    assert not archive_is_current(str(project_dir), url)
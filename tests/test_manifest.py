@@ -0,0 +1,60 @@
+import hashlib
+
+from manifest import needs_download, record_file, load_manifest, MANIFEST_NAME
+
+URL = "https://example.org/file.txt"
+REMOTE = {"size": 11, "etag": '"abc"', "last_modified": "Tue, 14 Nov 2023 22:13:20 GMT"}
+
+
+def _write(folder, data=b"hello world"):
+    (folder / "file.txt").write_bytes(data)
+
+
+def test_missing_file_needs_download(tmp_path):
+    assert needs_download(str(tmp_path), "file.txt", URL)
+
+
+def test_recorded_file_is_current(tmp_path):
+    _write(tmp_path)
+    record_file(str(tmp_path), "file.txt", URL, REMOTE)
+    assert not needs_download(str(tmp_path), "file.txt", URL, remote=REMOTE)
+
+
+def test_changed_etag_needs_download(tmp_path):
+    _write(tmp_path)
+    record_file(str(tmp_path), "file.txt", URL, REMOTE)
+    assert needs_download(str(tmp_path), "file.txt", URL, remote={**REMOTE, "etag": '"def"'})
+
+
+def test_changed_upstream_size_needs_download(tmp_path):
+    _write(tmp_path)
+    record_file(str(tmp_path), "file.txt", URL)
+    assert needs_download(str(tmp_path), "file.txt", URL, expected_size=12)
+
+
+def test_truncated_local_file_needs_download(tmp_path):
+    _write(tmp_path)
+    record_file(str(tmp_path), "file.txt", URL, REMOTE)
+    _write(tmp_path, b"hello")
+    assert needs_download(str(tmp_path), "file.txt", URL, remote=REMOTE)
+
+
+def test_unrecorded_file_is_verified_and_adopted(tmp_path):
+    _write(tmp_path)
+    md5 = hashlib.md5(b"hello world").hexdigest()
+    assert not needs_download(str(tmp_path), "file.txt", URL, expected_size=11, expected_checksum=md5)
+    assert load_manifest(str(tmp_path))["file.txt"]["upstream_checksum"] == md5
+
+
+def test_unrecorded_file_with_wrong_checksum_needs_download(tmp_path):
+    _write(tmp_path)
+    assert needs_download(str(tmp_path), "file.txt", URL, expected_checksum="0" * 32)
+
+
+def test_last_manifest_line_wins_and_torn_lines_are_ignored(tmp_path):
+    _write(tmp_path)
+    record_file(str(tmp_path), "file.txt", URL, REMOTE)
+    record_file(str(tmp_path), "file.txt", URL, {**REMOTE, "etag": '"new"'})
+    with open(tmp_path / MANIFEST_NAME, "a") as fh:
+        fh.write('{"file_name": "file.txt", "si')
+    assert load_manifest(str(tmp_path))["file.txt"]["etag"] == '"new"'
@@ -0,0 +1,28 @@
+import os
+import sys
+import json
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from mock_services import World, start_server, STATS_PATH, PRIDE_PATH
+
+
+def _get(server, path):
+    url = f"http://127.0.0.1:{server.server_port}{path}"
+    with urllib.request.urlopen(url, timeout=5) as r:
+        return r.status, json.loads(r.read())
+
+
+def test_stats_then_normal_route(tmp_path):
+    server = start_server(World(projects=3, series=2, data_dir=str(tmp_path)), port=0)
+    try:
+        status, _ = _get(server, STATS_PATH)
+        assert status == 200
+        # A second request must not block on the stats lock
+        status, projects = _get(server, f"{PRIDE_PATH}/search/projects?keyword=plasma")
+        assert status == 200 and isinstance(projects, list)
+        status, stats = _get(server, STATS_PATH)
+        assert any("search" in key for key in stats)
+    finally:
+        server.shutdown()
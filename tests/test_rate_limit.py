@@ -0,0 +1,71 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+import rate_limit
+from mock_services import World, Faults, start_server
+from rate_limit import TokenBucket, retry_after, DECREASE_FACTOR, INCREASE_STEP, MIN_RATE_FRACTION
+
+
+def test_throttled_halves_rate_down_to_floor():
+    bucket = TokenBucket("svc", 10)
+    bucket.throttled(0)
+    assert bucket.rate == 10 * DECREASE_FACTOR
+    for _ in range(20):
+        bucket.throttled(0)
+    assert bucket.rate == 10 * MIN_RATE_FRACTION
+    assert bucket.stats["throttled"] == 21
+
+
+def test_succeeded_climbs_back_to_ceiling():
+    bucket = TokenBucket("svc", 10)
+    bucket.throttled(0)
+    bucket.succeeded()
+    assert bucket.rate == pytest.approx(10 * DECREASE_FACTOR + 10 * INCREASE_STEP)
+    for _ in range(100):
+        bucket.succeeded()
+    assert bucket.rate == 10
+
+
+def test_throttled_pause_holds_callers_back():
+    bucket = TokenBucket("svc", 1000)
+    bucket.throttled(0.3)
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.25
+
+
+def test_retry_after_parses_seconds_and_dates():
+    assert retry_after({"Retry-After": "7"}) == 7
+    assert 50 < retry_after({"Retry-After": formatdate(time.time() + 60, usegmt=True)}) <= 60
+    assert retry_after({"Retry-After": "soon"}) is None
+    assert retry_after({}) is None
+
+
+@pytest.fixture
+def throttling_server(tmp_path, monkeypatch):
+    """Mock server answering every request 429 (Retry-After: 0), with a fast bucket."""
+    monkeypatch.setattr(rate_limit, "RATES", {"default": 100})
+    monkeypatch.setattr(rate_limit, "_buckets", {})
+    server = start_server(World(projects=1, series=1, data_dir=str(tmp_path)),
+                          Faults(throttle_rate=1.0, retry_after=0), port=0)
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_request_backs_off_on_429_and_returns_last_response(throttling_server):
+    url = f"{throttling_server}/pride/ws/archive/v2/projects/PXD900000"
+    response = rate_limit.get(url, retries=2)
+    assert response.status_code == 429
+    bucket = rate_limit.bucket_for(url)
+    assert bucket.stats["requests"] == 3
+    assert bucket.stats["throttled"] == 2 and bucket.stats["dropped"] == 1
+    assert bucket.rate == 100 * DECREASE_FACTOR ** 2
+
+
+def test_request_does_not_retry_client_errors(mock_server, monkeypatch):
+    monkeypatch.setattr(rate_limit, "_buckets", {})
+    url = f"{mock_server.base_url}/pride/ws/archive/v2/projects/PXD999999"
+    assert rate_limit.get(url).status_code == 404
+    assert rate_limit.bucket_for(url).stats["requests"] == 1
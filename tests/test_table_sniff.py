@@ -0,0 +1,49 @@
+import gzip
+
+from table_sniff import sniff_bytes, sniff_table, head_frame, mirna_profile, read_table, sample_columns
+
+MIRNA_TABLE = "miRNA\tS1\tS2\nhsa-miR-21-5p\t10\t20\nhsa-let-7a-5p\t3\t4\nMIMAT0000062\t0\t1\nU6\t5\t5\n"
+
+
+def test_geo_preamble_is_skipped():
+    head = ("!Series_title\t\"EV miRNA\"\n# comment\n\n" + MIRNA_TABLE).encode()
+    info = sniff_bytes(head, complete=True)
+    assert info["header_row"] == 3
+    assert info["sep"] == "\t" and info["n_columns"] == 3
+
+
+def test_partial_last_line_is_dropped():
+    info = sniff_bytes(MIRNA_TABLE.encode()[:-3], complete=False)
+    assert info["head_lines"][-1].startswith("MIMAT")
+
+
+def test_delimiter_preference_and_ragged_header():
+    assert sniff_bytes(b"id;a;b\nx;1;2\n", complete=True)["sep"] == ";"
+    # Header without the row-name column still splits on tabs
+    assert sniff_bytes(b"S1\tS2\nmiR-1\t1\t2\nmiR-2\t3\t4\n", complete=True)["sep"] == "\t"
+    # Pipes inside isomiR IDs are not delimiters
+    assert sniff_bytes(b"id count\nmiR-21|0|+1 5\n", complete=True)["sep"] == r"\s+"
+
+
+def test_mirna_profile_scores_header_rows():
+    n_numeric, frac = mirna_profile(head_frame(sniff_bytes(MIRNA_TABLE.encode(), complete=True)))
+    assert n_numeric == 2 and frac == 0.75
+    n_numeric, frac = mirna_profile(head_frame(sniff_bytes(b"gene\tS1\nGAPDH\t1\nACTB\t2\n", complete=True)))
+    assert n_numeric == 1 and frac == 0.0
+    assert mirna_profile(head_frame(sniff_bytes(b"", complete=True))) == (0, 0.0)
+
+
+def test_sniff_table_reads_gzip_and_parses_once(tmp_path):
+    path = tmp_path / "GSM1_counts.txt.gz"
+    path.write_bytes(gzip.compress(("!Sample_id GSM1\n" + MIRNA_TABLE).encode()))
+    info = sniff_table(str(path))
+    assert info["compression"] == "gzip" and info["header_row"] == 1
+    frame = read_table(str(path), info)
+    assert list(frame.columns) == ["miRNA", "S1", "S2"] and len(frame) == 4
+
+
+def test_sample_columns_names_and_sums_duplicates():
+    frame = head_frame(sniff_bytes(b"id\tcount\nmiR-1\t1\nmiR-1\t2\nmiR-2\t5\n", complete=True))
+    part = sample_columns(frame, "GSM1")
+    assert list(part.columns) == ["GSM1"]
+    assert part.loc["miR-1", "GSM1"] == 3